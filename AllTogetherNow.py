@@ -14,17 +14,72 @@ This code gets coordinates from an address and fetches nearby bus stops from the
 
 ##################################################   Libraries   ##################################################
 
-import requests # makes HTTP requests for API use # https://www.w3schools.com/python/module_requests.asp
-from geopy.geocoders import Nominatim # get location details from coordinates # https://geopy.readthedocs.io/en/stable/
-from geopy.distance import geodesic #used in line 175 to calc the distance between the 2 locations to get distance.
+import importlib # the heavy libraries below are imported the first time they are used, not at launch.
 import tkinter as tk # creates GUI
 from tkinter import messagebox, ttk # allows the use of the message box, tkk fixes the dropout map selector.
 #from gmpy2 import RoundUp # instead of importing this, we used "int() to convert the float to an int.
-from tkintermapview import TkinterMapView # used for the map.
-from PIL import Image, ImageTk #pillow. python image Library (PIL) # https://pypi.org/project/pillow/
-#import threading # used in past version to run all parts of a for loop at the same time.
-#import time # used prior, replaced with datetime
-from datetime import datetime,timezone,UTC,timedelta #https://docs.python.org/3/library/datetime.html#datetime.datetime
+
+# requests, geopy, numpy, tkintermapview and pillow take a few hundred ms to import between them, which all
+# used to happen before the window showed up. each one is now a stand-in that imports the real module the
+# first time something on it is used, so the window can come up first.
+class LazyModule:
+    """Stands in for a module and imports it the first time one of its attributes is used."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def _load(self):
+        """Imports the real module now, if it hasn't been already."""
+        if self._module is None:
+            self._module = importlib.import_module(self._name) # the import lock makes this thread safe
+        return self._module
+
+requests = LazyModule("requests") # makes HTTP requests for API use # https://www.w3schools.com/python/module_requests.asp
+requests_adapters = LazyModule("requests.adapters") # connection pool sizing for the shared session.
+geopy_geocoders = LazyModule("geopy.geocoders") # get location details from coordinates # https://geopy.readthedocs.io/en/stable/
+geopy_distance = LazyModule("geopy.distance") # geodesic, to calc the distance between the 2 locations.
+np = LazyModule("numpy") # batch distance math over arrays of points. optional, see rank_stops_for_trip.
+tkintermapview = LazyModule("tkintermapview") # used for the map.
+PIL_Image = LazyModule("PIL.Image") #pillow. python image Library (PIL) # https://pypi.org/project/pillow/
+PIL_ImageTk = LazyModule("PIL.ImageTk")
+import io # turns cached tile bytes back into images.
+import threading # used to cancel lookups that a newer search has replaced.
+import queue # hands results from the lookup worker threads back to the Tk thread.
+from concurrent.futures import ThreadPoolExecutor # runs the API calls off the Tk event loop.
+import time # monotonic/wall clock for cache expiry.
+import sqlite3 # on-disk cache storage, ships with python.
+import re # normalizes search text for cache keys.
+import random # jitter for retry backoff.
+import math # grid cell math for the route cache and stop index.
+import os # file replacement when saving the stop index.
+import csv # reads GTFS stops.txt.
+import json # stop index metadata.
+import mmap # the stop index file is memory mapped on load.
+import struct # stop index file header.
+import hashlib # fixture file names for record/replay.
+from urllib.parse import urlsplit, parse_qsl # fixture keys from request URLs.
+from email.utils import parsedate_to_datetime # Expires headers on map tiles.
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # stand-in API server for offline testing.
+from http import HTTPStatus # reason phrases for the lookup server.
+import asyncio # the lookup server's event loop.
+from array import array # compact coordinate storage for the stop index.
+import heapq # keeps only the soonest departures while walking a routes payload.
+import bisect # first catchable departure per stop in radius mode.
+import functools # wraps the traced API functions.
+from contextlib import contextmanager # metrics spans.
+from dataclasses import dataclass # compact records for stops and routes.
+from typing import NamedTuple # departures stay plain (time, route) tuples, just with names.
+import sys # stdin/stdout for batch mode.
+import atexit # writes out batched stop index and metrics changes on the way out.
+import zipfile # reads GTFS feeds straight out of their zip.
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError # GTFS times are local to the agency, not UTC.
+from collections import deque # rolling latency samples.
+from collections import OrderedDict # in-memory LRU for the caches.
+from datetime import datetime,timezone,timedelta #https://docs.python.org/3/library/datetime.html#datetime.datetime
 
 #other geopy info
 #    https://stackoverflow.com/questions/60928516/get-address-from-given-coordinate-using-python
@@ -34,7 +89,12 @@ from datetime import datetime,timezone,UTC,timedelta #https://docs.python.org/3/
 
 #################################################     API.TXT     #################################################
 
+class ApiKeyError(RuntimeError):
+    """API.txt is missing or empty."""
+
 # tries to read API.txt. this is to prevent the API key from being hard coded into program.
+# the key is first needed on a lookup worker thread, so a problem is raised (and ends up on the GUI's result
+# label like any other API error) instead of calling exit(), which a worker thread would just swallow.
 def api_key():
     """Reads the API key from a file named 'API.txt'."""
     try:
@@ -44,8 +104,25 @@ def api_key():
                 raise ValueError("API key is empty.")
             return API_KEY
     except (FileNotFoundError, ValueError) as e:
-        print(f"[API Key Error] {e}") # if there is an API error, prints issue in IDE.
-        exit() # if there is an API error, closes the program.
+        raise ApiKeyError(f"API.txt could not be used: {e}") from e
+
+# Bounding box for Connecticut (north-west corner, south-east corner). used for geocoding and tile prefetching.
+CT_VIEWBOX = [(42.050587, -73.727775), (40.950943, -71.787220)]
+
+# Connecticut's clock. departure times are shown in it (EST or EDT depending on the date).
+LOCAL_TIMEZONE_NAME = "America/New_York"
+
+# zones are looked up when first needed, not at import. Windows has no system time zone database, so without the
+# tzdata package (pip install tzdata) ZoneInfo can't find any zone there, and the app falls back to plain EST.
+@functools.cache
+def find_timezone(name=LOCAL_TIMEZONE_NAME):
+    """ZoneInfo for an IANA zone name, or a fixed UTC-5 if the time zone database doesn't have it."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        print(f"[Time Zone Error] {e}, showing times in UTC-5 (an hour off during daylight saving). "
+              "On Windows, pip install tzdata to fix this.")
+        return timezone(timedelta(hours=-5), "EST")
 
 # because there are 2 APIs that use this, make it a function.
 def max_distance():
@@ -59,60 +136,1230 @@ def max_distance():
 # that sliding bar could change the size of a circle in the GUI map to show radius
 # this is an unnecessary addition to the scope - but might be fun
 
+################################################   INSTRUMENTATION   ################################################
+
+# where a search spends its time and how much quota it uses. every stage (geocode, nearby_stops, nearby_routes,
+# departure parsing, map render, the whole search) is timed as a "span", counters track API requests actually
+# sent, and errors are recorded as events instead of only being printed. spans and events can be streamed to a
+# JSONL file, and a Prometheus text file with the percentiles is rewritten a few seconds after things change
+# (on a timer thread, so the Tk thread never waits on the disk).
+class Metrics:
+    """Span timings, counters and error events, with optional JSONL and Prometheus-text file sinks."""
+
+    FLUSH_DELAY = 5.0 # seconds of spans batched into one rewrite of the Prometheus file
+
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.timings = {} # stage -> deque of recent durations in seconds
+        self.span_counts = {} # stage -> total spans
+        self.span_errors = {} # stage -> spans that failed
+        self.span_seconds = {} # stage -> total seconds over every span
+        self.payload_bytes = {} # stage -> total response bytes
+        self.counters = {}
+        self.jsonl = None
+        self.prometheus_path = None
+        self._flush_timer = None # pending Prometheus rewrite, if any
+
+    def configure(self, jsonl_path=None, prometheus_path=None):
+        """Turns on the file sinks."""
+        if jsonl_path:
+            self.jsonl = open(jsonl_path, "a", encoding="utf-8")
+        self.prometheus_path = prometheus_path
+        if prometheus_path:
+            atexit.register(self.flush) # whatever the last timer didn't get to
+
+    def _emit(self, record):
+        if self.jsonl is not None:
+            record["ts"] = time.time()
+            line = json.dumps(record, default=str) + "\n"
+            with self.lock:
+                self.jsonl.write(line)
+                self.jsonl.flush()
+
+    def observe(self, stage, seconds, error=False, size=None, **fields):
+        """Records one finished span."""
+        with self.lock:
+            self.timings.setdefault(stage, deque(maxlen=self.samples)).append(seconds)
+            self.span_counts[stage] = self.span_counts.get(stage, 0) + 1
+            self.span_seconds[stage] = self.span_seconds.get(stage, 0.0) + seconds
+            if error:
+                self.span_errors[stage] = self.span_errors.get(stage, 0) + 1
+            if size is not None:
+                self.payload_bytes[stage] = self.payload_bytes.get(stage, 0) + size
+        self._emit({"type": "span", "stage": stage, "ms": round(seconds * 1000, 3), "error": error,
+                    "bytes": size, **fields})
+        self.flush_later()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Times the code inside the with block as one span of stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(stage, time.perf_counter() - started, error=True, **fields)
+            raise
+        self.observe(stage, time.perf_counter() - started, **fields)
+
+    def count(self, name, value=1):
+        """Adds to a counter (e.g. API requests sent)."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.flush_later()
+
+    def error(self, stage, message):
+        """Records an error event and prints it like before."""
+        print(message)
+        self.count(f"errors.{stage}")
+        self._emit({"type": "error", "stage": stage, "message": message})
+
+    @staticmethod
+    def percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def summary(self):
+        """Per-stage count/sum/errors/p50/p95 (seconds) and bytes, plus counters and cache hit rates."""
+        with self.lock:
+            stages = {}
+            for stage, samples in self.timings.items():
+                ordered = sorted(samples)
+                stages[stage] = {"count": self.span_counts[stage],
+                                 "sum": self.span_seconds[stage],
+                                 "errors": self.span_errors.get(stage, 0),
+                                 "p50": self.percentile(ordered, 0.50),
+                                 "p95": self.percentile(ordered, 0.95),
+                                 "bytes": self.payload_bytes.get(stage, 0)}
+            counters = dict(self.counters)
+        caches = {"geocode": geocode_cache.stats(), "routes": route_cache.stats()}
+        if _tile_cache is not None:
+            caches["tiles"] = _tile_cache.stats()
+        return {"stages": stages, "counters": counters, "caches": caches}
+
+    def prometheus_text(self):
+        """The summary in Prometheus text exposition format."""
+        summary = self.summary()
+        lines = ["# TYPE transit_stage_seconds summary"]
+        for stage, row in summary["stages"].items():
+            lines.append(f'transit_stage_seconds{{stage="{stage}",quantile="0.5"}} {row["p50"]:.6f}')
+            lines.append(f'transit_stage_seconds{{stage="{stage}",quantile="0.95"}} {row["p95"]:.6f}')
+            lines.append(f'transit_stage_seconds_sum{{stage="{stage}"}} {row["sum"]:.6f}')
+            lines.append(f'transit_stage_seconds_count{{stage="{stage}"}} {row["count"]}')
+        lines.append("# TYPE transit_stage_errors_total counter")
+        for stage, row in summary["stages"].items():
+            lines.append(f'transit_stage_errors_total{{stage="{stage}"}} {row["errors"]}')
+        lines.append("# TYPE transit_payload_bytes_total counter")
+        for stage, row in summary["stages"].items():
+            if row["bytes"]:
+                lines.append(f'transit_payload_bytes_total{{stage="{stage}"}} {row["bytes"]}')
+        lines.append("# TYPE transit_events_total counter")
+        for name, value in summary["counters"].items():
+            lines.append(f'transit_events_total{{name="{name}"}} {value}')
+        lines.append("# TYPE transit_cache_hit_ratio gauge")
+        for cache, stats in summary["caches"].items():
+            lines.append(f'transit_cache_hit_ratio{{cache="{cache}"}} {stats["hit_rate"]:.4f}')
+        return "\n".join(lines) + "\n"
+
+    def flush_later(self):
+        """Rewrites the Prometheus text file FLUSH_DELAY seconds from now on a timer thread, if one is configured."""
+        if not self.prometheus_path:
+            return
+        with self.lock:
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Rewrites the Prometheus text file now, if one is configured."""
+        with self.lock:
+            timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+        if self.prometheus_path:
+            try:
+                with open(self.prometheus_path + ".tmp", "w", encoding="utf-8") as file:
+                    file.write(self.prometheus_text())
+                os.replace(self.prometheus_path + ".tmp", self.prometheus_path)
+            except OSError as e:
+                print(f"[Metrics Error] {e}")
+
+metrics = Metrics()
+
+def traced(stage):
+    """Decorator that times every call of a function as a span of stage."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+#################################################   GEOCODE CACHE   #################################################
+
+# Nominatim only allows about 1 request a second, so every address we have already looked up is kept here.
+# The memory tier is a small LRU in front of a SQLite file, so repeat searches survive restarts.
+# Places Nominatim could not find are cached too (for a shorter time) so typos don't keep costing requests.
+class GeocodeCache:
+    """Two-tier (memory LRU + SQLite) cache of geocoded places with TTL expiry and negative caching."""
+
+    def __init__(self, path="geocode_cache.db", memory_size=512, disk_size=20000,
+                 ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = OrderedDict() # key -> (coords or None, expires, place as typed)
+        self.lock = threading.Lock()
+        self.db = None
+        self.disk_failed = False
+        self.hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(place):
+        """Lowercases a query and drops punctuation/extra spaces so "Main St." and "main st" share a key."""
+        return " ".join(re.sub(r"[^\w\s]", " ", place.lower()).split())
+
+    def _disk(self):
+        # opened on first use. if the file can't be opened we just run on the memory tier.
+        if self.db is None and not self.disk_failed:
+            try:
+                self.db = sqlite3.connect(self.path, check_same_thread=False)
+                self.db.execute("""CREATE TABLE IF NOT EXISTS geocode (
+                                       key TEXT PRIMARY KEY NOT NULL,
+                                       lat REAL,
+                                       lon REAL,
+                                       expires REAL NOT NULL,
+                                       used REAL NOT NULL,
+                                       place TEXT)""")
+                self.db.execute("CREATE INDEX IF NOT EXISTS geocode_used ON geocode (used)")
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"[Geocode Cache Error] {e}")
+                self.db = None
+                self.disk_failed = True
+        return self.db
+
+    def _remember(self, key, coords, expires, place):
+        self.memory[key] = (coords, expires, place)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get(self, place):
+        """Returns (True, coords) on a hit, where coords is None for a cached miss, or (False, None)."""
+        key = self.normalize(place)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[1] > now:
+                self.memory.move_to_end(key)
+                return self._hit(entry[0])
+            self.memory.pop(key, None)
+
+            db = self._disk()
+            if db is not None:
+                try:
+                    row = db.execute("SELECT lat, lon, expires, place FROM geocode WHERE key=?", (key,)).fetchone()
+                    if row is not None and row[2] > now:
+                        coords = (row[0], row[1]) if row[0] is not None else None
+                        db.execute("UPDATE geocode SET used=? WHERE key=?", (now, key))
+                        db.commit()
+                        self._remember(key, coords, row[2], row[3])
+                        self.disk_hits += 1
+                        return self._hit(coords)
+                except sqlite3.Error as e:
+                    print(f"[Geocode Cache Error] {e}")
+            self.misses += 1
+            return False, None
+
+    def _hit(self, coords):
+        self.hits += 1
+        if coords is None:
+            self.negative_hits += 1
+        return True, coords
+
+    def put(self, place, coords):
+        """Stores a lookup result (None for "not found") in both tiers."""
+        key = self.normalize(place)
+        now = time.time()
+        expires = now + (self.ttl if coords else self.negative_ttl)
+        lat, lon = coords if coords else (None, None)
+        with self.lock:
+            self._remember(key, coords, expires, place)
+            db = self._disk()
+            if db is None:
+                return
+            try:
+                db.execute("""INSERT OR REPLACE INTO geocode (key, lat, lon, expires, used, place)
+                              VALUES (?, ?, ?, ?, ?, ?)""", (key, lat, lon, expires, now, place))
+                # evict expired rows first, then the least recently used ones past the size limit
+                db.execute("DELETE FROM geocode WHERE expires <= ?", (now,))
+                db.execute("""DELETE FROM geocode WHERE key IN (
+                                  SELECT key FROM geocode ORDER BY used
+                                  LIMIT max(0, (SELECT count(*) FROM geocode) - ?))""", (self.disk_size,))
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"[Geocode Cache Error] {e}")
+
+    def places(self, limit=5000):
+        """Places that geocoded successfully as they were typed, most recently used first (for autocomplete)."""
+        with self.lock:
+            db = self._disk()
+            if db is None:
+                return [place for coords, _, place in reversed(self.memory.values()) if coords][:limit]
+            try:
+                return [row[0] for row in db.execute("""SELECT place FROM geocode
+                                                        WHERE lat IS NOT NULL AND expires > ?
+                                                        ORDER BY used DESC LIMIT ?""", (time.time(), limit))]
+            except sqlite3.Error as e:
+                print(f"[Geocode Cache Error] {e}")
+                return []
+
+    def stats(self):
+        """Hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+geocode_cache = GeocodeCache()
+
+##################################################   TRANSPORT   ##################################################
+
+# how HTTP requests actually leave the app. "live" goes to the network, "record" goes to the network and saves
+# every answer as a fixture file, and "replay" answers only from saved fixtures, so searches can be benchmarked
+# and tested without spending Transit or Nominatim quota. fixtures are keyed by endpoint plus the params that
+# identify the answer (the host is ignored, so fixtures recorded live also work on the stand-in server).
+FIXTURE_KEY_PARAMS = {"search": ("q",),
+                      "nearby_stops": ("lat", "lon", "max_distance"),
+                      "nearby_routes": ("lat", "lon", "max_distance")}
+
+def fixture_key(url, params=None):
+    """Stable key for a request: the last path segment plus its identifying params."""
+    parts = urlsplit(url)
+    endpoint = parts.path.rstrip("/").rsplit("/", 1)[-1]
+    query = dict(parse_qsl(parts.query))
+    query.update({name: str(value) for name, value in (params or {}).items()})
+    wanted = FIXTURE_KEY_PARAMS.get(endpoint, sorted(query))
+    return endpoint + "?" + "&".join(f"{name}={query[name]}" for name in wanted if name in query)
+
+def fixture_path(directory, key):
+    return os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".json")
+
+def load_fixtures(directory):
+    """Every fixture in a directory as {key: (status, body)}."""
+    fixtures = {}
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as file:
+                fixture = json.load(file)
+            fixtures[fixture["key"]] = (fixture["status"], fixture["body"])
+    return fixtures
+
+# the bits of a requests.Response the rest of the app uses.
+class FixtureResponse:
+    """A response replayed from a fixture."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+        self.headers = {}
+        self._body = body
+
+    def json(self):
+        return self._body
+
+class LiveTransport:
+    """Sends requests over a pooled requests.Session."""
+
+    needs_key = True
+
+    def __init__(self, pool_size=20):
+        self.session = requests.Session()
+        adapter = requests_adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, params=None, headers=None, timeout=10):
+        return self.session.get(url, params=params, headers=headers, timeout=timeout)
+
+class RecordingTransport(LiveTransport):
+    """Live transport that also saves every JSON answer as a fixture."""
+
+    def __init__(self, directory, pool_size=20):
+        super().__init__(pool_size)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url, params=None, headers=None, timeout=10):
+        response = super().get(url, params, headers, timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            return response # not JSON (an HTML error page), nothing useful to replay
+        key = fixture_key(url, params)
+        with open(fixture_path(self.directory, key), "w", encoding="utf-8") as file:
+            json.dump({"key": key, "status": response.status_code, "body": body, "recorded": time.time()}, file)
+        return response
+
+class ReplayTransport:
+    """Answers only from recorded fixtures; anything not recorded gets a 404."""
+
+    needs_key = False
+
+    def __init__(self, directory, latency=0.0):
+        self.fixtures = load_fixtures(directory)
+        self.latency = latency
+
+    def get(self, url, params=None, headers=None, timeout=10):
+        if self.latency:
+            time.sleep(self.latency)
+        status, body = self.fixtures.get(fixture_key(url, params), (404, {"error": "not recorded"}))
+        return FixtureResponse(status, body)
+
+_transport = None
+
+def transport():
+    """Returns the transport every API request goes through (live unless configure_transport says otherwise)."""
+    global _transport
+    if _transport is None:
+        _transport = LiveTransport()
+    return _transport
+
+def configure_transport(mode="live", directory="fixtures"):
+    """Switches every API request to "live", "record" or "replay"."""
+    global _transport, _transit_client, _geolocator
+    if mode == "record":
+        _transport = RecordingTransport(directory)
+    elif mode == "replay":
+        _transport = ReplayTransport(directory)
+    else:
+        _transport = LiveTransport()
+    _transit_client = None # rebuilt on next use with the new transport
+    _geolocator = None
+
+def use_api_base(base_url):
+    """Points Transit and Nominatim requests at another server, e.g. the stand-in server ("http://127.0.0.1:8765")."""
+    global _transit_client, _geolocator
+    parts = urlsplit(base_url)
+    TransitClient.BASE_URL = base_url.rstrip("/") + "/v3/public/"
+    GEOCODER_SETTINGS.update(domain=parts.netloc, scheme=parts.scheme)
+    _transit_client = None
+    _geolocator = None
+
+# a stand-in for both APIs. it serves recorded fixtures for /v3/public/nearby_stops, /v3/public/nearby_routes and
+# Nominatim's /search, with optional extra latency and a fraction of requests failing with 503, so load tests
+# and benchmarks can run offline.
+class StandInServer:
+    """Local HTTP server that serves recorded fixtures with configurable latency and error injection."""
+
+    def __init__(self, directory=None, fixtures=None, port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.fixtures = fixtures if fixtures is not None else load_fixtures(directory)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock() # handlers run on one thread per connection
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real APIs
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                delay = server.latency + random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+                if random.random() < server.error_rate:
+                    status, body = 503, {"error": "injected failure"}
+                else:
+                    status, body = server.fixtures.get(fixture_key(self.path), (404, {"error": "not recorded"}))
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass # keep benchmarks quiet
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def start(self):
+        """Serves on a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+#################################################  TRANSIT CLIENT  #################################################
+
+# keeps us under the API key's quota. tokens refill at `rate` per second up to `capacity`,
+# and every request takes one, waiting if the bucket is empty.
+class TokenBucket:
+    """Thread-safe token bucket rate limiter."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, on_wait=None):
+        """Takes one token, sleeping until one is available. on_wait(seconds) is called once if it has to wait."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if on_wait is not None:
+                on_wait(wait)
+                on_wait = None
+            time.sleep(wait)
+
+# the report() and cancelled() of the lookup job running on this thread (set by LookupEngine), so code deep
+# inside a lookup can tell the GUI it is stuck behind a rate limit, and can skip requests nobody wants anymore.
+_job_context = threading.local()
+
+class LookupCancelled(Exception):
+    """The lookup this request belonged to was cancelled before the request went out."""
+
+def job_cancelled():
+    """True when the lookup job running on this thread has been superseded or abandoned."""
+    cancelled = getattr(_job_context, "cancelled", None)
+    return cancelled is not None and cancelled()
+
+def report_wait(reason, seconds):
+    """Sends a ("waiting", (reason, seconds)) stage to the lookup job on this thread, if there is one."""
+    report = getattr(_job_context, "report", None)
+    if report is not None:
+        report("waiting", (reason, seconds))
+
+# one shared client for every Transit API call. requests go through the shared transport, whose session keeps
+# connections alive so we only pay for the TCP+TLS handshake once, and the API key is read from API.txt the
+# first time it is needed instead of every call.
+class TransitClient:
+    """Pooled, rate limited HTTP client for the Transit App API with retry/backoff. Timings go to metrics."""
+
+    BASE_URL = "https://external.transitapp.com/v3/public/"
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    # the free Transit API plan allows 5 calls a minute. raise rate/burst if your key has a bigger quota.
+    def __init__(self, rate=5 / 60, burst=5, retries=3, backoff=0.5, timeout=10, transport=None):
+        self.limiter = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.transport = transport # None means the shared transport() (a pooled keep-alive session by default)
+        self._key = None
+
+    def key(self):
+        """API key, loaded once."""
+        if self._key is None:
+            self._key = api_key()
+        return self._key
+
+    def get(self, endpoint, params):
+        """GETs an endpoint (e.g. "nearby_stops"), retrying 429/5xx and connection errors with backoff."""
+        url = self.BASE_URL + endpoint
+        sender = self.transport or transport()
+        headers = {"apiKey": self.key()} if sender.needs_key else {}
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(on_wait=lambda wait: report_wait("Transit API", wait))
+            if job_cancelled():
+                raise LookupCancelled(endpoint) # checked after the wait, the one place a search can sit for a while
+            started = time.perf_counter()
+            try:
+                response = sender.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException:
+                self._record(endpoint, started, failed=True)
+                if attempt == self.retries:
+                    raise
+                self._backoff(self._delay(attempt))
+                continue
+            failed = response.status_code in self.RETRY_STATUS
+            self._record(endpoint, started, failed=failed, size=len(response.content))
+            if not failed or attempt == self.retries:
+                return response
+            self._backoff(self._delay(attempt, response.headers.get("Retry-After")))
+        return None
+
+    @staticmethod
+    def _backoff(delay):
+        report_wait("Transit API retry", delay)
+        time.sleep(delay)
+
+    def _delay(self, attempt, retry_after=None):
+        # the server's Retry-After wins when it gives one, otherwise exponential backoff with a little jitter
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    def _record(self, endpoint, started, failed=False, size=None):
+        elapsed = time.perf_counter() - started
+        metrics.count("quota.transit") # every request sent counts against the key, retries included
+        metrics.observe(f"api.{endpoint}", elapsed, error=failed, size=size) # shown in the Diagnostics window
+
+_transit_client = None
+
+def transit_client():
+    """Returns the shared TransitClient."""
+    global _transit_client
+    if _transit_client is None:
+        _transit_client = TransitClient()
+    return _transit_client
+
 ##################################################     GeoPy     ##################################################
 
+# one geolocator for the whole app instead of building a new one on every search.
+_geolocator = None
+nominatim_limiter = TokenBucket(1, 1)
+GEOCODER_SETTINGS = {} # extra Nominatim options, e.g. domain/scheme when pointed at the stand-in server
+_transport_adapter = None
+
+def transport_adapter_class():
+    """geopy adapter that sends Nominatim requests through transport(), so they can be recorded and replayed."""
+    global _transport_adapter
+    if _transport_adapter is None:
+        geopy_adapters = importlib.import_module("geopy.adapters")
+        geopy_exc = importlib.import_module("geopy.exc")
+
+        class TransportAdapter(geopy_adapters.BaseSyncAdapter):
+            def get_json(self, url, *, timeout, headers):
+                response = transport().get(url, headers=headers, timeout=timeout)
+                if response.status_code != 200:
+                    raise geopy_exc.GeocoderServiceError(f"Non-successful status code {response.status_code}")
+                return response.json()
+
+            def get_text(self, url, *, timeout, headers):
+                return transport().get(url, headers=headers, timeout=timeout).text
+
+        _transport_adapter = TransportAdapter
+    return _transport_adapter
+
+def geolocator():
+    """Returns the shared Nominatim geolocator."""
+    global _geolocator
+    if _geolocator is None:
+        options = dict(GEOCODER_SETTINGS)
+        if type(transport()) is not LiveTransport: # record/replay, send geocoding through the transport too
+            options["adapter_factory"] = transport_adapter_class()
+        _geolocator = geopy_geocoders.Nominatim(user_agent="GetLoc", **options) # https://www.youtube.com/watch?v=mhTkaH2YuAc
+    return _geolocator
+
 # try to call geopy
+@traced("geocode")
 def get_coordinates(place):
     """Uses geopy to get latitude and longitude coordinates for a given place name."""
+    # answer from the cache when we can. a cached "not found" comes back as None as well.
+    hit, coords = geocode_cache.get(place)
+    if hit:
+        return coords
     try:
-        geolocator = Nominatim(user_agent="GetLoc") # https://www.youtube.com/watch?v=mhTkaH2YuAc
-        location = geolocator.geocode(place,
-                                      country_codes="us",  # Restrict search to the US
-                                      # Bounding box for Connecticut
-                                      viewbox=[(42.050587, -73.727775), (40.950943, -71.787220)],
-                                      bounded=True) # Ensures results stay within the view box
+        nominatim_limiter.acquire(on_wait=lambda wait: report_wait("Geocoder", wait)) # Nominatim's usage policy is about 1 request a second
+        metrics.count("quota.nominatim")
+        location = geolocator().geocode(place,
+                                        country_codes="us",  # Restrict search to the US
+                                        # Bounding box for Connecticut
+                                        viewbox=CT_VIEWBOX,
+                                        bounded=True) # Ensures results stay within the view box
         # everything here is learned from the documentation
         # https://geocoder.readthedocs.io/results.html
-        if location:
-            # print((location.latitude, location.longitude)) # Debugging. Outputs Lat and Lon.
-            # print(location.raw) # Debugging. # full data pull
-            return location.latitude, location.longitude
+        # print(location.raw) # Debugging. # full data pull
+        coords = (location.latitude, location.longitude) if location else None
+        geocode_cache.put(place, coords) # errors below are not cached, only real answers
+        if coords and _place_index is not None:
+            _place_index.add(place, PlaceIndex.HISTORY_WEIGHT)
+        return coords
     except Exception as e:
-        print(f"[Geolocation Error] {e}") # pushes error
+        metrics.error("geocode", f"[Geolocation Error] {e}") # pushes error
     return None # outputs nothing
 
+##############################################   PLACE SUGGESTIONS   ##############################################
+
+# the 169 towns, so the first few letters of a town name complete before anything has been searched
+CT_TOWNS = (
+    "Andover", "Ansonia", "Ashford", "Avon", "Barkhamsted", "Beacon Falls", "Berlin", "Bethany", "Bethel",
+    "Bethlehem", "Bloomfield", "Bolton", "Bozrah", "Branford", "Bridgeport", "Bridgewater", "Bristol",
+    "Brookfield", "Brooklyn", "Burlington", "Canaan", "Canterbury", "Canton", "Chaplin", "Cheshire", "Chester",
+    "Clinton", "Colchester", "Colebrook", "Columbia", "Cornwall", "Coventry", "Cromwell", "Danbury", "Darien",
+    "Deep River", "Derby", "Durham", "East Granby", "East Haddam", "East Hampton", "East Hartford", "East Haven",
+    "East Lyme", "East Windsor", "Eastford", "Easton", "Ellington", "Enfield", "Essex", "Fairfield",
+    "Farmington", "Franklin", "Glastonbury", "Goshen", "Granby", "Greenwich", "Griswold", "Groton", "Guilford",
+    "Haddam", "Hamden", "Hampton", "Hartford", "Hartland", "Harwinton", "Hebron", "Kent", "Killingly",
+    "Killingworth", "Lebanon", "Ledyard", "Lisbon", "Litchfield", "Lyme", "Madison", "Manchester", "Mansfield",
+    "Marlborough", "Meriden", "Middlebury", "Middlefield", "Middletown", "Milford", "Monroe", "Montville",
+    "Morris", "Naugatuck", "New Britain", "New Canaan", "New Fairfield", "New Hartford", "New Haven",
+    "New London", "New Milford", "Newington", "Newtown", "Norfolk", "North Branford", "North Canaan",
+    "North Haven", "North Stonington", "Norwalk", "Norwich", "Old Lyme", "Old Saybrook", "Orange", "Oxford",
+    "Plainfield", "Plainville", "Plymouth", "Pomfret", "Portland", "Preston", "Prospect", "Putnam", "Redding",
+    "Ridgefield", "Rocky Hill", "Roxbury", "Salem", "Salisbury", "Scotland", "Seymour", "Sharon", "Shelton",
+    "Sherman", "Simsbury", "Somers", "South Windsor", "Southbury", "Southington", "Sprague", "Stafford",
+    "Stamford", "Sterling", "Stonington", "Stratford", "Suffield", "Thomaston", "Thompson", "Tolland",
+    "Torrington", "Trumbull", "Union", "Vernon", "Voluntown", "Wallingford", "Warren", "Washington", "Waterbury",
+    "Waterford", "Watertown", "West Hartford", "West Haven", "Westbrook", "Weston", "Westport", "Wethersfield",
+    "Willington", "Wilton", "Winchester", "Windham", "Windsor", "Windsor Locks", "Wolcott", "Woodbridge",
+    "Woodbury", "Woodstock",
+)
+
+# type-ahead for the search box. a character trie over normalized place names where every node keeps its own
+# best few completions, so answering a prefix is a walk down len(prefix) nodes with no subtree search.
+# places that geocoded before outrank bare town names, since those are known to work.
+class PlaceIndex:
+    """Prefix trie of place names with the top completions cached at every node."""
+
+    TOWN_WEIGHT = 1
+    HISTORY_WEIGHT = 2
+
+    def __init__(self, keep=8):
+        self.keep = keep
+        self.root = {} # char -> child node, plus "" -> [(-weight, text, place), ...] best completions through here
+        self.weights = {} # normalized text -> weight, so re-adding a place only ever promotes it
+        self.lock = threading.Lock()
+
+    def add(self, place, weight=1):
+        """Adds (or promotes) a place name. The trie is walked on the normalized text but hands back place."""
+        text = GeocodeCache.normalize(place)
+        if not text:
+            return
+        with self.lock:
+            if self.weights.get(text, 0) >= weight:
+                return
+            self.weights[text] = weight
+            node = self.root
+            for char in text:
+                node = node.setdefault(char, {})
+                best = [entry for entry in node.get("", []) if entry[1] != text]
+                best.append((-weight, text, place.strip()))
+                best.sort()
+                node[""] = best[:self.keep]
+
+    def complete(self, prefix, limit=5):
+        """Best completions for what has been typed so far, as the places were written."""
+        node = self.root
+        for char in GeocodeCache.normalize(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        return [place for _, _, place in node.get("", [])[:limit]]
+
+_place_index = None
+
+def place_index():
+    """Shared PlaceIndex, seeded from the CT town list and every place that geocoded before."""
+    global _place_index
+    if _place_index is None:
+        index = PlaceIndex()
+        for town in CT_TOWNS:
+            index.add(f"{town} CT", PlaceIndex.TOWN_WEIGHT)
+        for place in geocode_cache.places():
+            index.add(place, PlaceIndex.HISTORY_WEIGHT)
+        _place_index = index
+    return _place_index
+
+# public Nominatim's usage policy forbids autocomplete (and it only matches whole words anyway), so by default
+# typing only completes from the local index, and Nominatim is asked when the search is actually submitted.
+# a geocoder that is built for type-ahead and lets you use it that way (your own Photon, https://photon.komoot.io
+# is the API) can be plugged in with --suggest-url. every address it returns is put in the geocode cache, so
+# picking a suggestion searches without another call.
+SUGGESTION_URL = None
+
+@traced("suggest")
+def remote_suggestions(prefix, limit=5, cancelled=None):
+    """Up to limit matches for a partial address from the SUGGESTION_URL server, as display strings."""
+    cancelled = cancelled or (lambda: False)
+    if SUGGESTION_URL is None or cancelled():
+        return []
+    west, east = sorted((CT_VIEWBOX[0][1], CT_VIEWBOX[1][1]))
+    south, north = sorted((CT_VIEWBOX[0][0], CT_VIEWBOX[1][0]))
+    try:
+        response = transport().get(SUGGESTION_URL.rstrip("/") + "/api",
+                                   params={"q": prefix, "limit": limit, "bbox": f"{west},{south},{east},{north}"})
+        response.raise_for_status()
+        features = response.json().get("features", [])
+    except Exception as e:
+        metrics.error("suggest", f"[Suggestion Error] {e}")
+        return []
+    suggestions = []
+    for feature in features:
+        props = feature.get("properties", {})
+        street = " ".join(part for part in (props.get("housenumber"), props.get("street")) if part)
+        address = ", ".join(part for part in (street or props.get("name"), props.get("city"), props.get("state")) if part)
+        if address:
+            lon, lat = feature["geometry"]["coordinates"]
+            geocode_cache.put(address, (lat, lon))
+            suggestions.append(address)
+    return suggestions
+
+#################################################   DATA MODEL   #################################################
+
+# API answers are turned into these right where they arrive, keeping only the fields the app reads, so the rest
+# of the code (and the caches and stop index) never holds onto the full JSON. slots keep each record small, and
+# to_json gives back the API's own shape, so anything that stores or serves them stays compatible with it.
+@dataclass(slots=True)
+class Stop:
+    """A stop from nearby_stops (or the local index). distance is meters from where we asked, when known."""
+    global_stop_id: str
+    stop_name: str
+    stop_lat: float
+    stop_lon: float
+    distance: float = None
+
+    @classmethod
+    def from_json(cls, stop):
+        return cls(stop.get("global_stop_id"), stop.get("stop_name"), stop["stop_lat"], stop["stop_lon"],
+                   stop.get("distance"))
+
+    def to_json(self):
+        return {"global_stop_id": self.global_stop_id, "stop_name": self.stop_name,
+                "stop_lat": self.stop_lat, "stop_lon": self.stop_lon, "distance": self.distance}
+
+@dataclass(slots=True)
+class Itinerary:
+    """One direction of a route: the stop on it closest to where we asked and its departure times, soonest first."""
+    closest_stop_id: str
+    departure_times: tuple
+    stop_ids: tuple = () # every stop the itinerary serves, when the payload lists them
+    headsign: str = "" # which way it is going, for the departure lists
+    direction_id: int = None # 0 or 1 in the payload, tells a route's two directions apart even without headsigns
+
+    @classmethod
+    def from_json(cls, itinerary):
+        times = sorted(item["departure_time"] for item in itinerary.get("schedule_items", [])
+                       if item.get("departure_time"))
+        stop_ids = tuple(stop["global_stop_id"] for stop in itinerary.get("stops", []) if stop.get("global_stop_id"))
+        return cls((itinerary.get("closest_stop") or {}).get("global_stop_id"), tuple(times), stop_ids,
+                   itinerary.get("direction_headsign") or itinerary.get("headsign") or "",
+                   itinerary.get("direction_id"))
+
+    def to_json(self):
+        payload = {"closest_stop": {"global_stop_id": self.closest_stop_id},
+                   "schedule_items": [{"departure_time": ts} for ts in self.departure_times],
+                   "direction_headsign": self.headsign,
+                   "direction_id": self.direction_id}
+        if self.stop_ids:
+            payload["stops"] = [{"global_stop_id": stop_id} for stop_id in self.stop_ids]
+        return payload
+
+    def serves(self):
+        """Ids of the stops this itinerary's departures can be caught at, closest stop first."""
+        return tuple(dict.fromkeys(stop_id for stop_id in (self.closest_stop_id, *self.stop_ids) if stop_id))
+
+@dataclass(slots=True)
+class Route:
+    """A route from nearby_routes with its itineraries."""
+    route_short_name: str
+    itineraries: tuple
+    global_route_id: str = None
+
+    @classmethod
+    def from_json(cls, route):
+        return cls(route.get("route_short_name") or "Unknown",
+                   tuple(Itinerary.from_json(itinerary) for itinerary in route.get("itineraries", [])),
+                   route.get("global_route_id"))
+
+    def to_json(self):
+        return {"route_short_name": self.route_short_name, "global_route_id": self.global_route_id,
+                "itineraries": [itinerary.to_json() for itinerary in self.itineraries]}
+
+    # short names aren't unique (or are missing, and all read "Unknown"), so rows are keyed on the route's id
+    # and the direction instead. schedule-only routes have no global id, their name is all there is. headsigns can
+    # be blank for both directions, so the direction_id goes in too, or the itinerary's place in the route when
+    # the payload has none.
+    def key(self, itinerary):
+        """What identifies one direction of this route across polls."""
+        direction = itinerary.direction_id
+        if direction is None:
+            direction = next(position for position, candidate in enumerate(self.itineraries) if candidate is itinerary)
+        return (self.global_route_id or self.route_short_name, direction, itinerary.headsign)
+
+    def label(self, itinerary):
+        """Route name as shown in the departure lists, with the direction when there is one."""
+        return f"{self.route_short_name} to {itinerary.headsign}" if itinerary.headsign else self.route_short_name
+
+    @property
+    def next_departure(self):
+        """Soonest departure time over all itineraries, or None."""
+        return min((itinerary.departure_times[0] for itinerary in self.itineraries if itinerary.departure_times),
+                   default=None)
+
+class Departure(NamedTuple):
+    """One departure. Still a tuple, so rows sort and bisect on departure_time first."""
+    departure_time: int
+    route_name: str
+    route_key: tuple = () # Route.key of the direction it belongs to
+
+def parse_stops(payload):
+    """Stops from a nearby_stops response body (entries without coordinates are dropped)."""
+    return [Stop.from_json(stop) for stop in payload.get("stops", []) if stop.get("stop_lat") is not None]
+
+def parse_routes(payload):
+    """Routes from a nearby_routes response body."""
+    return [Route.from_json(route) for route in payload.get("routes", [])]
+
+###############################################   LOCAL STOP INDEX   ###############################################
+
+# every nearby_stops answer we get is kept here, so later searches can find the closest stop without touching
+# the API. stops are bucketed in a grid of CELL_DEGREES cells and the coordinates live in flat arrays. "coverage"
+# remembers the circles we have complete answers for: a local answer is only trusted when the circle it depends
+# on sits inside one of them, and only for COVERAGE_TTL after it was fetched, since stops do get moved, added and
+# retired. re-fetching a circle drops the stops it no longer lists. only the API's own stops go in, keyed by global_stop_id, since that is what
+# nearby_routes answers are joined on. a GTFS feed's stop ids are different, those stay in schedule.db.
+class StopIndex:
+    """Grid-bucketed spatial index of stops over flat coordinate arrays, saved as a memory-mappable file."""
+
+    CELL_DEGREES = 0.01
+    SAVE_DELAY = 5.0 # seconds of harvesting batched into one rewrite of the file
+    COVERAGE_TTL = 7 * 24 * 3600 # how long a fetched circle is trusted to still list every stop in it
+    MAGIC = b"STOPIDX1"
+    HEADER = struct.Struct("<8sII") # magic, stop count, metadata length
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lats = array("d")
+        self.lons = array("d")
+        self.ids = [] # None where a stop was dropped, the slot is reclaimed on the next save
+        self.names = []
+        self.positions = {} # stop id -> position in the arrays
+        self.grid = {} # cell -> list of positions
+        self.coverage = {} # cell -> list of (lat, lon, radius, fetched at) circles centred in that cell
+        self.lock = threading.RLock()
+        self._mapped = None
+        self._save_timer = None # pending batched save, if any
+
+    @staticmethod
+    def meters_between(lat1, lon1, lat2, lon2):
+        """Equirectangular distance in meters, plenty accurate at a few km."""
+        x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+        y = math.radians(lat2 - lat1)
+        return 6371008.8 * math.hypot(x, y)
+
+    def cell(self, lat, lon):
+        return int(math.floor(lat / self.CELL_DEGREES)), int(math.floor(lon / self.CELL_DEGREES))
+
+    def _cell_meters(self, lat):
+        # the short side of a cell at this latitude (the east-west one)
+        return self.CELL_DEGREES * 111320 * math.cos(math.radians(abs(lat) + self.CELL_DEGREES))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _writable(self):
+        # a freshly loaded index reads straight from the mapped file. copy it out before the first change.
+        if self._mapped is not None:
+            self.lats = array("d", self.lats)
+            self.lons = array("d", self.lons)
+            self._mapped.close()
+            self._mapped = None
+
+    def add(self, stop_id, lat, lon, name):
+        """Adds a stop, or moves/renames it if the id is already indexed."""
+        with self.lock:
+            self._writable()
+            position = self.positions.get(stop_id)
+            if position is not None:
+                old_cell = self.cell(self.lats[position], self.lons[position])
+                self.grid[old_cell].remove(position)
+                self.lats[position], self.lons[position] = lat, lon
+                self.names[position] = name
+            else:
+                position = len(self.ids)
+                self.positions[stop_id] = position
+                self.ids.append(stop_id)
+                self.names.append(name)
+                self.lats.append(lat)
+                self.lons.append(lon)
+            self.grid.setdefault(self.cell(lat, lon), []).append(position)
+
+    def remove(self, stop_id):
+        """Drops a stop from the index."""
+        with self.lock:
+            position = self.positions.pop(stop_id)
+            self.grid[self.cell(self.lats[position], self.lons[position])].remove(position)
+            self.ids[position] = None
+
+    def harvest(self, lat, lon, radius, stops):
+        """Indexes a nearby_stops answer and records that the circle it was asked for is fully known."""
+        now = time.time()
+        with self.lock:
+            answered = set()
+            for stop in stops:
+                if stop.global_stop_id:
+                    self.add(stop.global_stop_id, stop.stop_lat, stop.stop_lon, stop.stop_name)
+                    answered.add(stop.global_stop_id)
+            # anything we had inside the circle that the answer leaves out is gone. a 1% margin keeps stops the
+            # API measures as just outside the radius
+            for _, position in self.within(lat, lon, radius * 0.99):
+                if self.ids[position] not in answered:
+                    self.remove(self.ids[position])
+            circles = self.coverage.setdefault(self.cell(lat, lon), [])
+            circles[:] = [circle for circle in circles if circle[3] > now - self.COVERAGE_TTL]
+            if not self.covers(lat, lon, radius): # no point keeping circles inside ones we already have
+                circles.append((lat, lon, radius, now))
+            self.save_later()
+
+    def save_later(self):
+        """Saves after SAVE_DELAY seconds, so a burst of harvests costs one rewrite instead of one each."""
+        if not self.path:
+            return
+        with self.lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.SAVE_DELAY, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self):
+        """Writes out a pending batched save now."""
+        with self.lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def _rings(self, buckets, lat, lon, max_rings):
+        # yields (ring number, bucket contents) walking outward from the cell the point is in
+        center_i, center_j = self.cell(lat, lon)
+        for ring in range(max_rings + 1):
+            found = []
+            for i in range(center_i - ring, center_i + ring + 1):
+                for j in range(center_j - ring, center_j + ring + 1):
+                    if max(abs(i - center_i), abs(j - center_j)) == ring:
+                        found.extend(buckets.get((i, j), ()))
+            yield ring, found
+
+    def nearest(self, lat, lon, k=1, max_radius=5000):
+        """The k closest stops as (meters, position) pairs, closest first."""
+        cell_m = self._cell_meters(lat)
+        best = []
+        with self.lock:
+            for ring, found in self._rings(self.grid, lat, lon, int(max_radius // cell_m) + 1):
+                for position in found:
+                    meters = self.meters_between(lat, lon, self.lats[position], self.lons[position])
+                    if meters <= max_radius:
+                        best.append((meters, position))
+                best.sort()
+                del best[k:]
+                # anything in the next ring is at least ring * cell_m away
+                if len(best) == k and best[-1][0] <= ring * cell_m:
+                    break
+        return best
+
+    def within(self, lat, lon, radius):
+        """Every stop within radius meters as (meters, position) pairs, closest first."""
+        matches = []
+        with self.lock:
+            for ring, found in self._rings(self.grid, lat, lon, int(radius // self._cell_meters(lat)) + 1):
+                for position in found:
+                    meters = self.meters_between(lat, lon, self.lats[position], self.lons[position])
+                    if meters <= radius:
+                        matches.append((meters, position))
+        matches.sort()
+        return matches
+
+    def covers(self, lat, lon, radius):
+        """True when every stop within radius of the point is known to be in the index."""
+        fresh_after = time.time() - self.COVERAGE_TTL
+        with self.lock:
+            reach = int(5000 // self._cell_meters(lat)) + 1 # covering circles are at most a few km across
+            for ring, found in self._rings(self.coverage, lat, lon, reach):
+                for c_lat, c_lon, c_radius, fetched in found:
+                    if fetched > fresh_after and self.meters_between(lat, lon, c_lat, c_lon) + radius <= c_radius:
+                        return True
+        return False
+
+    def stop(self, position, meters=None):
+        """A stop as the same kind of Stop nearby_stops answers are parsed into."""
+        return Stop(self.ids[position], self.names[position], self.lats[position], self.lons[position], meters)
+
+    def closest(self, lat, lon, radius=5000):
+        """The closest Stop within radius if the index can prove it is the closest, otherwise None."""
+        best = self.nearest(lat, lon, k=1, max_radius=radius)
+        if best and self.covers(lat, lon, best[0][0]):
+            return self.stop(best[0][1], round(best[0][0]))
+        return None
+
+    def empty(self, lat, lon, radius):
+        """True when the index can prove there is no stop within radius (an area that was fetched and came back empty)."""
+        return self.covers(lat, lon, radius) and not self.nearest(lat, lon, k=1, max_radius=radius)
+
+    def stops_within(self, lat, lon, radius):
+        """All Stops within radius if the index fully covers that circle, otherwise None."""
+        if not self.covers(lat, lon, radius):
+            return None
+        return [self.stop(position, round(meters)) for meters, position in self.within(lat, lon, radius)]
+
+    # file layout: header, then the lat array, then the lon array (little-endian doubles), then JSON metadata.
+    def save(self, path=None):
+        """Writes the index to disk."""
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            self._writable()
+            kept = [position for position, stop_id in enumerate(self.ids) if stop_id is not None]
+            fresh_after = time.time() - self.COVERAGE_TTL
+            meta = json.dumps({"ids": [self.ids[position] for position in kept],
+                               "names": [self.names[position] for position in kept],
+                               "coverage": [circle for circles in self.coverage.values() for circle in circles
+                                            if circle[3] > fresh_after]})
+            meta = meta.encode("utf-8")
+            lats = array("d", (self.lats[position] for position in kept))
+            lons = array("d", (self.lons[position] for position in kept))
+            if struct.pack("=d", 1.0) != struct.pack("<d", 1.0):
+                lats.byteswap()
+                lons.byteswap()
+            try:
+                with open(path + ".tmp", "wb") as file:
+                    file.write(self.HEADER.pack(self.MAGIC, len(kept), len(meta)))
+                    file.write(lats.tobytes())
+                    file.write(lons.tobytes())
+                    file.write(meta)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"[Stop Index Error] {e}")
+
+    @classmethod
+    def load(cls, path):
+        """Opens a saved index, reading the coordinates straight from the memory-mapped file."""
+        index = cls(path)
+        try:
+            with open(path, "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return index # no file yet (or an empty one), start fresh
+        magic, count, meta_len = cls.HEADER.unpack_from(mapped, 0)
+        if magic != cls.MAGIC:
+            mapped.close()
+            print(f"[Stop Index Error] {path} is not a stop index file")
+            return index
+        start = cls.HEADER.size
+        view = memoryview(mapped)
+        if struct.pack("=d", 1.0) == struct.pack("<d", 1.0):
+            index.lats = view[start:start + count * 8].cast("d")
+            index.lons = view[start + count * 8:start + count * 16].cast("d")
+            index._mapped = mapped
+        else:
+            index.lats = array("d", view[start:start + count * 8].tobytes())
+            index.lons = array("d", view[start + count * 8:start + count * 16].tobytes())
+            index.lats.byteswap()
+            index.lons.byteswap()
+        meta = json.loads(bytes(view[start + count * 16:start + count * 16 + meta_len]).decode("utf-8"))
+        if index._mapped is None:
+            view.release()
+            mapped.close()
+        index.ids = meta["ids"]
+        index.names = meta["names"]
+        for position, stop_id in enumerate(index.ids):
+            index.positions[stop_id] = position
+            index.grid.setdefault(index.cell(index.lats[position], index.lons[position]), []).append(position)
+        for c_lat, c_lon, c_radius, fetched in meta["coverage"]:
+            index.coverage.setdefault(index.cell(c_lat, c_lon), []).append((c_lat, c_lon, c_radius, fetched))
+        return index
+
+_stop_index = None
+
+def stop_index():
+    """Returns the shared stop index, loading stops.idx the first time."""
+    global _stop_index
+    if _stop_index is None:
+        _stop_index = StopIndex.load("stops.idx")
+        atexit.register(_stop_index.flush)
+    return _stop_index
+
 #############################################     NEARBY STOP - API     #############################################
 
 # tries to call transitApp API
-def get_nearby_bus_stops(lat, lon, stop_filter="Routable", pickup_dropoff_filter="Everything"):
-    """Sends GET request to the Transit API to fetch nearby bus stops."""
-    url = "https://external.transitapp.com/v3/public/nearby_stops"
-    headers = {"apiKey": api_key()} # Headers for the request
+@traced("nearby_stops")
+def get_nearby_stop_list(lat, lon, stop_filter="Routable", pickup_dropoff_filter="Everything", radius=None):
+    """Sends GET request to the Transit API and returns every nearby stop (or an error string)."""
+    radius = radius or max_distance()
     params = { # Parameters to be sent in the API request
         "lat": lat, # Latitude of the location. REQUIRED
         "lon": lon, # Longitude of the location. REQUIRED
-        "max_distance": max_distance(), # helps limit search
+        "max_distance": radius, # helps limit search
         "stop_filter": stop_filter, # helps limit search
         "pickup_dropoff_filter": pickup_dropoff_filter # helps limit search
     }
+    default_filters = stop_filter == "Routable" and pickup_dropoff_filter == "Everything"
+    if default_filters:
+        # the local index only holds routable stops, so it can only answer the default filters
+        stops = stop_index().stops_within(lat, lon, radius)
+        if stops is not None:
+            return stops
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10) #timeout times out after 10 seconds.
+        response = transit_client().get("nearby_stops", params) # pooled session, times out after 10 seconds.
         if response.status_code == 200: # 200 code is a successful call per their API docs
             data = response.json() # this is the raw data from the API.
             # print(data)  #debugging
-            stops = data.get("stops", []) #pulls the stop info from the json
-            # Ensure "stops" key exists and is non-empty before accessing
-            if not stops:
-                return None #use to: print("No nearby bus stops found.") now we are on the GUI.
-            closest_stop = min(stops, key=lambda stop: stop.get("distance", float("inf")))
-            return (closest_stop.get("stop_lat"),
-                    closest_stop.get("stop_lon"),
-                    closest_stop.get("stop_name"))
+            stops = parse_stops(data) #pulls the stop info from the json
+            if default_filters:
+                stop_index().harvest(lat, lon, radius, stops)
+            return stops
         else:
-            return f"[Transit API Error] Status code: {response.status_code}"
+            message = f"[Transit API Error] Status code: {response.status_code}"
+    except LookupCancelled:
+        return [] # nobody is waiting for this answer anymore
     except Exception as e:
-        return f"[API Request Error] {e}"
-    return None
+        message = f"[API Request Error] {e}"
+    metrics.error("nearby_stops", message)
+    return message
+
+def closest_stop(stops):
+    """Picks the stop with the smallest distance out of a nearby_stops list."""
+    return min(stops, key=lambda stop: float("inf") if stop.distance is None else stop.distance)
+
+def find_closest_stop(lat, lon, stop_filter="Routable", pickup_dropoff_filter="Everything"):
+    """Closest Stop, answered from the local index when it can be, otherwise from the API."""
+    if stop_filter == "Routable" and pickup_dropoff_filter == "Everything":
+        stop = stop_index().closest(lat, lon, max_distance())
+        if stop is not None:
+            return stop
+        if stop_index().empty(lat, lon, max_distance()):
+            return None # fetched before and nothing was there, a stop just past the radius doesn't change that
+    stops = get_nearby_stop_list(lat, lon, stop_filter, pickup_dropoff_filter)
+    if isinstance(stops, str):
+        return stops # error message
+    # Ensure "stops" key exists and is non-empty before accessing
+    if not stops:
+        return None #use to: print("No nearby bus stops found.") now we are on the GUI.
+    return closest_stop(stops)
+
+def get_nearby_bus_stops(lat, lon, stop_filter="Routable", pickup_dropoff_filter="Everything"):
+    """Fetches nearby bus stops and returns (lat, lon, name) of the closest one."""
+    stop = find_closest_stop(lat, lon, stop_filter, pickup_dropoff_filter)
+    if not stop or isinstance(stop, str):
+        return stop
+    return (stop.stop_lat,
+            stop.stop_lon,
+            stop.stop_name)
 
 
 # I do not think the about print codes are doing much of anything now that we are in the GUI.
@@ -121,40 +1368,1457 @@ def get_nearby_bus_stops(lat, lon, stop_filter="Routable", pickup_dropoff_filter
 
 ############################################     ROUTES AT STOP - API     ############################################
 
-def get_routes_at_stop(lat, lon):
+# many kiosks ask about the same few stops, so nearby_routes answers are kept in memory per grid cell.
+# an entry is good until the first departure in it leaves (then the schedule is out of date), but never
+# longer than max_ttl so realtime delays still get picked up.
+class RouteCache:
+    """In-memory LRU of nearby_routes responses keyed by a quantized lat/lon cell and search radius."""
+
+    def __init__(self, cell_meters=25, max_entries=256, max_ttl=300, empty_ttl=60):
+        self.cell_meters = cell_meters
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.empty_ttl = empty_ttl
+        self.entries = OrderedDict() # key -> (routes, expires)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, lat, lon, radius):
+        """Grid cell (about cell_meters on a side) that a point falls in, plus the radius searched."""
+        lat_step = self.cell_meters / 111320
+        lon_step = self.cell_meters / (111320 * max(math.cos(math.radians(lat)), 0.01))
+        return round(lat / lat_step), round(lon / lon_step), radius
+
+    @staticmethod
+    def earliest_departure(routes):
+        """Earliest departure time over a list of Routes, or None."""
+        return min((route.next_departure for route in routes if route.next_departure), default=None)
+
+    def get(self, lat, lon, radius):
+        """Cached routes for the cell, or None when missing/expired."""
+        key = self.key(lat, lon, radius)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, lat, lon, radius, routes):
+        """Stores routes, expiring at the first departure (capped at max_ttl)."""
+        now = time.time()
+        earliest = self.earliest_departure(routes)
+        if earliest is None:
+            expires = now + self.empty_ttl
+        else:
+            expires = min(earliest, now + self.max_ttl)
+        if expires <= now:
+            return # already stale, nothing to gain from caching it
+        key = self.key(lat, lon, radius)
+        with self.lock:
+            self.entries[key] = (routes, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters for the cache."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+route_cache = RouteCache()
+
+@traced("nearby_routes")
+def get_routes_at_stop(lat, lon, use_cache=True, radius=None):
     """Fetches route info for a given bus stop location."""
-    url = "https://external.transitapp.com/v3/public/nearby_routes"
-    headers = {"apiKey": api_key()}
+    radius = radius or max_distance()
+    if use_cache:
+        routes = route_cache.get(lat, lon, radius)
+        if routes is not None:
+            return routes
     params = {
         "lat": lat,
         "lon": lon,
-        "max_distance": max_distance(),
+        "max_distance": radius,
         "should_update_realtime": True
     }
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = transit_client().get("nearby_routes", params)
         if response.status_code == 200:
-            return response.json().get("routes", [])
+            routes = parse_routes(response.json())
+            route_cache.put(lat, lon, radius, routes)
+            return routes
         else:
-            print(f"[Route API Error] Status code: {response.status_code}")
+            metrics.error("nearby_routes", f"[Route API Error] Status code: {response.status_code}")
+    except LookupCancelled:
+        pass # nobody is waiting for this answer anymore
     except Exception as e:
-        print(f"[Route Request Error] {e}")
+        metrics.error("nearby_routes", f"[Route Request Error] {e}")
     return []
 
+# nearby_routes lists, for every itinerary, the stop on it closest to where we asked. when we ask at the user's
+# own location, the itineraries whose closest stop is the user's nearest stop are exactly the ones serving it.
+def routes_for_stop(routes, stop_id):
+    """Keeps only the routes/itineraries whose closest stop is stop_id (client side join)."""
+    joined = []
+    for route in routes:
+        itineraries = tuple(itinerary for itinerary in route.itineraries if itinerary.closest_stop_id == stop_id)
+        if itineraries:
+            joined.append(Route(route.route_short_name, itineraries, route.global_route_id))
+    return joined
+
+###############################################   SCHEDULE STORE   ###############################################
+
+# CT Transit's GTFS feed, imported once into schedule.db, so departures can be answered without the API: when
+# nearby_routes is slow, over quota or down, and as an instant first answer while the live call is in flight.
+# stop_times is indexed on (stop_id, departure), so "next N departures at stop X after T" is one index range
+# scan filtered by the services running that day. departures are seconds since "noon minus 12h" of the service
+# day (the GTFS definition, which stays right across DST changes) and can run past 24:00:00 for late trips.
+class GtfsSchedule:
+    """Indexed SQLite store of a GTFS feed's stops, trips and stop times."""
+
+    def __init__(self, path="schedule.db"):
+        self.path = path
+        self.db = None
+        self.lock = threading.Lock()
+        self.timezone = None
+        self.services = {} # service date -> ids of services running that day
+
+    def available(self):
+        """True once a feed has been imported. Never creates the file."""
+        return self._db(create=False) is not None
+
+    def _db(self, create=True):
+        if self.db is None and (create or os.path.exists(self.path)):
+            try:
+                db = sqlite3.connect(self.path, check_same_thread=False)
+                db.executescript("""
+                    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                    CREATE TABLE IF NOT EXISTS stops (stop INTEGER PRIMARY KEY, stop_id TEXT UNIQUE, name TEXT,
+                                                      lat REAL, lon REAL);
+                    CREATE TABLE IF NOT EXISTS trips (trip INTEGER PRIMARY KEY, service INTEGER, route_name TEXT,
+                                                      headsign TEXT);
+                    CREATE TABLE IF NOT EXISTS services (service INTEGER PRIMARY KEY, service_id TEXT UNIQUE);
+                    CREATE TABLE IF NOT EXISTS calendar (service INTEGER, weekdays INTEGER, start INTEGER,
+                                                         end INTEGER);
+                    CREATE TABLE IF NOT EXISTS calendar_dates (service INTEGER, date INTEGER, added INTEGER);
+                    CREATE TABLE IF NOT EXISTS stop_times (stop INTEGER, departure INTEGER, trip INTEGER);""")
+                row = db.execute("SELECT value FROM meta WHERE key='timezone'").fetchone()
+                self.timezone = find_timezone(row[0] if row else LOCAL_TIMEZONE_NAME)
+                self.db = db
+            except sqlite3.Error as e:
+                print(f"[Schedule Error] {e}")
+        return self.db
+
+    @staticmethod
+    def _rows(feed, name):
+        # a feed is either the zip as published or a folder it was extracted to
+        if os.path.isdir(feed):
+            path = os.path.join(feed, name)
+            if not os.path.exists(path):
+                return
+            with open(path, newline="", encoding="utf-8-sig") as file:
+                yield from csv.DictReader(file)
+        else:
+            with zipfile.ZipFile(feed) as archive:
+                if name not in archive.namelist():
+                    return
+                with archive.open(name) as raw:
+                    yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+
+    @staticmethod
+    def _seconds(hms):
+        hours, minutes, seconds = hms.strip().split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+    def import_feed(self, feed):
+        """Replaces the stored schedule with a GTFS feed (zip or folder). Returns the number of stop times."""
+        db = self._db()
+        with self.lock:
+            for table in ("meta", "stops", "trips", "services", "calendar", "calendar_dates", "stop_times"):
+                db.execute(f"DELETE FROM {table}")
+            db.execute("DROP INDEX IF EXISTS stop_times_by_stop")
+            timezone_name = next((row.get("agency_timezone") for row in self._rows(feed, "agency.txt")),
+                                 None) or LOCAL_TIMEZONE_NAME
+            db.execute("INSERT INTO meta VALUES ('timezone', ?)", (timezone_name,))
+            # ids become small integers so the big stop_times table only stores numbers
+            stops = {}
+            for row in self._rows(feed, "stops.txt"):
+                stops.setdefault(row["stop_id"], len(stops))
+            db.executemany("INSERT INTO stops VALUES (?, ?, ?, ?, ?)",
+                           ((stops[row["stop_id"]], row["stop_id"], row.get("stop_name"), float(row["stop_lat"]),
+                             float(row["stop_lon"]))
+                            for row in self._rows(feed, "stops.txt") if row.get("stop_lat")))
+            services = {}
+            def service(service_id):
+                return services.setdefault(service_id, len(services))
+            route_names = {row["route_id"]: row.get("route_short_name") or row.get("route_long_name") or "Unknown"
+                           for row in self._rows(feed, "routes.txt")}
+            trips = {}
+            trip_rows = []
+            for row in self._rows(feed, "trips.txt"):
+                trips[row["trip_id"]] = len(trips)
+                trip_rows.append((trips[row["trip_id"]], service(row["service_id"]),
+                                  route_names.get(row["route_id"], "Unknown"), row.get("trip_headsign")))
+            db.executemany("INSERT INTO trips VALUES (?, ?, ?, ?)", trip_rows)
+            db.executemany("INSERT INTO calendar VALUES (?, ?, ?, ?)",
+                           ((service(row["service_id"]),
+                             sum(1 << day for day, name in enumerate(("monday", "tuesday", "wednesday", "thursday",
+                                                                      "friday", "saturday", "sunday"))
+                                 if row.get(name) == "1"),
+                             int(row["start_date"]), int(row["end_date"]))
+                            for row in self._rows(feed, "calendar.txt")))
+            db.executemany("INSERT INTO calendar_dates VALUES (?, ?, ?)",
+                           ((service(row["service_id"]), int(row["date"]), row["exception_type"] == "1")
+                            for row in self._rows(feed, "calendar_dates.txt")))
+            db.executemany("INSERT INTO services VALUES (?, ?)", ((number, name) for name, number in services.items()))
+
+            count = 0
+            def stop_times():
+                nonlocal count
+                for row in self._rows(feed, "stop_times.txt"):
+                    hms = row.get("departure_time") or row.get("arrival_time")
+                    if hms and row["trip_id"] in trips and row["stop_id"] in stops:
+                        count += 1
+                        yield stops[row["stop_id"]], self._seconds(hms), trips[row["trip_id"]]
+            db.executemany("INSERT INTO stop_times VALUES (?, ?, ?)", stop_times())
+            # built after the load, which is much faster than keeping it up to date row by row
+            db.execute("CREATE INDEX stop_times_by_stop ON stop_times (stop, departure)")
+            db.execute("CREATE INDEX IF NOT EXISTS stops_by_lat ON stops (lat)")
+            db.commit()
+            self.timezone = find_timezone(timezone_name)
+            self.services = {}
+        return count
+
+    def running(self, service_date):
+        """Services running on a date (calendar weekdays plus calendar_dates exceptions). Memoized per date."""
+        services = self.services.get(service_date)
+        if services is None:
+            ymd = int(service_date.strftime("%Y%m%d"))
+            weekday = 1 << service_date.weekday()
+            with self.lock:
+                services = {row[0] for row in self.db.execute(
+                    "SELECT service FROM calendar WHERE start <= ? AND end >= ? AND weekdays & ?", (ymd, ymd, weekday))}
+                for service, added in self.db.execute("SELECT service, added FROM calendar_dates WHERE date = ?",
+                                                      (ymd,)):
+                    (services.add if added else services.discard)(service)
+            self.services[service_date] = services
+        return services
+
+    def day_start(self, service_date):
+        """Unix time of "noon minus 12h" on a service date, what GTFS departure seconds count from."""
+        noon = datetime(service_date.year, service_date.month, service_date.day, 12, tzinfo=self.timezone)
+        return noon.timestamp() - 12 * 3600
+
+    def stop_near(self, lat, lon, max_meters=40):
+        """GTFS stop_id of the feed stop closest to a point (e.g. a stop the API gave us), or None."""
+        if not self.available():
+            return None
+        span = max_meters / 111320
+        with self.lock:
+            rows = self.db.execute("SELECT stop_id, lat, lon FROM stops WHERE lat BETWEEN ? AND ?",
+                                   (lat - span, lat + span)).fetchall()
+        best = min(((StopIndex.meters_between(lat, lon, row[1], row[2]), row[0]) for row in rows), default=None)
+        return best[1] if best and best[0] <= max_meters else None
+
+    def next_departures(self, stop_id, after=None, limit=10):
+        """The next limit departures at a stop after a unix time, as [(departure_time, route_name, headsign)]."""
+        if not self.available():
+            return []
+        after = time.time() if after is None else after
+        local_date = datetime.fromtimestamp(after, self.timezone).date()
+        found = []
+        # yesterday's service day is still running for trips scheduled past midnight (25:10:00 and so on)
+        for service_date in (local_date - timedelta(days=1), local_date):
+            services = self.running(service_date)
+            if not services:
+                continue
+            start = self.day_start(service_date)
+            marks = ",".join("?" * len(services))
+            with self.lock:
+                rows = self.db.execute(f"""SELECT st.departure, t.route_name, t.headsign FROM stop_times st
+                                           JOIN trips t ON t.trip = st.trip
+                                           WHERE st.stop = (SELECT stop FROM stops WHERE stop_id = ?)
+                                                 AND st.departure >= ? AND t.service IN ({marks})
+                                           ORDER BY st.departure LIMIT ?""",
+                                       (stop_id, math.ceil(after - start), *services, limit)).fetchall()
+            found.extend((int(start) + departure, route_name, headsign) for departure, route_name, headsign in rows)
+        found.sort()
+        return found[:limit]
+
+    def routes_at(self, lat, lon, after=None, limit=200):
+        """Scheduled Routes for the feed stop at a point, shaped like a nearby_routes answer for that stop."""
+        stop_id = self.stop_near(lat, lon)
+        if stop_id is None:
+            return []
+        itineraries = {} # (route, headsign) -> departure times
+        for departure_time, route_name, headsign in self.next_departures(stop_id, after, limit):
+            itineraries.setdefault((route_name, headsign), []).append(departure_time)
+        routes = {}
+        for (route_name, headsign), times in itineraries.items():
+            routes.setdefault(route_name, []).append(Itinerary(stop_id, tuple(times), headsign=headsign or ""))
+        return [Route(route_name, tuple(route_itineraries)) for route_name, route_itineraries in routes.items()]
+
+_schedule = None
+
+def schedule():
+    """Shared GtfsSchedule backed by schedule.db."""
+    global _schedule
+    if _schedule is None:
+        _schedule = GtfsSchedule("schedule.db")
+    return _schedule
+
+# the live answer is the truth wherever it has something to say: a route it returns replaces that route's
+# scheduled times (realtime already folds in delays), routes it doesn't mention keep their scheduled times,
+# and when the API failed or returned nothing the whole answer is the schedule.
+def overlay_realtime(scheduled, live):
+    """Scheduled Routes with every route the live answer covers replaced by its live version."""
+    if not live:
+        return scheduled
+    live_names = {route.route_short_name for route in live}
+    return list(live) + [route for route in scheduled if route.route_short_name not in live_names]
+
+def routes_with_schedule(stop_lat, stop_lon, live):
+    """Live Routes for a stop, filled in (or replaced, if live came back empty) from the imported schedule."""
+    if not schedule().available():
+        return live
+    with metrics.span("schedule"):
+        scheduled = schedule().routes_at(stop_lat, stop_lon)
+    return overlay_realtime(scheduled, live)
+
+###############################################     DEPARTURES     ###############################################
+
+# itineraries keep their times sorted, so a direction's next departure is just its first entry.
+def next_departures(routes):
+    """Yields a Departure for the next departure of every route direction that has one."""
+    for route in routes:
+        for itinerary in route.itineraries:
+            if itinerary.departure_times:
+                yield Departure(itinerary.departure_times[0], route.label(itinerary), route.key(itinerary))
+
+# the display only goes down to the minute, and busy stops have lots of departures in the same few minutes, so
+# the date and time strings are worked out once per minute and reused. converting through find_timezone() (not a
+# fixed -4h) keeps them right on both sides of a DST change, matching the countdowns, which use unix time.
+@functools.lru_cache(maxsize=4096)
+def minute_strings(minute):
+    """(date, time) strings like ("March 08", "01:59 AM") for a unix minute (unix time // 60)."""
+    local = datetime.fromtimestamp(minute * 60, find_timezone())
+    return local.strftime('%B %d'), local.strftime('%I:%M %p')
+
+def format_departure(departure_time, route_name):
+    """One line of the departures list."""
+    formatted_date, formatted_time = minute_strings(int(departure_time) // 60)
+    return f"{formatted_date} | Route {route_name} | Next Departure: {formatted_time}"
+
+def format_departures(rows):
+    """Lines for a whole list of Departures at once, each distinct minute converted only once."""
+    minutes = {}
+    lines = []
+    for departure_time, route_name, *_ in rows:
+        minute = int(departure_time) // 60
+        strings = minutes.get(minute)
+        if strings is None:
+            strings = minutes[minute] = minute_strings(minute)
+        lines.append(f"{strings[0]} | Route {route_name} | Next Departure: {strings[1]}")
+    return lines
+
+# only the soonest few departures are ever on screen, so those are kept in a bounded heap while the payload is
+# walked and everything else is only sorted and turned into text if someone opens "View All Departures".
+class DepartureExtractor:
+    """Next departure per route direction from a nearby_routes payload, with the top N kept sorted and the rest lazy."""
+
+    def __init__(self, routes, top_n=3):
+        self.routes = routes # the full list is walked again only if someone asks for it
+        self.count = 0 # route directions with a next departure
+        # the top_n soonest rows, negated so the latest of them sits on top. on a tie the later row is the one
+        # evicted, so the top rows are always the start of all_rows(), whose sort keeps payload order for ties
+        heap = []
+        for row in next_departures(routes):
+            departure_time = row.departure_time
+            self.count += 1
+            if len(heap) < top_n:
+                heapq.heappush(heap, (-departure_time, -self.count, row))
+            elif heap and departure_time < -heap[0][0]:
+                heapq.heapreplace(heap, (-departure_time, -self.count, row))
+        self.top = [row for _, _, row in sorted(heap, reverse=True)]
+        self._sorted = None
+
+    def __bool__(self):
+        return self.count > 0
+
+    @property
+    def soonest(self):
+        """Unix time of the very next departure, or None."""
+        return self.top[0][0] if self.top else None
+
+    def top_lines(self):
+        """Formatted lines for the soonest departures."""
+        return format_departures(self.top)
+
+    def all_rows(self):
+        """Every route's next departure, soonest first. Sorted the first time it is asked for."""
+        if self._sorted is None:
+            self._sorted = sorted(next_departures(self.routes), key=lambda row: row[0])
+        return self._sorted
+
+    def all_lines(self):
+        """Formatted lines for every departure."""
+        return format_departures(self.all_rows())
+
 ############################################     DISTANCE CALCULATION     ############################################
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculates the distance between two locations/between user and stop location."""
     loc1 = (lat1, lon1)
     loc2 = (lat2, lon2)
-    meters = geodesic(loc1, loc2).meters
+    meters = geopy_distance.geodesic(loc1, loc2).meters
     feet = meters * 3.28084
     return meters, feet
 
+EARTH_RADIUS_METERS = 6371008.8 # mean earth radius
+
+# same idea as calculate_distance but for whole arrays of points at once, for ranking lots of stops.
+# "haversine" is great-circle (within ~0.5% of geodesic), "equirectangular" is a flat approximation that is
+# even cheaper and fine for the few km we deal with, and "geodesic" loops geopy for exact display values.
+def batch_distances(origins, destinations, mode="haversine"):
+    """Distances between (n, 2) lat/lon arrays (either side may be a single point). Returns (meters, feet)."""
+    origins = np.asarray(origins, dtype=float)
+    destinations = np.asarray(destinations, dtype=float)
+    origins, destinations = np.broadcast_arrays(origins, destinations)
+    lat1, lon1 = origins[..., 0], origins[..., 1]
+    lat2, lon2 = destinations[..., 0], destinations[..., 1]
+
+    if mode == "geodesic":
+        meters = np.fromiter((geopy_distance.geodesic((a, b), (c, d)).meters
+                              for a, b, c, d in zip(lat1.ravel(), lon1.ravel(), lat2.ravel(), lon2.ravel())),
+                             dtype=float, count=lat1.size).reshape(lat1.shape)
+    else:
+        phi1, phi2 = np.radians(lat1), np.radians(lat2)
+        d_phi = phi2 - phi1
+        d_lambda = np.radians(lon2 - lon1)
+        if mode == "haversine":
+            h = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+            meters = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+        elif mode == "equirectangular":
+            x = d_lambda * np.cos((phi1 + phi2) / 2)
+            meters = EARTH_RADIUS_METERS * np.hypot(x, d_phi)
+        else:
+            raise ValueError(f"Unknown distance mode: {mode}")
+    return meters, meters * 3.28084
+
+#############################################     LOOKUP PIPELINE     #############################################
+
+# when True, nearby_routes is asked at the user's own coordinates at the same time as nearby_stops and the
+# results are joined by stop id, instead of waiting for the stop before asking for its routes.
+PARALLEL_LOOKUP = True
+
+_parallel_pool = None
+
+def parallel_pool():
+    """Returns the shared thread pool used to fire API calls side by side."""
+    global _parallel_pool
+    if _parallel_pool is None:
+        _parallel_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="parallel")
+    return _parallel_pool
+
+def carry_report(func, abandoned=None):
+    """Wraps func so that, run on another pool thread, it still belongs to this thread's lookup job: rate limit
+    waits are reported to it, and it stops before sending requests once the job (or the abandoned event) is."""
+    report = getattr(_job_context, "report", None)
+    job = getattr(_job_context, "cancelled", None)
+
+    def cancelled():
+        return (job is not None and job()) or (abandoned is not None and abandoned.is_set())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _job_context.report, _job_context.cancelled = report, cancelled
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _job_context.report = _job_context.cancelled = None
+    return wrapper
+
+# runs every step of a search in order. report(stage, value) is called as soon as each step is done so the GUI
+# can show partial results, and cancelled() is checked between steps so a newer search can stop an older one.
+# the "stop" stage carries the closest Stop (or None, or an error string).
+@traced("search")
+def run_lookup(location, report=None, cancelled=None):
+    """Geocodes a place, finds the closest stop and its routes, reporting each stage as it finishes."""
+    report = report or (lambda stage, value: None)
+    cancelled = cancelled or (lambda: False)
+    result = {"coords": None, "stop": None, "routes": []}
+
+    result["coords"] = get_coordinates(location)
+    report("coords", result["coords"])
+    if not result["coords"] or cancelled():
+        return result
+
+    user_lat, user_lon = result["coords"]
+    if PARALLEL_LOOKUP:
+        return _parallel_lookup(user_lat, user_lon, result, report, cancelled)
+
+    stop = result["stop"] = find_closest_stop(user_lat, user_lon)
+    report("stop", stop)
+    if not stop or isinstance(stop, str) or cancelled():
+        return result
+
+    routes = get_routes_at_stop(stop.stop_lat, stop.stop_lon)
+    result["routes"] = routes_with_schedule(stop.stop_lat, stop.stop_lon, routes)
+    report("routes", result["routes"])
+    return result
+
+def _parallel_lookup(user_lat, user_lon, result, report, cancelled):
+    if stop_index().empty(user_lat, user_lon, max_distance()):
+        # the index knows there is no stop here, so don't spend a routes call finding that out
+        report("stop", None)
+        return result
+    # both requests go out together, so a search costs one round-trip instead of two stacked ones.
+    # if the stop lookup comes to nothing, abandoned stops the routes call before it is sent (or drops it queued)
+    abandoned = threading.Event()
+    routes_future = parallel_pool().submit(carry_report(get_routes_at_stop, abandoned), user_lat, user_lon)
+    stop = find_closest_stop(user_lat, user_lon)
+    if isinstance(stop, str) or not stop or cancelled():
+        abandoned.set()
+        routes_future.cancel()
+        result["stop"] = stop
+        report("stop", result["stop"])
+        return result
+
+    result["stop"] = stop # the Stop itself, so the GUI can refresh it by its id later
+    report("stop", stop)
+    if schedule().available() and not routes_future.done():
+        # the timetable answers in a few ms, so show it while the live call is still out
+        report("routes", routes_with_schedule(stop.stop_lat, stop.stop_lon, []))
+
+    routes = routes_for_stop(routes_future.result(), stop.global_stop_id)
+    if not routes and not cancelled():
+        # nothing joined (ids missing or the stop isn't anyone's closest stop), so ask at the stop like before
+        routes = get_routes_at_stop(stop.stop_lat, stop.stop_lon)
+    result["routes"] = routes_with_schedule(stop.stop_lat, stop.stop_lon, routes)
+    report("routes", result["routes"])
+    return result
+
+# realtime refresh for a stop we already found: one nearby_routes call at the stop, no geocode or stop lookup.
+def refresh_routes(stop_lat, stop_lon, stop_id=None):
+    """Fresh routes for a known stop, joined on its id when we have one."""
+    routes = get_routes_at_stop(stop_lat, stop_lon, use_cache=False)
+    if stop_id:
+        routes = routes_for_stop(routes, stop_id) or routes
+    return routes_with_schedule(stop_lat, stop_lon, routes)
+
+# background engine for the GUI. Jobs run on a small thread pool and everything they report is put on a queue
+# that the Tk thread drains with root.after, since Tk widgets must only be touched from the main thread.
+class LookupEngine:
+    """Runs lookup jobs on worker threads and hands their results back to Tk through root.after."""
+
+    def __init__(self, root, workers=3, poll_ms=50):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lookup")
+        self.results = queue.Queue()
+        self.poll_ms = poll_ms
+        self.generations = {} # channel -> id of the newest job, older jobs on that channel are stale
+        self.lock = threading.Lock()
+        self._poll_job = None
+        self._running = 0
+
+    def submit(self, channel, job, on_stage):
+        """Starts job(report, cancelled) on a worker, superseding any older job on the same channel."""
+        with self.lock:
+            generation = self.generations.get(channel, 0) + 1
+            self.generations[channel] = generation
+            self._running += 1
+
+        def cancelled():
+            return self.generations.get(channel) != generation
+
+        def report(stage, value):
+            if not cancelled():
+                self.results.put((channel, generation, on_stage, stage, value))
+
+        def worker():
+            _job_context.report, _job_context.cancelled = report, cancelled
+            try:
+                job(report, cancelled)
+            except (Exception, SystemExit) as e: # SystemExit too, or a stray exit() would leave the GUI waiting
+                report("error", e)
+            finally:
+                _job_context.report = _job_context.cancelled = None
+                self.results.put((channel, generation, None, "done", None))
+
+        self.executor.submit(worker)
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._drain)
+        return generation
+
+    def cancel(self, channel):
+        """Marks whatever is running on a channel as stale so its results are dropped."""
+        with self.lock:
+            self.generations[channel] = self.generations.get(channel, 0) + 1
+
+    def _drain(self):
+        # runs on the Tk thread. results from jobs that were superseded while queued are thrown away here.
+        self._poll_job = None
+        try:
+            while True:
+                try:
+                    channel, generation, on_stage, stage, value = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if stage == "done":
+                    self._running -= 1
+                elif self.generations.get(channel) == generation:
+                    try:
+                        on_stage(stage, value)
+                    except Exception as e: # one bad handler mustn't stop the queue, or every later result is lost
+                        metrics.error(channel, f"[GUI Error] {channel} {stage}: {e}")
+        finally:
+            # re-armed no matter what, otherwise the GUI stops hearing from its workers for good
+            if self._running > 0:
+                self._poll_job = self.root.after(self.poll_ms, self._drain)
+
+    def shutdown(self):
+        """Drops pending jobs and stops the worker threads without waiting on in-flight requests."""
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+        for channel in list(self.generations):
+            self.cancel(channel)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+################################################   RADIUS SEARCH   ################################################
+
+# the sliding-bar idea from up top: every stop inside a circle around the user, ranked by how soon you could
+# actually be on a bus from it (walk there, then wait for the first departure you can still catch).
+RADIUS_CHOICES = (100, 1500) # smallest/largest radius (m) the slider offers, the API caps max_distance at 1500
+WALK_SPEED = 1.3 # m/s, a relaxed walking pace
+WALK_DETOUR = 1.25 # streets are rarely a straight line
+
+def fetch_radius(lat, lon, radius):
+    """Every stop within radius of a point and the routes serving them, fetched side by side."""
+    routes_future = parallel_pool().submit(carry_report(get_routes_at_stop), lat, lon, True, radius)
+    stops = get_nearby_stop_list(lat, lon, radius=radius)
+    return {"lat": lat, "lon": lon, "radius": radius, "stops": stops, "routes": routes_future.result()}
+
+def run_radius_lookup(location, radius, report=None, cancelled=None):
+    """Geocodes a place then fetches every stop within radius, reporting each stage like run_lookup."""
+    report = report or (lambda stage, value: None)
+    cancelled = cancelled or (lambda: False)
+    coords = get_coordinates(location)
+    report("coords", coords)
+    if not coords or cancelled():
+        return None
+    result = fetch_radius(coords[0], coords[1], radius)
+    report("radius", result)
+    return result
+
+# an itinerary's times are the ones at its closest stop. other stops it serves inside the circle are only a
+# minute or two along the line, so they get the same times rather than looking like they have no buses at all.
+def departures_by_stop(routes):
+    """{stop id: sorted [Departure, ...]} from a list of Routes, joined on every stop each itinerary serves."""
+    by_stop = {}
+    for route in routes:
+        for itinerary in route.itineraries:
+            departures = [Departure(ts, route.label(itinerary), route.key(itinerary)) for ts in itinerary.departure_times]
+            for stop_id in itinerary.serves():
+                by_stop.setdefault(stop_id, []).extend(departures)
+    for departures in by_stop.values():
+        departures.sort()
+    return by_stop
+
+def rank_stops_for_trip(lat, lon, stops, routes, radius=None, now=None):
+    """Stops within radius ranked by walk time plus wait for the first departure catchable after walking there."""
+    now = time.time() if now is None else now
+    if not stops:
+        return []
+    try:
+        meters = batch_distances((lat, lon), [(stop.stop_lat, stop.stop_lon) for stop in stops])[0].tolist()
+    except ImportError:
+        # numpy isn't installed. a radius search only measures a few dozen stops, one at a time is fine
+        meters = [StopIndex.meters_between(lat, lon, stop.stop_lat, stop.stop_lon) for stop in stops]
+    by_stop = departures_by_stop(routes)
+    ranked = []
+    for stop, straight in zip(stops, meters):
+        if radius is not None and straight > radius:
+            continue
+        walk_m = straight * WALK_DETOUR
+        arrive = now + walk_m / WALK_SPEED
+        departures = by_stop.get(stop.global_stop_id, [])
+        catchable = bisect.bisect_left(departures, (arrive,))
+        departure = departures[catchable] if catchable < len(departures) else None
+        ranked.append({"stop": stop, "meters": straight, "walk_s": arrive - now, "departure": departure,
+                       # stops with nothing to catch go last, closest first among them
+                       "score": departure[0] - now if departure else float("inf")})
+    ranked.sort(key=lambda row: (row["score"], row["meters"]))
+    return ranked
+
+# markers close together on screen are merged so zoomed-out maps with lots of stops stay fast to draw.
+# points are bucketed by screen pixel (web mercator at the current zoom) into cell_px squares.
+def cluster_points(points, zoom, cell_px=60, max_cluster_zoom=16):
+    """Groups (lat, lon, item) points into [(lat, lon, [items])] clusters for a zoom level."""
+    if zoom > max_cluster_zoom:
+        return [(lat, lon, [item]) for lat, lon, item in points]
+    cells = {}
+    for lat, lon, item in points:
+        x, y = lat_lon_to_tile(lat, lon, round(zoom))
+        cells.setdefault((int(x * 256 // cell_px), int(y * 256 // cell_px)), []).append((lat, lon, item))
+    clusters = []
+    for members in cells.values():
+        clusters.append((sum(member[0] for member in members) / len(members),
+                         sum(member[1] for member in members) / len(members),
+                         [member[2] for member in members]))
+    return clusters
+
+def circle_points(lat, lon, radius, sides=48):
+    """Polygon points approximating a circle of radius meters, for drawing the search radius."""
+    points = []
+    for i in range(sides):
+        angle = 2 * math.pi * i / sides
+        points.append((lat + radius * math.cos(angle) / 111320,
+                       lon + radius * math.sin(angle) / (111320 * math.cos(math.radians(lat)))))
+    return points
+
+#################################################   BATCH MODE   #################################################
+
+# the same lookups as the GUI, without Tk, for running lots of addresses (e.g. for shift planning).
+def lookup_address(address, departures=3):
+    """Nearest stop and next departures for one address, as a JSON-friendly dict."""
+    result = run_lookup(address)
+    record = {"address": address, "lat": None, "lon": None, "stop": None, "departures": [], "error": None}
+    if not result["coords"]:
+        # Nominatim's "not found" is cached, a timeout or refused request isn't and is worth asking again
+        record["error"] = "Invalid location." if geocode_cache.get(address)[0] else "[Geolocation Error] no answer"
+        return record
+    record["lat"], record["lon"] = result["coords"]
+    stop = result["stop"]
+    if not stop or isinstance(stop, str):
+        record["error"] = stop or "No nearby bus stops found."
+        return record
+    distance_meters, _ = calculate_distance(record["lat"], record["lon"], stop.stop_lat, stop.stop_lon)
+    record["stop"] = {"name": stop.stop_name, "lat": stop.stop_lat, "lon": stop.stop_lon,
+                      "distance_m": round(distance_meters, 2)}
+    with metrics.span("departures"):
+        extractor = DepartureExtractor(result["routes"], top_n=departures)
+    record["departures"] = [{"route": departure.route_name, "departure_time": departure.departure_time}
+                            for departure in extractor.top]
+    if not extractor:
+        record["error"] = "No departures found."
+    return record
+
+def read_addresses(path):
+    """Yields (id, address) from a CSV (with an "address" column) or JSONL file. "-" reads JSONL from stdin."""
+    if path == "-" or path.endswith((".jsonl", ".json")):
+        file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    row = json.loads(line)
+                    yield str(row.get("id", line_number)), row["address"]
+        finally:
+            if file is not sys.stdin:
+                file.close()
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            for line_number, row in enumerate(csv.DictReader(file), 1):
+                yield str(row.get("id") or line_number), row["address"]
+
+# answers that asking again won't change. anything else (an API status code, a timeout, a lookup that raised) is
+# redone on the next run, and so is "No departures found.", since a failed routes call looks just the same.
+FINAL_ERRORS = (None, "Invalid location.", "No nearby bus stops found.")
+
+def finished_ids(out_path):
+    """Ids already answered for good in an output file, so a stopped run can pick up where it left off."""
+    done = set()
+    try:
+        with open(out_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    if record.get("error") in FINAL_ERRORS:
+                        done.add(str(record["id"]))
+                except (ValueError, KeyError, AttributeError):
+                    pass # a line cut off when the last run was killed, it gets redone
+    except FileNotFoundError:
+        pass
+    return done
+
+# every finished address is appended to the output straight away, so the output file is also the checkpoint.
+# addresses that failed are written too and looked up again on a resumed run, the later line for an id wins.
+# at most workers * 2 addresses are in flight, and the shared rate limiters keep us inside the API quotas.
+def run_batch(in_path, out_path, workers=4, departures=3):
+    """Looks up every address in in_path on a bounded worker pool, streaming JSONL results to out_path."""
+    done = finished_ids(out_path) if out_path != "-" else set()
+    out = sys.stdout if out_path == "-" else open(out_path, "a+", encoding="utf-8")
+    if out is not sys.stdout and out.tell() > 0:
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n") # finish off a line cut short by a killed run so the next record starts clean
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+    counts = {"done": 0, "skipped": 0}
+
+    def work(row_id, address):
+        try:
+            record = lookup_address(address, departures)
+        except Exception as e:
+            record = {"address": address, "error": f"[Lookup Error] {e}"}
+        finally:
+            slots.release()
+        record = {"id": row_id, **record}
+        with write_lock:
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            counts["done"] += 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            for row_id, address in read_addresses(in_path):
+                if row_id in done:
+                    counts["skipped"] += 1
+                    continue
+                slots.acquire()
+                pool.submit(work, row_id, address)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        metrics.flush()
+    return counts
+
+################################################   SERVER MODE   ################################################
+
+# the lookups as a small local HTTP API, so signage screens can share one process (and one set of caches)
+# instead of each running the Tk app. Connections are handled on an asyncio loop and the blocking lookups run on
+# a thread pool. Identical requests that arrive while one is already running wait on that one ("single-flight"),
+# so N screens polling the same stop cost one upstream call, and the geocode/route caches and stop index are the
+# module level ones the GUI uses. The standard library's asyncio streams are enough here, no aiohttp needed.
+class LookupServer:
+    """Asyncio HTTP service for the lookup pipeline with single-flight request deduplication."""
+
+    def __init__(self, host="127.0.0.1", port=8080, workers=16):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="serve")
+        self.inflight = {} # request key -> future of the call everyone with that key is waiting on
+        self.calls = 0 # lookups actually run
+        self.joined = 0 # requests answered by someone else's lookup
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.handlers = {"/geocode": self.on_geocode,
+                         "/stop": self.on_stop,
+                         "/routes": self.on_routes,
+                         "/lookup": self.on_lookup,
+                         "/health": self.on_health,
+                         "/metrics": self.on_metrics}
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def single_flight(self, key, func, *args):
+        """Runs func(*args) on the pool, or waits on the identical call that is already running."""
+        future = self.inflight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+            self.inflight[key] = future
+            future.add_done_callback(lambda done: self.inflight.pop(key) if self.inflight.get(key) is done else None)
+        else:
+            self.joined += 1
+            metrics.count("serve.joined")
+        # shielded so a client hanging up doesn't cancel the call for everyone else waiting on it
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def point(query):
+        # rounded so screens a few cm apart share a key, ~1 m at 5 decimals
+        return round(float(query["lat"]), 5), round(float(query["lon"]), 5)
+
+    async def on_geocode(self, query):
+        place = query["q"]
+        coords = await self.single_flight(("geocode", GeocodeCache.normalize(place)), get_coordinates, place)
+        if not coords:
+            return 404, {"error": "Invalid location."}
+        return 200, {"lat": coords[0], "lon": coords[1]}
+
+    async def on_stop(self, query):
+        lat, lon = self.point(query)
+        stop = await self.single_flight(("stop", lat, lon), get_nearby_bus_stops, lat, lon)
+        if not stop or isinstance(stop, str):
+            return 404, {"error": stop or "No nearby bus stops found."}
+        stop_lat, stop_lon, stop_name = stop
+        return 200, {"name": stop_name, "lat": stop_lat, "lon": stop_lon}
+
+    async def on_routes(self, query):
+        lat, lon = self.point(query)
+        routes = await self.single_flight(("routes", lat, lon), get_routes_at_stop, lat, lon)
+        return 200, {"routes": [route.to_json() for route in routes]}
+
+    async def on_lookup(self, query):
+        address = query["q"]
+        departures = int(query.get("departures", 3))
+        key = ("lookup", GeocodeCache.normalize(address), departures)
+        record = await self.single_flight(key, lookup_address, address, departures)
+        return (200 if not record["error"] else 404), record
+
+    async def on_health(self, query):
+        return 200, {"ok": True, "calls": self.calls, "joined": self.joined, "inflight": len(self.inflight)}
+
+    async def on_metrics(self, query):
+        return 200, metrics.prometheus_text()
+
+    async def respond(self, method, target):
+        """(status, body) for one request. dict bodies are sent as JSON, strings as plain text."""
+        parts = urlsplit(target)
+        handler = self.handlers.get(parts.path.rstrip("/") or "/")
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+        if handler is None:
+            return 404, {"error": f"unknown endpoint {parts.path}"}
+        try:
+            with metrics.span(f"serve{parts.path}"):
+                return await handler(dict(parse_qsl(parts.query)))
+        except (KeyError, ValueError) as e:
+            return 400, {"error": f"bad or missing parameter: {e}"}
+        except Exception as e:
+            metrics.error("serve", f"[Server Error] {e}")
+            return 500, {"error": str(e)}
+
+    @staticmethod
+    async def read_head(reader):
+        """(request line, headers) of the next request, or (None, None) once the client is done sending."""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None, None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return request_line, headers
+
+    @staticmethod
+    async def send(writer, status, body, keep_alive):
+        if isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            payload, content_type = json.dumps(body).encode("utf-8"), "application/json"
+        writer.write((f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(payload)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1")
+                     + payload)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        # a tiny HTTP/1.1 loop: request line, headers, no bodies, keep-alive unless asked to close
+        try:
+            while True:
+                try:
+                    request_line, headers = await self.read_head(reader)
+                except ValueError: # a line longer than the stream limit (64 KB), the rest of it can't be trusted
+                    await self.send(writer, 400, {"error": "request line or header too long"}, keep_alive=False)
+                    break
+                if request_line is None:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    status, body = await self.respond(method, target)
+                except ValueError:
+                    version, status, body = "HTTP/1.0", 400, {"error": "malformed request line"}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.send(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass # client went away, or the server is shutting down around an idle keep-alive connection
+        finally:
+            writer.close()
+
+    async def _serve(self, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1] # port=0 picks a free one
+        if ready is not None:
+            ready.set()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def serve_forever(self):
+        """Runs the server on this thread until interrupted."""
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def start(self):
+        """Serves on a background thread (for tests and benchmarks)."""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve(ready)), daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.thread.join(timeout=5)
+        self.executor.shutdown(wait=False)
+
+#################################################   COUNTDOWNS   #################################################
+
+# how long until a departure, and how many seconds until that text would read differently. under an hour it
+# counts every second; further out it only shows hours and minutes so it only has to change once a minute.
+def countdown_text(departure_time, now=None):
+    """("HH:MM:SS" / "H hr M min" left, or None once it has left) and the seconds until the text changes."""
+    remaining = departure_time - (time.time() if now is None else now)
+    if remaining <= 0:
+        return None, None
+    if remaining < 3600:
+        mins, secs = divmod(int(remaining), 60)
+        return f"00:{mins:02}:{secs:02}", remaining - int(remaining) or 1.0
+    hours, mins = divmod(int(remaining // 60), 60)
+    return f"{hours} hr {mins:02} min", remaining - (remaining // 60) * 60 or 60.0
+
+# one timer for every countdown on screen. each tracked departure has a widget and a function that turns the
+# countdown_text into the widget's text. the next tick is scheduled for when the soonest-changing text changes,
+# and widgets are only touched when their text is actually different.
+class CountdownScheduler:
+    """Drives all on-screen countdowns from a single adaptive root.after timer."""
+
+    def __init__(self, root):
+        self.root = root
+        self.targets = {} # key -> [widget, departure_time, make_text, last_text]
+        self._job = None
+
+    def track(self, key, widget, departure_time, make_text):
+        """Starts (or retargets) the countdown shown in widget. make_text(countdown or None) -> label text."""
+        self.targets[key] = [widget, departure_time, make_text, None]
+        self._reschedule(0)
+
+    def untrack(self, key_or_prefix):
+        """Stops every countdown whose key starts with key_or_prefix."""
+        for key in [key for key in self.targets if key.startswith(key_or_prefix)]:
+            del self.targets[key]
+        if not self.targets:
+            self._cancel()
+
+    def _cancel(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _reschedule(self, delay_seconds):
+        self._cancel()
+        # land just after the change so int() rounding has already moved on
+        self._job = self.root.after(max(20, int(delay_seconds * 1000) + 20), self._tick)
+
+    def _tick(self):
+        self._job = None
+        now = time.time()
+        soonest_change = None
+        for key, target in list(self.targets.items()):
+            widget, departure_time, make_text, last_text = target
+            remaining, change_in = countdown_text(departure_time, now)
+            text = make_text(remaining)
+            try:
+                if text != last_text:
+                    widget.config(text=text)
+                    target[3] = text
+            except tk.TclError: # the widget was destroyed (window closed)
+                del self.targets[key]
+                continue
+            if change_in is None:
+                del self.targets[key] # already left, nothing more to count
+            elif soonest_change is None or change_in < soonest_change:
+                soonest_change = change_in
+        if soonest_change is not None:
+            self._reschedule(soonest_change)
+
+# what moved between two polls of the same stop, keyed by route direction so only those rows get touched.
+def departure_changes(old, new):
+    """({route key: new Departure} for added/moved directions, [keys that dropped out]) between two extractors."""
+    before = {row.route_key: row for row in old.all_rows()} if old else {}
+    after = {row.route_key: row for row in new.all_rows()}
+    changed = {key: row for key, row in after.items() if before.get(key) != row}
+    removed = [key for key in before if key not in after]
+    return changed, removed
+
+# keeps the selected stop's departures live. Polls go through the LookupEngine "refresh" channel every interval
+# seconds while someone is using the window, doubling up to max_interval while it is idle, minimized or failing.
+class RealtimeRefresher:
+    """Re-polls nearby_routes for the selected stop, backing off while nobody is looking."""
+
+    def __init__(self, root, lookup, on_routes, interval=30, idle_after=120, max_interval=300):
+        self.root = root
+        self.lookup = lookup
+        self.on_routes = on_routes
+        self.interval = interval
+        self.idle_after = idle_after
+        self.max_interval = max_interval
+        self.stop = None # (lat, lon, stop id) being refreshed
+        self.delay = interval
+        self.last_activity = time.time()
+        self._job = None
+
+    def start(self, stop_lat, stop_lon, stop_id=None):
+        """Starts refreshing a stop, replacing whatever was being refreshed."""
+        self.cancel()
+        self.stop = (stop_lat, stop_lon, stop_id)
+        self.delay = self.interval
+        self._schedule(self.delay)
+
+    def cancel(self):
+        """Stops refreshing and drops any poll still in flight."""
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        self.lookup.cancel("refresh")
+        self.stop = None
+
+    def touch(self, event=None):
+        """Marks the window as in use. Coming back from idle polls again right away."""
+        self.last_activity = time.time()
+        if self.stop is not None and self.delay > self.interval:
+            self.delay = self.interval
+            self._schedule(0)
+
+    def idle(self):
+        """True when the window is minimized or nobody has touched it for idle_after seconds."""
+        return self.root.state() == "iconic" or time.time() - self.last_activity > self.idle_after
+
+    def _schedule(self, delay_seconds):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+        self._job = self.root.after(int(delay_seconds * 1000), self._poll)
+
+    def _poll(self):
+        self._job = None
+        if self.stop is None:
+            return
+        if self.idle() and self.delay < self.max_interval:
+            # nobody is looking, skip this one and check back later
+            self.delay = min(self.delay * 2, self.max_interval)
+            self._schedule(self.delay)
+            return
+        stop_lat, stop_lon, stop_id = self.stop
+        self.lookup.submit("refresh",
+                           lambda report, cancelled: report("routes", refresh_routes(stop_lat, stop_lon, stop_id)),
+                           self._on_stage)
+
+    def _on_stage(self, stage, value):
+        if stage == "waiting":
+            return # a background refresh waiting on the rate limit is nothing to show
+        if stage == "routes" and value:
+            self.on_routes(value)
+            self.delay = min(self.delay * 2, self.max_interval) if self.idle() else self.interval
+        else:
+            # failed or came back empty, keep what is on screen and wait longer before asking again
+            self.delay = min(self.delay * 2, self.max_interval)
+        self._schedule(self.delay)
+
+################################################   MAP TILE CACHE   ################################################
+
+# Dropdown map list. the first entry is what the map starts on.
+TILE_SERVER_OPTIONS = {
+    "OpenStreetMap ": "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png",
+    "OpenStreetMap": "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png",
+    "Memo Maps": "https://tileserver.memomaps.de/tilegen/{z}/{x}/{y}.png",
+    "Google Maps - Roadmap": "https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
+    "Google Maps - Hybrid": "https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
+    "Google Maps - Satellite": "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}"
+}
+
+def tile_server_max_zoom(server):
+    """Deepest zoom a tile server draws: 22 for Google and Memo Maps, otherwise OSM's (and the map widget's) 19."""
+    return 22 if "google.com" in server or "memomaps" in server else 19
+
+# bulk downloading ahead of the user is against OSM's tile usage policy (and Google's terms), so none of the
+# built-in servers are prefetched. add a server here only if you run it or have permission to scrape it.
+# servers on this machine (a self-hosted tile server) are always fine.
+PREFETCH_SERVERS = set()
+
+def tile_prefetch_allowed(server):
+    """True if tiles may be downloaded from server ahead of being drawn."""
+    return server in PREFETCH_SERVERS or urlsplit(server).hostname in ("localhost", "127.0.0.1", "::1")
+
+# a tile whose server sent no Cache-Control max-age or Expires header is downloaded again after this long.
+TILE_DEFAULT_TTL = 7 * 24 * 3600
+
+def tile_expiry(headers, now=None):
+    """Unix time a downloaded tile goes stale, from its Cache-Control max-age or Expires header."""
+    now = time.time() if now is None else now
+    cache_control = headers.get("Cache-Control", "")
+    if re.search(r"\b(no-cache|no-store)\b", cache_control):
+        return now # kept for offline use, but asked for again every time it is drawn
+    max_age = re.search(r"\bmax-age=(\d+)", cache_control)
+    if max_age:
+        return now + int(max_age.group(1))
+    try:
+        return parsedate_to_datetime(headers["Expires"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return now + TILE_DEFAULT_TTL
+
+# every map tile we download is kept in a SQLite file so redraws, restarts and zoom changes come from disk.
+# tiles are namespaced by the tile server URL, so switching maps never shows the wrong tiles, and the least
+# recently used tiles are thrown out once the file grows past max_bytes. each tile keeps the expiry its server's
+# cache headers gave it, and a stale tile is downloaded again (but still shown if that download fails).
+class TileCache:
+    """Size-capped SQLite tile store, one namespace per tile server."""
+
+    def __init__(self, path="tile_cache.db", max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = None
+        self.disk_failed = False
+        self.total_bytes = 0
+        self.pending_touches = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _disk(self):
+        if self.db is None and not self.disk_failed:
+            try:
+                self.db = sqlite3.connect(self.path, check_same_thread=False)
+                self.db.execute("""CREATE TABLE IF NOT EXISTS tiles (
+                                       server TEXT NOT NULL,
+                                       zoom INTEGER NOT NULL,
+                                       x INTEGER NOT NULL,
+                                       y INTEGER NOT NULL,
+                                       image BLOB NOT NULL,
+                                       size INTEGER NOT NULL,
+                                       used REAL NOT NULL,
+                                       expires REAL NOT NULL,
+                                       PRIMARY KEY (server, zoom, x, y))""")
+                self.db.execute("CREATE INDEX IF NOT EXISTS tiles_used ON tiles (used)")
+                self.db.commit()
+                self.total_bytes = self.db.execute("SELECT coalesce(sum(size), 0) FROM tiles").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"[Tile Cache Error] {e}")
+                self.db = None
+                self.disk_failed = True
+        return self.db
+
+    def get(self, server, zoom, x, y):
+        """(cached tile bytes, True if it hasn't expired yet), or None."""
+        with self.lock:
+            db = self._disk()
+            if db is None:
+                return None
+            try:
+                key = (server, zoom, x, y)
+                row = db.execute("SELECT image, expires FROM tiles WHERE server=? AND zoom=? AND x=? AND y=?",
+                                 key).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                db.execute("UPDATE tiles SET used=? WHERE server=? AND zoom=? AND x=? AND y=?", (time.time(), *key))
+                self.pending_touches += 1
+                if self.pending_touches >= 50: # don't pay for a commit on every redraw
+                    db.commit()
+                    self.pending_touches = 0
+                return row[0], row[1] > time.time()
+            except sqlite3.Error as e:
+                print(f"[Tile Cache Error] {e}")
+                return None
+
+    def has(self, server, zoom, x, y):
+        """True if the tile is cached and hasn't expired."""
+        with self.lock:
+            db = self._disk()
+            return db is not None and db.execute("SELECT 1 FROM tiles WHERE server=? AND zoom=? AND x=? AND y=? "
+                                                 "AND expires > ?", (server, zoom, x, y, time.time())).fetchone() is not None
+
+    def put(self, server, zoom, x, y, image, expires):
+        """Stores tile bytes until expires, evicting the least recently used tiles past the size cap."""
+        with self.lock:
+            db = self._disk()
+            if db is None:
+                return
+            try:
+                old = db.execute("SELECT size FROM tiles WHERE server=? AND zoom=? AND x=? AND y=?",
+                                 (server, zoom, x, y)).fetchone()
+                db.execute("INSERT OR REPLACE INTO tiles (server, zoom, x, y, image, size, used, expires) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (server, zoom, x, y, image, len(image), time.time(), expires))
+                self.total_bytes += len(image) - (old[0] if old else 0)
+                if self.total_bytes > self.max_bytes:
+                    # trim down to 90% so we aren't evicting on every single insert
+                    target = self.max_bytes * 0.9
+                    for rowid, size in db.execute("SELECT rowid, size FROM tiles ORDER BY used").fetchall():
+                        if self.total_bytes <= target:
+                            break
+                        db.execute("DELETE FROM tiles WHERE rowid=?", (rowid,))
+                        self.total_bytes -= size
+                db.commit()
+                self.pending_touches = 0
+            except sqlite3.Error as e:
+                print(f"[Tile Cache Error] {e}")
+
+    def stats(self):
+        """Hit/miss counters and size of the cache."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.total_bytes,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_tile_cache = None
+_tile_session = None
+
+def tile_cache():
+    """Returns the shared tile cache."""
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+    return _tile_cache
+
+def fetch_tile(server, zoom, x, y):
+    """Downloads one tile and caches it once it decodes. Returns the PIL image, or None if the server has no tile.
+    A body that doesn't decode (cut off, or an error page) raises and is not cached."""
+    global _tile_session
+    if _tile_session is None:
+        _tile_session = requests.Session()
+        _tile_session.mount("https://", requests_adapters.HTTPAdapter(pool_maxsize=16))
+    url = server.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+    response = _tile_session.get(url, headers={"User-Agent": "TkinterMapView"}, timeout=10)
+    if response.status_code != 200:
+        return None
+    image = PIL_Image.open(io.BytesIO(response.content))
+    image.load() # decodes the whole tile, so a truncated download fails here instead of being stored
+    tile_cache().put(server, zoom, x, y, response.content, tile_expiry(response.headers))
+    return image
+
+def load_tile(server, zoom, x, y):
+    """A tile as a PIL image, from the cache while it is fresh and downloaded otherwise. None if there is no tile."""
+    cached = tile_cache().get(server, zoom, x, y)
+    if cached is not None and cached[1]:
+        return PIL_Image.open(io.BytesIO(cached[0]))
+    try:
+        return fetch_tile(server, zoom, x, y)
+    except Exception:
+        if cached is None:
+            raise
+        return PIL_Image.open(io.BytesIO(cached[0])) # offline or a bad download, the old tile beats a blank one
+
+def import_map_modules(report, cancelled):
+    """LookupEngine job that imports everything the map view needs, so fast start's Tk thread doesn't."""
+    for module in (tkintermapview, PIL_Image, PIL_ImageTk, requests, requests_adapters):
+        module._load()
+    report("ready", None)
+
+# TkinterMapView normally downloads every tile it draws. this version asks the tile cache first.
+# the class is only built the first time a map is made, since building it means importing tkintermapview.
+_cached_map_view = None
+
+def cached_map_view(master):
+    """Makes a TkinterMapView that reads and writes tiles through the shared TileCache."""
+    global _cached_map_view
+    if _cached_map_view is None:
+        class CachedMapView(tkintermapview.TkinterMapView):
+            """TkinterMapView that reads and writes tiles through the shared TileCache."""
+
+            def request_image(self, zoom, x, y, db_cursor=None):
+                if self.overlay_tile_server is not None:
+                    return super().request_image(zoom, x, y, db_cursor)
+                try:
+                    image = load_tile(self.tile_server, zoom, x, y)
+                    if image is None: # the server has no tile for these coordinates
+                        self.tile_image_cache[f"{zoom}{x}{y}"] = self.empty_tile_image
+                        return self.empty_tile_image
+                    if not self.running:
+                        return self.empty_tile_image
+                    image_tk = PIL_ImageTk.PhotoImage(image)
+                    self.tile_image_cache[f"{zoom}{x}{y}"] = image_tk
+                    return image_tk
+                except Exception: # offline or a broken tile, like the base class: blank now, try again next redraw
+                    return self.empty_tile_image
+
+        _cached_map_view = CachedMapView
+    return _cached_map_view(master)
+
+def lat_lon_to_tile(lat, lon, zoom):
+    """Slippy-map tile coordinates (as floats) for a point at a zoom level."""
+    n = 2 ** zoom
+    x = (lon + 180) / 360 * n
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return x, y
+
+# warms the tile cache in the background. a box is walked one zoom level at a time from the lowest zoom up,
+# skipping tiles already on disk, and stops after max_tiles downloads. the whole state at zoom 20 is tens of
+# millions of tiles (and public tile servers forbid bulk scraping), so keep the budget modest.
+class TilePrefetcher:
+    """Background downloader that fills the tile cache for a bounding box over a range of zoom levels."""
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiles")
+        self.generation = 0
+
+    @staticmethod
+    def tiles_in_box(north_west, south_east, zoom):
+        """Every (x, y) tile covering a box at a zoom level."""
+        x1, y1 = lat_lon_to_tile(*north_west, zoom)
+        x2, y2 = lat_lon_to_tile(*south_east, zoom)
+        for x in range(int(math.floor(min(x1, x2))), int(math.floor(max(x1, x2))) + 1):
+            for y in range(int(math.floor(min(y1, y2))), int(math.floor(max(y1, y2))) + 1):
+                yield x, y
+
+    def prefetch(self, server, north_west, south_east, zooms=range(14, 21), max_tiles=2000, supersede=True):
+        """Queues a box for download. A superseding prefetch stops any earlier one that is still running."""
+        if supersede:
+            self.generation += 1
+        generation = self.generation
+        return self.executor.submit(self._run, server, north_west, south_east, zooms, max_tiles, generation)
+
+    def _run(self, server, north_west, south_east, zooms, max_tiles, generation):
+        downloaded = 0
+        for zoom in zooms:
+            if zoom > tile_server_max_zoom(server):
+                break # the server has nothing deeper, every request would be a miss
+            for x, y in self.tiles_in_box(north_west, south_east, zoom):
+                if generation != self.generation or downloaded >= max_tiles:
+                    return downloaded
+                if tile_cache().has(server, zoom, x, y):
+                    continue
+                try:
+                    if fetch_tile(server, zoom, x, y) is None:
+                        continue # the server had no tile here, that is not a download
+                except requests.RequestException as e:
+                    print(f"[Tile Prefetch Error] {e}")
+                    return downloaded
+                except Exception as e: # a tile that didn't decode. it wasn't stored, carry on with the rest
+                    print(f"[Tile Prefetch Error] zoom {zoom} tile {x},{y}: {e}")
+                    continue
+                downloaded += 1
+        return downloaded
+
+    def prefetch_around(self, server, points, margin=0.003, zooms=range(14, 21), max_tiles=400):
+        """Prefetches the box around a few points (the user and their stop) at the zoom ladder's levels."""
+        lats = [lat for lat, _ in points]
+        lons = [lon for _, lon in points]
+        return self.prefetch(server, (max(lats) + margin, min(lons) - margin),
+                             (min(lats) - margin, max(lons) + margin), zooms, max_tiles)
+
+    def shutdown(self):
+        self.generation += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 #################################################     THE GUI     #################################################
 
 class BusStopApp:
-    def __init__(self):
+    # fast_start shows the search bar first and builds the map right after the first frame is on screen.
+    def __init__(self, fast_start=False):
         # Main window parameters
         self.root = tk.Tk()
         self.root.withdraw() # Hide blank GUI (screw Tkinter)
@@ -169,9 +2833,9 @@ class BusStopApp:
 
         # Load the image for window logo
         # We may need to replace .png and/or add .ico file for the windows taskbar on compile
-        imageTransitAppIcon = Image.open("Transit_App_icon.png")
-        set_logo = ImageTk.PhotoImage(imageTransitAppIcon)
-        self.root.iconphoto(False, set_logo)
+        # Tk decodes the PNG itself, so pillow doesn't have to be imported just for the icon
+        self.logo = tk.PhotoImage(file="Transit_App_icon.png")
+        self.root.iconphoto(False, self.logo)
 
 
         # Updated fonts: using Verdana for all text. Larger font (size 14) is used for stop info, distance, departures, and timer.
@@ -197,7 +2861,7 @@ class BusStopApp:
                               highlightbackground="white",
                               highlightcolor="white")
         self.entry.pack(side="left", padx=10, pady=10, ipady=4)
-        self.entry.bind("<Return>", lambda event: self.search_location())
+        self.entry.bind("<Return>", self.on_entry_return)
 
         # Functions to add placeholder to the input field
         def on_entry_click(event):
@@ -211,10 +2875,30 @@ class BusStopApp:
                 self.entry.config(fg='grey')
 
         placeholder = "Enter location..."
+        self.placeholder = placeholder
         self.entry.insert(0, placeholder)
         self.entry.bind('<FocusIn>', on_entry_click)
         self.entry.bind('<FocusOut>', on_focusout)
 
+        # Type-ahead suggestions drop down under the search field (see on_entry_typed)
+        self.suggestions = tk.Listbox(self.root,
+                                      font=("Verdana", 12),
+                                      bg="gray30",
+                                      fg="white",
+                                      selectbackground="gray50",
+                                      highlightthickness=1,
+                                      highlightbackground="white",
+                                      activestyle="none",
+                                      height=5)
+        self.suggestions.bind("<ButtonRelease-1>", self.pick_suggestion)
+        self.suggestions.bind("<Return>", self.pick_suggestion)
+        self.suggestions.bind("<Escape>", lambda event: self.hide_suggestions())
+        self.entry.bind("<KeyRelease>", self.on_entry_typed)
+        self.entry.bind("<Down>", self.focus_suggestions)
+        self.entry.bind("<Escape>", lambda event: self.hide_suggestions())
+        self._suggest_job = None
+        self.suggest_delay_ms = 400 # wait for a pause in typing before asking the suggestion server
+
         # Search button GUI location (unchanged from functionality)
         self.search_button = tk.Button(self.top_frame,
                                        text="Search",
@@ -226,11 +2910,12 @@ class BusStopApp:
         self.search_button.pack(side="left", padx=10, pady=10)
 
         # === Middle Frame: Map ===
-        # Map view configuration
-        self.map = TkinterMapView(self.middle_frame)
-        self.map.pack(fill="both", expand=True, padx=10, pady=10)
-        self.map.set_position(41.6, -72.7)
-        self.map.set_zoom(10)
+        # Map view configuration (see attach_map)
+        self.map = None
+        self.selected_option = None
+        self.fast_start = fast_start
+        if not fast_start:
+            self.attach_map()
 
         # === Bottom Frame: Results & Buttons ===
         # Result Labels GUI location - fonts now use Verdana and font size 14, with white text.
@@ -273,26 +2958,70 @@ class BusStopApp:
                                          command=self.show_all_departures)
         self.view_all_button.pack(side="left", padx=20, pady=10)
 
+        # per-stage timings, cache hit rates and API usage
+        self.diagnostics_button = tk.Button(self.bottom_frame,
+                                            text="Diagnostics",
+                                            bg='gray25',
+                                            fg='white',
+                                            font='Verdana',
+                                            command=self.show_diagnostics)
+        self.diagnostics_button.pack(side="left", padx=20, pady=10)
+        self.diagnostics_window = None
+
+        # radius mode keeps every stop inside the circle instead of just the closest one
+        self.radius_result = None # last fetch_radius result, reused while the slider stays inside its radius
+        self.radius_ranked = []
+        self.radius_markers = []
+        self.radius_circle = None
+        self.radius_zoom = None
+        self._radius_job = None
+        self._cluster_job = None
+        self.radius_mode = tk.BooleanVar(value=False)
+        self.radius_check = tk.Checkbutton(self.bottom_frame,
+                                           text="Radius",
+                                           variable=self.radius_mode,
+                                           bg='gray25',
+                                           fg='white',
+                                           selectcolor='gray40',
+                                           font='Verdana')
+        self.radius_check.pack(side="left", padx=(20, 0), pady=10)
+        self.radius_scale = tk.Scale(self.bottom_frame,
+                                     from_=RADIUS_CHOICES[0],
+                                     to=RADIUS_CHOICES[1],
+                                     resolution=50,
+                                     orient="horizontal",
+                                     length=140,
+                                     bg="#1E1E1E",
+                                     fg="white",
+                                     highlightthickness=0,
+                                     command=self.on_radius_change)
+        self.radius_scale.set(max_distance())
+        self.radius_scale.pack(side="left", padx=(0, 20), pady=10)
+
 
         # Track current markers
         self.user_marker = None
+        self.user_coords = None
         self.bus_marker = None
 
         # Store last departure time
         self.next_departure_unix = None
-        self.all_departures = ""
+        self.departures = None # DepartureExtractor for the last search, the full list is built on demand
+        self.all_departures_window = None
+        self.all_departure_rows = {} # Route.key -> (countdown key, row label) in the all departures window
+        self._all_row_count = 0
+        self.stop = None # the Stop the departures are for, refreshed by its id
+
+        self.showing_wait = False # label_timer is showing a rate limit wait
+
+        # one timer drives the countdown label and every row in the all departures window
+        self.countdowns = CountdownScheduler(self.root)
 
         # Dropdown map list (styled via the ttk style configured above)
-        self.tile_server_options = {
-            "OpenStreetMap ": "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png",
-            "OpenStreetMap": "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png",
-            "Memo Maps": "https://tileserver.memomaps.de/tilegen/{z}/{x}/{y}.png",
-            "Google Maps - Roadmap": "https://mt1.google.com/vt/lyrs=m&x={x}&y={y}&z={z}",
-            "Google Maps - Hybrid": "https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}",
-            "Google Maps - Satellite": "https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}"
-        }
+        self.tile_server_options = TILE_SERVER_OPTIONS
         options = list(self.tile_server_options.keys())
         selected_option = tk.StringVar(value=options[0])
+        self.selected_option = selected_option
         self.dropdown = ttk.OptionMenu(self.bottom_frame, selected_option, *options, command=self.change_tile_server)
         self.dropdown.pack(side="left", padx=20, pady=10)
         self.change_tile_server(options[0])
@@ -305,12 +3034,29 @@ class BusStopApp:
         self.initial_geometry = self.root.geometry()  # remember the launch size/position
         self.root.bind("<Configure>", self.on_configure)  # bind our new debounced method
 
+        # API calls run here instead of on the Tk event loop so the window never freezes during a search
+        self.lookup = LookupEngine(self.root)
+        # the place index reads every past search out of the geocode cache, so it is built off the Tk thread
+        self.lookup.submit("places", lambda report, cancelled: place_index(), lambda stage, value: None)
+        self.tiles = TilePrefetcher()
+        # keeps the departures of the stop on screen current, slowing down when the window isn't being used
+        self.refresher = RealtimeRefresher(self.root, self.lookup, self.on_refreshed_routes)
+        for sequence in ("<Motion>", "<KeyPress>", "<ButtonPress>"):
+            self.root.bind_all(sequence, self.refresher.touch, add="+")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         self.root.update_idletasks()  # make sure geometry info is up to date
         self.root.deiconify() # Show the window fully rendered now
-        # ─── HACKY TILE-RELOAD ─────────────────────────────────────────────
-        # force a re-set of the OSM tiles a moment after launch
-        # selected_option is tk.StringVar for the dropdown
-        self.root.after(500, lambda: self.change_tile_server(selected_option.get()))
+        if fast_start:
+            # draw the search bar and labels now, import the map libraries on a worker, then build the map once they are in.
+            # the map is sized against the real window, so the tile reload hack below isn't needed.
+            self.root.update()
+            self.lookup.submit("map", import_map_modules, self.on_map_stage)
+        else:
+            # ─── HACKY TILE-RELOAD ─────────────────────────────────────────────
+            # force a re-set of the OSM tiles a moment after launch
+            # selected_option is tk.StringVar for the dropdown
+            self.root.after(500, lambda: self.change_tile_server(selected_option.get()))
         self.initial_geometry = self.root.geometry()  # e.g. "800x600+X+Y"
         self.current_state = self.root.state()  # e.g. "normal"
 
@@ -371,8 +3117,29 @@ class BusStopApp:
             self.top_frame.grid(row=0, column=3, columnspan=3, rowspan=1, sticky="nsew")
             self.bottom_frame.grid(row=1, column=3, columnspan=3, rowspan=1, sticky="nsew")
 
+    # builds the map view. runs during __init__ normally, or just after the first frame in fast start.
+    def attach_map(self):
+        if self.map is not None:
+            return
+        self.map = cached_map_view(self.middle_frame) # tiles come from tile_cache.db when we have them
+        self.map.pack(fill="both", expand=True, padx=10, pady=10)
+        self.map.set_position(41.6, -72.7)
+        self.map.set_zoom(10)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>", "<ButtonRelease-1>"):
+            self.map.canvas.bind(sequence, self.on_map_view_change, add="+")
+        if self.selected_option is not None:
+            self.change_tile_server(self.selected_option.get())
+
+    # fast start: the map libraries were imported on a worker, so building the map here is quick.
+    def on_map_stage(self, stage, value):
+        if stage == "error":
+            print(f"[Map Error] {value}")
+        self.attach_map()
+
     # Zoom(?) tweak in case of these map selections in the dropdown
     def change_tile_server(self, selection):
+        if self.map is None:
+            return # fast start, attach_map sets the tile server once the map exists
         max_zoom_needed = 22 if "Google" in selection or "Memo" in selection else None
         tile_url = self.tile_server_options.get(selection)
         if tile_url:
@@ -386,39 +3153,177 @@ class BusStopApp:
         self.label_result.config(text="")
         self.label_distance.config(text="Please wait...")
         self.label_next_bus.config(text="Gathering data.")
+        self.countdowns.untrack("next")
         self.label_timer.config(text="")
+        self.departures = None
+        self.stop = None
+        self.refresher.cancel()
+        self.hide_suggestions()
+        self.close_all_departures()
         if self.user_marker:
             self.map.delete(self.user_marker)
             self.user_marker = None
         if self.bus_marker:
             self.map.delete(self.bus_marker)
             self.bus_marker = None
+        self.clear_radius()
+
+        self.attach_map() # in case a search beats the fast start map
 
         # Tell the user when a location isn't typed in
         location = self.entry.get().strip()
         if not location:
+            self.lookup.cancel("search")
             messagebox.showwarning("Missing Input", "Please enter a location.")
             return
 
+        # hand the lookups to the background engine. a new search supersedes whatever is still running.
+        if self.radius_mode.get():
+            radius = self.radius_scale.get()
+            self.lookup.submit("search",
+                               lambda report, cancelled: run_radius_lookup(location, radius, report, cancelled),
+                               self.on_search_stage)
+            return
+        self.lookup.submit("search",
+                           lambda report, cancelled: run_lookup(location, report, cancelled),
+                           self.on_search_stage)
+
+    def on_entry_return(self, event=None):
+        # Enter on a highlighted suggestion searches that suggestion
+        if self.suggestions.winfo_ismapped() and self.suggestions.curselection():
+            self.pick_suggestion()
+        else:
+            self.search_location()
+
+    # local completions show up on every keystroke, a --suggest-url server is only asked once typing pauses.
+    def on_entry_typed(self, event):
+        if event.keysym in ("Return", "KP_Enter", "Escape", "Down", "Up", "Tab"):
+            return
+        if self._suggest_job:
+            self.root.after_cancel(self._suggest_job)
+            self._suggest_job = None
+        self.lookup.cancel("suggest") # the text changed, so whatever Nominatim is working on is stale
+        text = self.entry.get().strip()
+        if len(text) < 2 or text == self.placeholder:
+            self.hide_suggestions()
+            return
+        # the index is built on a worker at startup, until it is ready there is just nothing local to offer
+        local = _place_index.complete(text) if _place_index is not None else []
+        self.show_suggestions(local)
+        if len(local) < 3 and len(text) >= 4 and SUGGESTION_URL is not None:
+            self._suggest_job = self.root.after(self.suggest_delay_ms, lambda: self.fetch_suggestions(text, local))
+
+    def fetch_suggestions(self, text, local):
+        self._suggest_job = None
+        # a newer keystroke supersedes this request, its answer (if it still arrives) is dropped
+        def on_stage(stage, value):
+            if stage == "suggest":
+                self.show_suggestions(local + value)
+
+        self.lookup.submit("suggest",
+                           lambda report, cancelled: report("suggest", remote_suggestions(text, cancelled=cancelled)),
+                           on_stage)
+
+    def show_suggestions(self, options):
+        self.suggestions.delete(0, "end")
+        seen = set()
+        for option in options:
+            if GeocodeCache.normalize(option) not in seen:
+                seen.add(GeocodeCache.normalize(option))
+                self.suggestions.insert("end", option)
+        if not seen:
+            self.hide_suggestions()
+            return
+        self.suggestions.config(height=min(len(seen), 6))
+        self.suggestions.place(in_=self.entry, x=0, rely=1.0, relwidth=1.0)
+        self.suggestions.lift()
+
+    def hide_suggestions(self):
+        if self._suggest_job:
+            self.root.after_cancel(self._suggest_job)
+            self._suggest_job = None
+        self.suggestions.place_forget()
+
+    def focus_suggestions(self, event=None):
+        if self.suggestions.winfo_ismapped():
+            self.suggestions.focus_set()
+            self.suggestions.selection_clear(0, "end")
+            self.suggestions.selection_set(0)
+            self.suggestions.activate(0)
+
+    def pick_suggestion(self, event=None):
+        selection = self.suggestions.curselection()
+        if not selection:
+            return
+        choice = self.suggestions.get(selection[0])
+        self.entry.delete(0, "end")
+        self.entry.insert(0, choice)
+        self.entry.config(fg='white')
+        self.entry.focus_set()
+        self.search_location()
+
+    # called on the Tk thread as each stage of run_lookup finishes.
+    def on_search_stage(self, stage, value):
+        if stage == "waiting":
+            # stuck behind a rate limit (5 Transit calls a minute on the free plan), say so instead of looking frozen
+            reason, seconds = value
+            self.label_timer.config(text=f"\u23F3 {reason} rate limit, continuing in {math.ceil(seconds)} s...")
+            self.showing_wait = True
+            return
+        if self.showing_wait:
+            self.showing_wait = False
+            if stage != "routes": # show_routes puts the countdown there
+                self.label_timer.config(text="")
+        if stage == "coords":
+            self.show_coordinates(value)
+        elif stage == "stop":
+            self.show_stop(value)
+        elif stage == "routes":
+            self.show_routes(value)
+        elif stage == "radius":
+            self.show_radius(value)
+        elif stage == "error":
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
+            self.label_result.config(text=f"[Search Error] {value}")
+
+    @traced("map_render")
+    def show_coordinates(self, coords):
         # More issue detection when we can't get the coordinates
-        coords = get_coordinates(location)
         if not coords:
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
             self.label_result.config(text="Invalid location. Try again.")
             return
 
         user_lat, user_lon = coords
+        self.user_coords = coords
         self.map.set_position(user_lat, user_lon)
         if self.user_marker:
             self.map.delete(self.user_marker)
         self.user_marker = self.map.set_marker(user_lat, user_lon, text="Your Location")
+        self.label_next_bus.config(text="Finding the nearest stop...")
+        if self.radius_mode.get():
+            self.label_next_bus.config(text="Finding every stop nearby...")
 
-        stop_info = get_nearby_bus_stops(user_lat, user_lon)
+    @traced("map_render")
+    def show_stop(self, stop):
         # If no val, resolve to there being no nearby bus stops
-        if not stop_info:
+        if not stop:
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
             self.label_result.config(text="No nearby bus stops found.")
             return
+        # errors from find_closest_stop come back as strings
+        if isinstance(stop, str):
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
+            self.label_result.config(text=stop)
+            return
 
-        stop_lat, stop_lon, stop_name = stop_info
+        user_lat, user_lon = self.user_coords
+        stop_lat, stop_lon, stop_name = stop.stop_lat, stop.stop_lon, stop.stop_name
+        self.stop = stop
         # Handles map location specifically
         if self.bus_marker:
             self.map.delete(self.bus_marker)
@@ -448,80 +3353,344 @@ class BusStopApp:
         else:
             zoom_level = 14
         self.map.set_zoom(zoom_level)
+        # download the tiles around this search for every zoom level the ladder above can pick, where the server allows it
+        if tile_prefetch_allowed(self.map.tile_server):
+            self.tiles.prefetch_around(self.map.tile_server, [(user_lat, user_lon), (stop_lat, stop_lon)])
 
+        self.label_next_bus.config(text="Loading departures...")
+
+    def show_routes(self, routes):
         # if no route, label is equal to 'no route'
-        routes = get_routes_at_stop(stop_lat, stop_lon)
         if not routes:
             self.label_next_bus.config(text="No routes found.")
             return
 
-        # wizard magic...
-        upcoming_routes = []
-        for route in routes:
-            route_short_name = route.get("route_short_name", "Unknown")
-            next_time = None
-            for itinerary in route.get("itineraries", []):
-                for schedule in itinerary.get("schedule_items", []):
-                    ts = schedule.get("departure_time")
-                    if ts and (next_time is None or ts < next_time):
-                        next_time = ts
-            if next_time:
-                upcoming_routes.append({
-                    "route": route_short_name,
-                    "departure_time": next_time
-                })
+        # wizard magic... (the next departure of every route, only the soonest three get formatted now)
+        with metrics.span("departures"):
+            departures = DepartureExtractor(routes, top_n=3)
 
         # if no wizard magic, give no departure details
-        if not upcoming_routes:
+        if not departures:
             self.label_next_bus.config(text="No departures found.")
             return
 
-        # different sort of wizard magic
-        upcoming_routes.sort(key=lambda r: r["departure_time"])
-        self.next_departure_unix = upcoming_routes[0]["departure_time"]
+        self.departures = departures
+        self.next_departure_unix = departures.soonest
         self.update_timer() # Start the countdown!
 
-        # loops through the stop info and pulls of the information needed to be displayed...
-        # more wizard magic.
-        # TH says... "msg_3" is a bit unclear but this seems like this is a string to handle
-        # the next three stops in text.
-        msg_3 = ""
-        self.all_departures = ""
-        for i, route_info in enumerate(upcoming_routes[:-1]):
-            est_time = datetime.fromtimestamp(route_info["departure_time"], UTC) - timedelta(hours=4)
-            formatted_time = est_time.strftime('%I:%M %p')
-            formatted_date = est_time.strftime('%B %d')
-            line = f"{formatted_date} | Route {route_info['route']} | Next Departure: {formatted_time}"
-            if i < 3:
-                msg_3 += line + "\n"
-            self.all_departures += line + "\n"
+        msg_3 = "".join(line + "\n" for line in departures.top_lines())
         self.label_next_bus.config(text="Next Three Departures:\n" + msg_3)
+        if self.stop is not None:
+            # refreshed by the id the search picked, the routes may mix in timetable ids that don't match it
+            self.refresher.start(self.stop.stop_lat, self.stop.stop_lon, self.stop.global_stop_id)
+
+    # a realtime poll came back. only what actually changed is redrawn.
+    def on_refreshed_routes(self, routes):
+        with metrics.span("departures"):
+            departures = DepartureExtractor(routes, top_n=3)
+        if not departures:
+            return
+        changed, removed = departure_changes(self.departures, departures)
+        old_top = self.departures.top if self.departures else None
+        self.departures = departures
+        if not changed and not removed:
+            return
+        if departures.top != old_top:
+            msg_3 = "".join(line + "\n" for line in departures.top_lines())
+            self.label_next_bus.config(text="Next Three Departures:\n" + msg_3)
+        if departures.soonest != self.next_departure_unix:
+            self.next_departure_unix = departures.soonest
+            self.update_timer()
+        if self.all_departures_window is not None:
+            for route_key in removed:
+                key, row = self.all_departure_rows.pop(route_key)
+                self.countdowns.untrack(key)
+                row.destroy()
+            for departure in changed.values():
+                self.track_departure_row(departure)
+            # new and moved rows were packed at the bottom, put the window back in departure order
+            for departure in departures.all_rows():
+                _, row = self.all_departure_rows[departure.route_key]
+                row.pack_forget()
+                row.pack(fill="x", padx=10)
+
+    # every stop inside the radius, ranked by walk + wait, drawn as clustered markers around a circle.
+    @traced("map_render")
+    def show_radius(self, result):
+        self.radius_result = result
+        stops = result["stops"]
+        if isinstance(stops, str):
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
+            self.label_result.config(text=stops)
+            return
+        self.departures = DepartureExtractor(result["routes"], top_n=3) if result["routes"] else None
+        self.rank_radius()
+
+    # re-ranks and redraws from the last fetch, with no API calls. the slider only shrinks what we already have.
+    def rank_radius(self):
+        result = self.radius_result
+        radius = self.radius_scale.get()
+        user_lat, user_lon = result["lat"], result["lon"]
+        with metrics.span("radius_rank"):
+            self.radius_ranked = rank_stops_for_trip(user_lat, user_lon, result["stops"], result["routes"], radius)
+
+        if self.radius_circle is not None:
+            self.radius_circle.delete()
+        self.radius_circle = self.map.set_polygon(circle_points(user_lat, user_lon, radius),
+                                                  outline_color="#3E7FD6", fill_color=None, border_width=2)
+        if self.map.zoom < 14:
+            self.map.set_position(user_lat, user_lon)
+            self.map.set_zoom(16 if radius <= 500 else 15)
+        self.draw_radius_markers(force=True)
+
+        ranked = self.radius_ranked
+        if not ranked:
+            self.label_result.config(text="No bus stops within the radius.")
+            self.label_distance.config(text="")
+            self.label_next_bus.config(text="")
+            self.next_departure_unix = None
+            self.countdowns.untrack("next")
+            self.label_timer.config(text="")
+            return
+        best = ranked[0]
+        self.label_result.config(text=f"{len(ranked)} stops within {radius} m. Best stop: \n {best['stop'].stop_name or 'Unknown Stop'}")
+        self.label_distance.config(text=f" {best['meters']:.0f} m away, about {best['walk_s'] / 60:.0f} min walk")
+        lines = []
+        for row in ranked[:3]:
+            if row["departure"]:
+                departure_time, route_name, _ = row["departure"]
+                lines.append(f"{row['stop'].stop_name or 'Unknown Stop'}: {format_departure(departure_time, route_name)}")
+        self.label_next_bus.config(text="Best Three Stops:\n" + "".join(line + "\n" for line in lines)
+                                   if lines else "No departures found.")
+        self.next_departure_unix = best["departure"][0] if best["departure"] else None
+        self.update_timer()
+
+    # tkintermapview has no zoom event, so the wheel and clicks on the map (the +/- buttons, drags) stand in for
+    # one. clusters are redrawn once things settle, and only if the whole zoom level actually changed.
+    def on_map_view_change(self, event=None):
+        if not self.radius_result:
+            return
+        if self._cluster_job:
+            self.root.after_cancel(self._cluster_job)
+        self._cluster_job = self.root.after(300, self.draw_radius_markers)
+
+    # one marker per screen cluster.
+    def draw_radius_markers(self, force=False):
+        self._cluster_job = None
+        if not self.radius_result or self.map is None:
+            return
+        zoom = round(self.map.zoom)
+        if force or zoom != self.radius_zoom:
+            self.radius_zoom = zoom
+            for marker in self.radius_markers:
+                marker.delete()
+            self.radius_markers = []
+            points = [(row["stop"].stop_lat, row["stop"].stop_lon, row) for row in self.radius_ranked]
+            for lat, lon, rows in cluster_points(points, zoom):
+                if len(rows) == 1:
+                    text = rows[0]["stop"].stop_name or "Unknown Stop"
+                else:
+                    text = f"{len(rows)} stops"
+                self.radius_markers.append(self.map.set_marker(lat, lon, text=text))
+
+    # debounced slider. shrinking just re-ranks. the API can't be asked for only the new ring (there is no
+    # minimum distance), so growing past what was fetched asks once for the slider's whole range, and every
+    # later move of the slider is answered from that.
+    def on_radius_change(self, value):
+        if self._radius_job:
+            self.root.after_cancel(self._radius_job)
+        self._radius_job = self.root.after(250, self.apply_radius)
+
+    def apply_radius(self):
+        self._radius_job = None
+        result = self.radius_result
+        if not result or isinstance(result["stops"], str):
+            return
+        radius = self.radius_scale.get()
+        if radius <= result["radius"]:
+            self.rank_radius()
+            return
+        lat, lon = result["lat"], result["lon"]
+        self.label_next_bus.config(text="Finding every stop nearby...")
+        self.lookup.submit("search",
+                           lambda report, cancelled: report("radius", fetch_radius(lat, lon, RADIUS_CHOICES[1])),
+                           self.on_search_stage)
+
+    def clear_radius(self):
+        if self._cluster_job:
+            self.root.after_cancel(self._cluster_job)
+            self._cluster_job = None
+        for marker in self.radius_markers:
+            marker.delete()
+        self.radius_markers = []
+        if self.radius_circle is not None:
+            self.radius_circle.delete()
+            self.radius_circle = None
+        self.radius_result = None
+        self.radius_zoom = None
 
     # starts the countdown timer to when the buses arrive.
     def update_timer(self):
-        def countdown():
-            if self.next_departure_unix is None:
-                self.label_timer.config(text="No departure time set.")
-                return
-            now = datetime.now(timezone.utc)
-            remaining = datetime.fromtimestamp(self.next_departure_unix, timezone.utc) - now
-            if remaining.total_seconds() <= 0:
-                self.label_timer.config(text="\u2705 Arriving Now!")
-            else:
-                mins, secs = divmod(int(remaining.total_seconds()), 60)
-                hours, mins = divmod(mins, 60)
-                self.label_timer.config(text=f"\u23F0 Bus arriving in: {hours:02}:{mins:02}:{secs:02}")
-                self.label_timer.after(1000, countdown)
-        countdown()
+        if self.next_departure_unix is None:
+            self.countdowns.untrack("next")
+            self.label_timer.config(text="No departure time set.")
+            return
+        self.countdowns.track("next", self.label_timer, self.next_departure_unix,
+                              lambda left: f"\u23F0 Bus arriving in: {left}" if left else "\u2705 Arriving Now!")
 
-    # creates the messagebox when it is pressed to display all the stop info.
+    # opens a small window with p50/p95 per stage, cache hit rates and API usage, refreshed every 2 seconds.
+    def show_diagnostics(self):
+        if self.diagnostics_window is not None:
+            self.diagnostics_window.lift()
+            return
+        window = tk.Toplevel(self.root, bg="#1E1E1E")
+        window.title("Diagnostics")
+        label = tk.Label(window, font=("Courier", 11), fg="white", bg="#1E1E1E", justify="left", anchor="w")
+        label.pack(fill="both", expand=True, padx=10, pady=10)
+        self.diagnostics_window = window
+
+        def close():
+            self.diagnostics_window = None
+            window.destroy()
+
+        def refresh():
+            if self.diagnostics_window is not window:
+                return
+            summary = metrics.summary()
+            lines = [f"{'stage':<22}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}"]
+            for stage, row in sorted(summary["stages"].items()):
+                lines.append(f"{stage:<22}{row['count']:>7}{row['errors']:>8}"
+                             f"{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}")
+            lines.append("")
+            for cache, stats in summary["caches"].items():
+                lines.append(f"{cache + ' cache hit rate':<30}{stats['hit_rate'] * 100:>8.1f} %")
+            for name, value in sorted(summary["counters"].items()):
+                lines.append(f"{name:<30}{value:>8}")
+            label.config(text="\n".join(lines))
+            window.after(2000, refresh)
+
+        window.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    # stops the lookup workers before the window goes away.
+    def on_close(self):
+        self.refresher.cancel()
+        self.lookup.shutdown()
+        self.tiles.shutdown()
+        self.root.destroy()
+
+    # opens a window listing every departure, each row with its own live countdown.
     def show_all_departures(self):
-        if self.all_departures:
-            messagebox.showinfo("All Departures", self.all_departures)
-        else:
+        if not self.departures:
             messagebox.showinfo("All Departures", "No departure data available.")
+            return
+        self.close_all_departures()
+        window = tk.Toplevel(self.root, bg="#1E1E1E")
+        window.title("All Departures")
+        window.protocol("WM_DELETE_WINDOW", self.close_all_departures)
+        self.all_departures_window = window
+        rows = self.departures.all_rows()
+        for departure, line in zip(rows, self.departures.all_lines()):
+            self.track_departure_row(departure, line)
+
+    # adds a row to the all departures window, or retargets the route direction's existing row in place.
+    def track_departure_row(self, departure, line=None):
+        departure_time, route_name, route_key = departure
+        line = line or format_departure(departure_time, route_name)
+        if route_key in self.all_departure_rows:
+            key, row = self.all_departure_rows[route_key]
+        else:
+            self._all_row_count += 1
+            key = f"all:{self._all_row_count}:" # trailing colon so untracking all:1: leaves all:10: alone
+            row = tk.Label(self.all_departures_window, font=("Verdana", 12), fg="white", bg="#1E1E1E", anchor="w")
+            row.pack(fill="x", padx=10)
+            self.all_departure_rows[route_key] = (key, row)
+        self.countdowns.track(key, row, departure_time,
+                              lambda left, line=line: f"{line} | in {left}" if left else f"{line} | Departed")
+
+    def close_all_departures(self):
+        self.countdowns.untrack("all:")
+        self.all_departure_rows = {}
+        if self.all_departures_window is not None:
+            self.all_departures_window.destroy()
+            self.all_departures_window = None
 
 #calls programming loop.
 if __name__ == "__main__":
-    app = BusStopApp()
-    tk.mainloop()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Nearby bus stop info for Connecticut, powered by Transit App.")
+    parser.add_argument("--import-gtfs", metavar="FEED",
+                        help="import a GTFS feed (zip or folder) into schedule.db for offline departures and exit")
+    parser.add_argument("--batch", metavar="INPUT",
+                        help="headless mode: look up every address in a CSV/JSONL file ('-' for JSONL on stdin)")
+    parser.add_argument("--out", default="-", help="JSONL output for --batch, also used to resume (default stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent lookups for --batch")
+    parser.add_argument("--departures", type=int, default=3, help="departures per address for --batch")
+    parser.add_argument("--prefetch-tiles", metavar="MAP_OR_URL",
+                        help="download tiles for the Connecticut box into tile_cache.db and exit (only from a "
+                             "tile server that allows bulk downloads, see PREFETCH_SERVERS)")
+    parser.add_argument("--zooms", default="14-20", help="zoom range for --prefetch-tiles, e.g. 10-14")
+    parser.add_argument("--max-tiles", type=int, default=5000, help="download budget for --prefetch-tiles")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="show the search bar first and attach the map after the first frame")
+    parser.add_argument("--startup-probe", action="store_true",
+                        help="print first-frame/interactive timestamps as JSON and exit (used by benchmarks.py)")
+    parser.add_argument("--transport", choices=("live", "record", "replay"), default="live",
+                        help="record API answers to --fixtures, or replay them without touching the network")
+    parser.add_argument("--fixtures", default="fixtures", help="fixture directory for record/replay/--stand-in")
+    parser.add_argument("--api-base", metavar="URL", help="send Transit and Nominatim requests to this server instead")
+    parser.add_argument("--stand-in", action="store_true",
+                        help="serve the recorded --fixtures as a local stand-in for both APIs")
+    parser.add_argument("--port", type=int, default=8765, help="port for --stand-in and --serve")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of latency --stand-in adds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of --stand-in requests that get a 503")
+    parser.add_argument("--serve", action="store_true",
+                        help="answer lookups over a local HTTP API (/lookup, /geocode, /stop, /routes) for many clients")
+    parser.add_argument("--host", default="127.0.0.1", help="interface for --serve")
+    parser.add_argument("--suggest-url", metavar="URL",
+                        help="Photon server to ask for type-ahead suggestions (not the public Nominatim, which forbids it)")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="append span timings and errors to a JSONL file")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="keep a Prometheus text file of stage percentiles")
+    args = parser.parse_args()
+    metrics.configure(args.metrics_jsonl, args.metrics_prom)
+    configure_transport(args.transport, args.fixtures)
+    if args.api_base:
+        use_api_base(args.api_base)
+    SUGGESTION_URL = args.suggest_url
+
+    if args.stand_in:
+        stand_in = StandInServer(args.fixtures, port=args.port, latency=args.latency, error_rate=args.error_rate)
+        print(f"Serving {len(stand_in.fixtures)} fixtures on {stand_in.url}")
+        stand_in.httpd.serve_forever()
+    elif args.serve:
+        server = LookupServer(args.host, args.port)
+        print(f"Serving lookups on {server.url}")
+        server.serve_forever()
+    elif args.import_gtfs:
+        print(f"Imported {schedule().import_feed(args.import_gtfs)} stop times.")
+    elif args.prefetch_tiles:
+        server = TILE_SERVER_OPTIONS.get(args.prefetch_tiles, args.prefetch_tiles)
+        if not tile_prefetch_allowed(server):
+            print(f"[Tile Prefetch Error] {server} does not allow bulk downloads. Add it to PREFETCH_SERVERS "
+                  "only if you run it or have permission.")
+        else:
+            low, high = (int(zoom) for zoom in args.zooms.split("-"))
+            prefetcher = TilePrefetcher(workers=1)
+            downloaded = prefetcher.prefetch(server, CT_VIEWBOX[0], CT_VIEWBOX[1], range(low, high + 1),
+                                             args.max_tiles).result()
+            print(f"Downloaded {downloaded} tiles.")
+    elif args.batch:
+        counts = run_batch(args.batch, args.out, args.workers, args.departures)
+        print(f"Looked up {counts['done']} addresses, {counts['skipped']} already done.", file=sys.stderr)
+    elif args.startup_probe:
+        app = BusStopApp(fast_start=args.fast_start)
+        app.root.update()
+        print(json.dumps({"event": "first_frame", "time": time.time()}), flush=True)
+        app.attach_map()
+        app.root.update()
+        print(json.dumps({"event": "interactive", "time": time.time()}), flush=True)
+        app.on_close()
+    else:
+        app = BusStopApp(fast_start=args.fast_start)
+        tk.mainloop()
\ No newline at end of file
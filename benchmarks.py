@@ -0,0 +1,379 @@
+# Group 3 Project
+# Benchmarks for the Transit app.
+
+"""
+Offline benchmarks for AllTogetherNow.py. None of these spend API quota.
+
+    python benchmarks.py distance    # batch distance modes vs calculate_distance
+    python benchmarks.py startup     # import time, time to first frame and to interactive (needs a display)
+    python benchmarks.py search      # end-to-end search throughput/latency against the stand-in server
+    python benchmarks.py serve       # upstream calls per refresh when many screens poll the lookup server
+    python benchmarks.py model       # memory and time of parsed Stop/Route records vs the raw JSON payloads
+    python benchmarks.py schedule    # GTFS import time and next-departures query latency on a synthetic feed
+    python benchmarks.py format      # departure line formatting: old fixed -4h per row vs zoneinfo + minute cache
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+
+import AllTogetherNow as app
+
+# Connecticut's bounding box, same one get_coordinates searches in.
+CT_SOUTH, CT_NORTH = 40.950943, 42.050587
+CT_WEST, CT_EAST = -73.727775, -71.787220
+
+
+def random_ct_points(count, rng):
+    """(count, 2) array of random lat/lon points inside Connecticut."""
+    return np.column_stack((rng.uniform(CT_SOUTH, CT_NORTH, count), rng.uniform(CT_WEST, CT_EAST, count)))
+
+
+def timed(func, repeat=3):
+    """Best wall time (seconds) of a few runs, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+##################################################   DISTANCE   ##################################################
+
+def bench_distance(pairs=20000, seed=3):
+    """Speed and accuracy of batch_distances modes against calculate_distance over CT-scale distances."""
+    rng = np.random.default_rng(seed)
+    origins = random_ct_points(pairs, rng)
+    destinations = random_ct_points(pairs, rng)
+    # half the pairs are short walks (stop ranking), half are anywhere in the state
+    destinations[: pairs // 2] = origins[: pairs // 2] + rng.normal(0, 0.005, (pairs // 2, 2))
+
+    loop_pairs = min(pairs, 2000) # calculate_distance is slow, time it on a slice
+    loop_time, loop_meters = timed(lambda: [app.calculate_distance(*o, *d)[0]
+                                            for o, d in zip(origins[:loop_pairs], destinations[:loop_pairs])], 1)
+    exact = np.array(loop_meters)
+    per_pair = loop_time / loop_pairs
+    print(f"{'mode':<18}{'us/pair':>10}{'speedup':>10}{'max err m':>12}{'max err %':>12}")
+    print(f"{'calculate_distance':<18}{per_pair * 1e6:>10.2f}{1:>10.1f}{0:>12.3f}{0:>12.4f}")
+    for mode in ("geodesic", "haversine", "equirectangular"):
+        count = loop_pairs if mode == "geodesic" else pairs
+        elapsed, (meters, _) = timed(lambda: app.batch_distances(origins[:count], destinations[:count], mode),
+                                     1 if mode == "geodesic" else 3)
+        error = np.abs(meters[:loop_pairs] - exact)
+        relative = error / np.maximum(exact, 1.0) * 100
+        print(f"{mode:<18}{elapsed / count * 1e6:>10.2f}{per_pair / (elapsed / count):>10.1f}"
+              f"{error.max():>12.3f}{relative.max():>12.4f}")
+
+##################################################   STARTUP   ##################################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cold_import_time():
+    """Seconds for a fresh interpreter to import AllTogetherNow."""
+    started = time.time()
+    subprocess.run([sys.executable, "-c", "import AllTogetherNow"], cwd=HERE, check=True)
+    return time.time() - started
+
+
+def startup_probe(fast_start):
+    """(time to first frame, time to interactive) in seconds for one launch of the app, measured from spawn."""
+    command = [sys.executable, "AllTogetherNow.py", "--startup-probe"] + (["--fast-start"] if fast_start else [])
+    started = time.time()
+    output = subprocess.run(command, cwd=HERE, check=True, capture_output=True, text=True).stdout
+    events = {}
+    for line in output.splitlines():
+        if line.startswith("{"):
+            event = json.loads(line)
+            events[event["event"]] = event["time"] - started
+    return events["first_frame"], events["interactive"]
+
+
+def bench_startup(runs=5):
+    """Median cold import, first-frame and interactive times for the default and fast-start launches."""
+    imports = [cold_import_time() for _ in range(runs)]
+    print(f"{'import AllTogetherNow':<24}{statistics.median(imports) * 1000:>10.1f} ms")
+    for label, fast_start in (("default start", False), ("fast start", True)):
+        try:
+            samples = [startup_probe(fast_start) for _ in range(runs)]
+        except (subprocess.CalledProcessError, KeyError) as e:
+            print(f"{label:<24}skipped, could not open a window ({e})")
+            continue
+        first_frame = statistics.median(sample[0] for sample in samples)
+        interactive = statistics.median(sample[1] for sample in samples)
+        print(f"{label:<24}first frame {first_frame * 1000:>8.1f} ms   interactive {interactive * 1000:>8.1f} ms")
+
+###################################################   SEARCH   ###################################################
+
+def synthetic_fixtures(addresses, stops_per_search=30, routes_per_stop=20, seed=5):
+    """Fixtures for a set of made-up addresses: a geocode answer, nearby_stops and nearby_routes for each."""
+    rng = np.random.default_rng(seed)
+    radius = app.max_distance()
+    now = time.time()
+    fixtures = {}
+    # keep the made-up places a few km apart, otherwise one place's stops would land inside another place's
+    # search circle without being in its answer, which the real API would never do
+    points = []
+    while len(points) < addresses:
+        lat, lon = random_ct_points(1, rng)[0]
+        if all(app.StopIndex.meters_between(lat, lon, *point) > 3000 for point in points):
+            points.append((lat, lon))
+    for i, (lat, lon) in enumerate(points):
+        address = f"Benchmark Address {i}"
+        fixtures[app.fixture_key(f"/search?q={address}")] = (200, [{
+            "lat": str(lat), "lon": str(lon), "display_name": address, "place_id": i,
+            "boundingbox": [str(lat), str(lat), str(lon), str(lon)]}])
+        # geopy hands back floats parsed from the strings above, so key the API fixtures on those
+        lat, lon = float(str(lat)), float(str(lon))
+        offsets = rng.normal(0, 0.003, (stops_per_search, 2))
+        stops = [{"global_stop_id": f"S{i}-{j}", "stop_name": f"Stop {i}-{j}",
+                  "stop_lat": lat + d_lat, "stop_lon": lon + d_lon,
+                  "distance": round(app.StopIndex.meters_between(lat, lon, lat + d_lat, lon + d_lon), 2)}
+                 for j, (d_lat, d_lon) in enumerate(offsets)]
+        closest = min(stops, key=lambda stop: stop["distance"])["global_stop_id"]
+        routes = [{"route_short_name": str(r),
+                   "itineraries": [{"closest_stop": {"global_stop_id": closest if r % 2 == 0 else f"S{i}-0"},
+                                    "schedule_items": [{"departure_time": int(now + 300 + r * 60 + k * 900)}
+                                                       for k in range(10)]}]}
+                  for r in range(routes_per_stop)]
+        params = {"lat": lat, "lon": lon, "max_distance": radius}
+        fixtures[app.fixture_key("/v3/public/nearby_stops", params)] = (200, {"stops": stops})
+        fixtures[app.fixture_key("/v3/public/nearby_routes", params)] = (200, {"routes": routes})
+    return fixtures
+
+
+def fresh_caches():
+    """Empty in-memory caches and an unthrottled client, so every search goes to the stand-in server."""
+    app.geocode_cache = app.GeocodeCache(path=":memory:")
+    app.route_cache = app.RouteCache()
+    app._stop_index = app.StopIndex()
+    app.nominatim_limiter = app.TokenBucket(1e9, 1e9)
+    app._transit_client = app.TransitClient(rate=1e9, burst=1e9, backoff=0.01)
+
+
+def bench_search(addresses=200, concurrency=(1, 4, 16), latency=0.05, error_rate=0.0, fixtures_dir=None):
+    """Searches per second and p50/p95 search latency at a few concurrency levels, cold and then warm caches."""
+    fixtures = app.load_fixtures(fixtures_dir) if fixtures_dir else synthetic_fixtures(addresses)
+    queries = [key.split("q=", 1)[1] for key in fixtures if key.startswith("search?")]
+    server = app.StandInServer(fixtures=fixtures, latency=latency, error_rate=error_rate).start()
+    app.configure_transport("live")
+    app.use_api_base(server.url)
+    print(f"{len(queries)} addresses, {latency * 1000:.0f} ms stand-in latency, {error_rate:.0%} injected errors")
+    print(f"{'workers':>8}{'caches':>8}{'searches/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'failed':>8}")
+    try:
+        for workers in concurrency:
+            fresh_caches()
+            app._transit_client._key = "benchmark" # the stand-in doesn't check keys
+            for caches in ("cold", "warm"):
+                def one(query):
+                    started = time.perf_counter()
+                    record = app.lookup_address(query)
+                    return time.perf_counter() - started, record["error"] is not None
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(one, queries))
+                elapsed = time.perf_counter() - started
+                latencies = sorted(result[0] for result in results)
+                failed = sum(result[1] for result in results)
+                print(f"{workers:>8}{caches:>8}{len(queries) / elapsed:>12.1f}"
+                      f"{latencies[len(latencies) // 2] * 1000:>10.1f}"
+                      f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:>10.1f}{failed:>8}")
+    finally:
+        server.stop()
+
+
+def bench_serve(screens=(1, 10, 50), places=5, refreshes=3, latency=0.05):
+    """Upstream requests and refresh latency when many screens poll the same few places through --serve."""
+    fixtures = synthetic_fixtures(places)
+    queries = [key.split("q=", 1)[1] for key in fixtures if key.startswith("search?")]
+    upstream = app.StandInServer(fixtures=fixtures, latency=latency).start()
+    app.configure_transport("live")
+    app.use_api_base(upstream.url)
+    print(f"{len(queries)} places, {refreshes} refreshes, {latency * 1000:.0f} ms stand-in latency")
+    print(f"{'screens':>8}{'requests':>10}{'upstream':>10}{'joined':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    try:
+        for count in screens:
+            fresh_caches()
+            app._transit_client._key = "benchmark"
+            server = app.LookupServer(port=0).start()
+            before = upstream.requests
+
+            def one(query):
+                started = time.perf_counter()
+                with urllib.request.urlopen(f"{server.url}/lookup?q={urllib.parse.quote(query)}") as response:
+                    response.read()
+                return time.perf_counter() - started
+
+            latencies = []
+            for _ in range(refreshes):
+                # every screen refreshes at once, the worst case for the upstream API
+                app.route_cache = app.RouteCache() # as if the cached departures had just expired
+                with ThreadPoolExecutor(max_workers=count) as pool:
+                    latencies += pool.map(one, [queries[i % len(queries)] for i in range(count)])
+            server.stop()
+            latencies.sort()
+            print(f"{count:>8}{count * refreshes:>10}{upstream.requests - before:>10}{server.joined:>8}"
+                  f"{latencies[len(latencies) // 2] * 1000:>10.1f}"
+                  f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:>10.1f}")
+    finally:
+        upstream.stop()
+
+
+def bench_model(stops=2000, routes=500, items_per_itinerary=40, seed=11):
+    """Retained memory and parse time of a large nearby_stops/nearby_routes payload, raw JSON vs parsed records."""
+    rng = np.random.default_rng(seed)
+    points = random_ct_points(stops, rng)
+    # extra fields like the real API sends, which the app never reads
+    stops_body = json.dumps({"stops": [{"global_stop_id": f"S:{i}", "stop_name": f"Stop {i}", "stop_lat": lat,
+                                        "stop_lon": lon, "distance": i, "stop_code": str(i), "parent_station": None,
+                                        "route_type": 3, "location_type": 0, "wheelchair_boarding": 1}
+                                       for i, (lat, lon) in enumerate(points)]})
+    now = int(time.time())
+    routes_body = json.dumps({"routes": [{"route_short_name": str(r), "route_long_name": f"Route {r} Long Name",
+                                          "route_color": "ffffff", "route_text_color": "000000", "mode_name": "Bus",
+                                          "itineraries": [{"closest_stop": {"global_stop_id": f"S:{(r + d) % stops}",
+                                                                            "stop_name": "x", "stop_lat": 0.0,
+                                                                            "stop_lon": 0.0},
+                                                           "direction_headsign": "Downtown", "direction_id": d,
+                                                           "schedule_items": [{"departure_time": now + 60 * k,
+                                                                               "is_real_time": True, "rt_trip_id": "t",
+                                                                               "scheduled_departure_time": now}
+                                                                              for k in range(items_per_itinerary)]}
+                                                          for d in range(2)]}
+                                         for r in range(routes)]})
+
+    def retained(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    print(f"{stops} stops, {routes} routes, {items_per_itinerary} departures per itinerary")
+    print(f"{'payload':>10}{'raw MB':>10}{'parsed MB':>11}{'parse ms':>10}")
+    for name, body, parse in (("stops", stops_body, app.parse_stops), ("routes", routes_body, app.parse_routes)):
+        raw = retained(lambda: json.loads(body))
+        parsed = retained(lambda: parse(json.loads(body)))
+        payload = json.loads(body)
+        print(f"{name:>10}{raw / 1e6:>10.2f}{parsed / 1e6:>11.2f}{timed(lambda: parse(payload))[0] * 1000:>10.1f}")
+
+
+def synthetic_gtfs(directory, stops=3000, routes=60, trips_per_route=120, stops_per_trip=40, seed=13):
+    """Writes a made-up GTFS feed (weekday + weekend service, some trips past midnight) into a folder."""
+    rng = np.random.default_rng(seed)
+    points = random_ct_points(stops, rng)
+
+    def write(name, header, rows):
+        with open(os.path.join(directory, name), "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    write("agency.txt", ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+          [["CT", "Benchmark Transit", "https://example.com", "America/New_York"]])
+    write("stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+          [[f"S{i}", f"Stop {i}", lat, lon] for i, (lat, lon) in enumerate(points)])
+    write("routes.txt", ["route_id", "route_short_name", "route_type"], [[f"R{r}", str(r), 3] for r in range(routes)])
+    write("calendar.txt", ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+                           "start_date", "end_date"],
+          [["WK", 1, 1, 1, 1, 1, 0, 0, 20200101, 20991231], ["WE", 0, 0, 0, 0, 0, 1, 1, 20200101, 20991231]])
+    write("calendar_dates.txt", ["service_id", "date", "exception_type"], [["WK", 20991225, 2]])
+    trips, stop_times = [], []
+    for r in range(routes):
+        path = rng.choice(stops, stops_per_trip, replace=False)
+        for t in range(trips_per_route):
+            trip_id = f"R{r}T{t}"
+            trips.append([f"R{r}", "WK" if t % 3 else "WE", trip_id, f"To Stop {path[-1]}"])
+            start = 5 * 3600 + t * (21 * 3600 // trips_per_route) # 05:00 to past 02:00 the next morning
+            for k, stop in enumerate(path):
+                seconds = start + 90 * k
+                hms = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+                stop_times.append([trip_id, hms, hms, f"S{stop}", k + 1])
+    write("trips.txt", ["route_id", "service_id", "trip_id", "trip_headsign"], trips)
+    write("stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], stop_times)
+    return points, len(stop_times)
+
+
+def bench_schedule(queries=2000, seed=17):
+    """Import time for a synthetic feed, then p50/p95 of next-departures queries at random stops and times."""
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        points, rows = synthetic_gtfs(directory)
+        store = app.GtfsSchedule(os.path.join(directory, "schedule.db"))
+        started = time.perf_counter()
+        store.import_feed(directory)
+        print(f"imported {rows} stop times in {time.perf_counter() - started:.1f} s")
+        now = time.time()
+        print(f"{'query':>14}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, run in (("next_departures", lambda i, at: store.next_departures(f"S{i}", at, 10)),
+                          ("routes_at", lambda i, at: store.routes_at(*points[i], at))):
+            latencies = []
+            for _ in range(queries):
+                i, at = int(rng.integers(len(points))), now + float(rng.uniform(0, 7 * 86400))
+                started = time.perf_counter()
+                run(i, at)
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            print(f"{name:>14}{latencies[len(latencies) // 2] * 1000:>10.2f}"
+                  f"{latencies[int(len(latencies) * 0.95)] * 1000:>10.2f}")
+        store.db.close()
+
+
+def old_format_departure(departure_time, route_name):
+    """format_departure as it used to be, with a fixed -4h offset and two strftime calls per row."""
+    est_time = datetime.fromtimestamp(departure_time, UTC) - timedelta(hours=4)
+    return f"{est_time.strftime('%B %d')} | Route {route_name} | Next Departure: {est_time.strftime('%I:%M %p')}"
+
+
+def bench_format(sizes=(100, 1000, 10000, 50000), seed=19):
+    """Time to format every departure of a large route list, and how often the old fixed offset was wrong."""
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    print(f"{'rows':>8}{'old ms':>10}{'per-row ms':>12}{'batch ms':>10}")
+    for size in sizes:
+        # a busy stop: departures spread over the next 3 hours, many sharing a minute
+        rows = [app.Departure(now + int(offset), str(route))
+                for offset, route in zip(rng.uniform(0, 3 * 3600, size), rng.integers(1, 200, size))]
+        app.minute_strings.cache_clear()
+        old, _ = timed(lambda: [old_format_departure(*row[:2]) for row in rows])
+        app.minute_strings.cache_clear()
+        per_row, _ = timed(lambda: [app.format_departure(*row[:2]) for row in rows], repeat=1) # cold cache
+        app.minute_strings.cache_clear()
+        batch, _ = timed(lambda: app.format_departures(rows), repeat=1)
+        print(f"{size:>8}{old * 1000:>10.2f}{per_row * 1000:>12.2f}{batch * 1000:>10.2f}")
+    # one departure every 6 hours for a year, to see the DST half of the year
+    year = [app.Departure(now + hours * 3600, "1") for hours in range(0, 365 * 24, 6)]
+    wrong = sum(old != new for old, new in zip((old_format_departure(*row[:2]) for row in year), app.format_departures(year)))
+    print(f"fixed -4h offset was wrong for {wrong / len(year):.0%} of a year's departures")
+
+
+BENCHMARKS = {"distance": bench_distance, "startup": bench_startup, "search": bench_search, "serve": bench_serve,
+              "model": bench_model,
+              "schedule": bench_schedule, "format": bench_format}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Transit app.")
+    parser.add_argument("benchmark", nargs="*", help=f"which benchmarks to run: {', '.join(BENCHMARKS)} (default all)")
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    for name in args.benchmark or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+        print()
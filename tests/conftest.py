@@ -0,0 +1,29 @@
+import os
+import sys
+
+# the app is a single script at the repo root, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import AllTogetherNow as app
+
+
+class Clock:
+    """Stands in for time.time so expiry can be tested without sleeping."""
+
+    def __init__(self, now=1_800_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(app.time, "time", fake)
+    return fake
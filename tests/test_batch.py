@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import AllTogetherNow as app
+
+
+def write_csv(path, addresses):
+    path.write_text("id,address\n" + "".join(f"{number},{address}\n" for number, address in enumerate(addresses, 1)))
+    return str(path)
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    """lookup_address answered from a dict of address -> error (None for a good answer)."""
+    outcomes = {}
+    asked = []
+
+    def lookup(address, departures=3):
+        asked.append(address)
+        error = outcomes[address]
+        if isinstance(error, Exception):
+            raise error
+        return {"address": address, "stop": None if error else {"name": "Elm & Main"}, "error": error}
+
+    monkeypatch.setattr(app, "lookup_address", lookup)
+    monkeypatch.setattr(app.metrics, "flush", lambda: None)
+    return outcomes, asked
+
+
+def test_a_resumed_run_redoes_only_what_failed(tmp_path, answers):
+    outcomes, asked = answers
+    outcomes.update({"1 Main St": None,
+                     "Nowhere": "Invalid location.",
+                     "Middle of a lake": "No nearby bus stops found.",
+                     "2 Elm St": "[Transit API Error] Status code: 503",
+                     "3 Oak St": TimeoutError("read timed out"),
+                     "4 Pine St": "No departures found."})
+    addresses = write_csv(tmp_path / "in.csv", list(outcomes))
+    out = tmp_path / "out.jsonl"
+    assert app.run_batch(addresses, str(out), workers=2) == {"done": 6, "skipped": 0}
+    assert next(record for record in read_records(out) if record["id"] == "5")["error"] == "[Lookup Error] read timed out"
+
+    outcomes.update({"2 Elm St": None, "3 Oak St": None, "4 Pine St": None})
+    asked.clear()
+    assert app.run_batch(addresses, str(out), workers=2) == {"done": 3, "skipped": 3}
+    assert sorted(asked) == ["2 Elm St", "3 Oak St", "4 Pine St"]
+    assert app.finished_ids(str(out)) == {"1", "2", "3", "4", "5", "6"}
+
+
+def test_finished_ids_skips_failures_and_cut_off_lines(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(json.dumps({"id": "1", "error": None}) + "\n"
+                   + json.dumps({"id": "2", "error": "[Lookup Error] boom"}) + "\n"
+                   + json.dumps({"id": 3, "error": "Invalid location."}) + "\n"
+                   + '{"id": "4", "err')
+    assert app.finished_ids(str(out)) == {"1", "3"}
+    assert app.finished_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_a_line_cut_off_by_a_killed_run_is_finished_off(tmp_path, answers):
+    outcomes, _ = answers
+    outcomes.update({"1 Main St": None, "2 Elm St": None})
+    out = tmp_path / "out.jsonl"
+    out.write_text(json.dumps({"id": "1", "error": None}) + "\n" + '{"id": "2", "addr')
+    app.run_batch(write_csv(tmp_path / "in.csv", list(outcomes)), str(out))
+    lines = out.read_text().splitlines()
+    assert lines[1] == '{"id": "2", "addr'
+    assert json.loads(lines[2])["id"] == "2"
+
+
+def test_geocoder_failures_are_not_reported_as_invalid_locations(monkeypatch):
+    monkeypatch.setattr(app, "geocode_cache", app.GeocodeCache(None))
+    app.geocode_cache.disk_failed = True
+    monkeypatch.setattr(app, "run_lookup", lambda address: {"coords": None, "stop": None, "routes": []})
+    assert app.lookup_address("123 Main St")["error"] == "[Geolocation Error] no answer"
+    app.geocode_cache.put("123 Main St", None) # what a real "not found" leaves behind
+    assert app.lookup_address("123 Main St")["error"] == "Invalid location."
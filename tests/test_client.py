@@ -0,0 +1,111 @@
+import pytest
+import requests
+
+import AllTogetherNow as app
+from AllTogetherNow import FixtureResponse, TokenBucket, TransitClient
+
+
+class SleepClock:
+    """time.monotonic that only moves when something sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def sleeper(monkeypatch):
+    fake = SleepClock()
+    monkeypatch.setattr(app.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(app.time, "sleep", fake.sleep)
+    return fake
+
+
+class ScriptedTransport:
+    """Hands out the given responses in order; an exception in the list is raised instead."""
+
+    needs_key = False
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.sent = 0
+
+    def get(self, url, params=None, headers=None, timeout=10):
+        self.sent += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def answer(status, retry_after=None):
+    response = FixtureResponse(status, {})
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_bucket_spends_its_burst_then_waits_for_a_refill(sleeper):
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeper.sleeps == []
+    waits = []
+    bucket.acquire(on_wait=waits.append)
+    assert waits == [pytest.approx(2.0)] # one token at half a token a second
+    assert sum(sleeper.sleeps) == pytest.approx(2.0)
+
+
+def test_bucket_refills_no_further_than_its_capacity(sleeper):
+    bucket = TokenBucket(rate=1, capacity=3)
+    sleeper.now += 3600
+    for _ in range(3):
+        bucket.acquire()
+    assert sleeper.sleeps == []
+    bucket.acquire()
+    assert sum(sleeper.sleeps) == pytest.approx(1.0)
+
+
+def test_retry_after_is_honoured_before_backoff(sleeper):
+    sender = ScriptedTransport(answer(503, retry_after="7"), answer(429), answer(200))
+    client = TransitClient(rate=100, burst=100, backoff=0.5, transport=sender)
+    assert client.get("nearby_stops", {}).status_code == 200
+    assert sender.sent == 3
+    assert sleeper.sleeps[0] == 7.0 # what the server asked for
+    assert 1.0 <= sleeper.sleeps[1] <= 1.5 # no Retry-After, so backoff * 2 plus jitter
+
+
+def test_unreadable_retry_after_falls_back_to_backoff(sleeper):
+    sender = ScriptedTransport(answer(503, retry_after="Wed, 21 Oct 2026 07:28:00 GMT"), answer(200))
+    client = TransitClient(rate=100, burst=100, backoff=0.5, transport=sender)
+    assert client.get("nearby_stops", {}).status_code == 200
+    assert 0.5 <= sleeper.sleeps[0] <= 1.0
+
+
+def test_the_last_failure_is_returned_once_retries_run_out(sleeper):
+    sender = ScriptedTransport(*[answer(503, retry_after="1")] * 3)
+    client = TransitClient(rate=100, burst=100, retries=2, transport=sender)
+    assert client.get("nearby_routes", {}).status_code == 503
+    assert sender.sent == 3
+    assert sleeper.sleeps == [1.0, 1.0]
+
+
+def test_connection_errors_are_retried_then_raised(sleeper):
+    sender = ScriptedTransport(requests.ConnectionError("reset"), answer(200))
+    assert TransitClient(rate=100, burst=100, transport=sender).get("nearby_stops", {}).status_code == 200
+    sender = ScriptedTransport(*[requests.Timeout("slow")] * 2)
+    with pytest.raises(requests.Timeout):
+        TransitClient(rate=100, burst=100, retries=1, transport=sender).get("nearby_stops", {})
+
+
+def test_client_errors_are_not_retried(sleeper):
+    sender = ScriptedTransport(answer(401), answer(200))
+    assert TransitClient(rate=100, burst=100, transport=sender).get("nearby_stops", {}).status_code == 401
+    assert sender.sent == 1
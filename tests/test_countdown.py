@@ -0,0 +1,95 @@
+import tkinter as tk
+
+import pytest
+
+from AllTogetherNow import CountdownScheduler, countdown_text
+
+
+def test_under_an_hour_counts_seconds():
+    assert countdown_text(1125.4, now=1000) == ("00:02:05", pytest.approx(0.4))
+    assert countdown_text(1125, now=1000) == ("00:02:05", 1.0) # exactly on a second, the next change is a second out
+
+
+def test_an_hour_or_more_counts_minutes():
+    assert countdown_text(4725.5, now=1000) == ("1 hr 02 min", pytest.approx(5.5))
+    assert countdown_text(4600, now=1000) == ("1 hr 00 min", 60.0)
+
+
+def test_nothing_once_it_has_left():
+    assert countdown_text(1000, now=1000) == (None, None)
+    assert countdown_text(900, now=1000) == (None, None)
+
+
+class FakeRoot:
+    def __init__(self):
+        self.jobs = {}
+        self.next_id = 0
+
+    def after(self, ms, func):
+        self.next_id += 1
+        self.jobs[self.next_id] = (ms, func)
+        return self.next_id
+
+    def after_cancel(self, job):
+        del self.jobs[job]
+
+    def run(self, clock):
+        """Fires the one pending job, moving the clock forward to when it was due."""
+        (job, (ms, func)), = self.jobs.items()
+        del self.jobs[job]
+        clock.advance(ms / 1000)
+        func()
+        return ms
+
+
+class Label:
+    def __init__(self):
+        self.text = None
+        self.updates = 0
+
+    def config(self, text):
+        self.text = text
+        self.updates += 1
+
+
+class DestroyedLabel:
+    def config(self, text):
+        raise tk.TclError('invalid command name ".!label"')
+
+
+def test_one_timer_ticks_at_the_soonest_change(clock):
+    root = FakeRoot()
+    countdowns = CountdownScheduler(root)
+    near, far = Label(), Label()
+    countdowns.track("row:1", near, clock.now + 90.5, lambda text: text or "Departed")
+    countdowns.track("row:2", far, clock.now + 7200, lambda text: text or "Departed")
+    assert len(root.jobs) == 1
+    root.run(clock)
+    assert (near.text, far.text) == ("00:01:30", "1 hr 59 min")
+    assert root.run(clock) == 500 # half a second to the next whole second, plus the 20 ms nudge
+    assert near.text == "00:01:29"
+    assert far.updates == 1 # the minute didn't change, so the label wasn't touched
+
+
+def test_departed_and_destroyed_rows_stop_being_tracked(clock):
+    root = FakeRoot()
+    countdowns = CountdownScheduler(root)
+    label = Label()
+    countdowns.track("row:1", label, clock.now + 0.01, lambda text: text or "Departed")
+    countdowns.track("row:2", DestroyedLabel(), clock.now + 600, lambda text: text)
+    root.run(clock)
+    assert label.text == "Departed"
+    assert countdowns.targets == {}
+    assert root.jobs == {}
+
+
+def test_untrack_by_prefix_and_the_timer_stops_when_nothing_is_left(clock):
+    root = FakeRoot()
+    countdowns = CountdownScheduler(root)
+    for key in ("main:1", "main:2", "all:1"):
+        countdowns.track(key, Label(), clock.now + 600, lambda text: text)
+    countdowns.untrack("main:")
+    assert sorted(countdowns.targets) == ["all:1"]
+    assert len(root.jobs) == 1
+    countdowns.untrack("all:")
+    assert root.jobs == {}
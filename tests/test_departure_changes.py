@@ -0,0 +1,55 @@
+from AllTogetherNow import DepartureExtractor, Itinerary, Route, departure_changes, parse_routes
+
+
+def extractor(*routes):
+    return DepartureExtractor(list(routes))
+
+
+def route(name, *itineraries, route_id=None):
+    return Route(name, tuple(itineraries), route_id or f"R:{name}")
+
+
+def leg(*times, headsign="", direction_id=None):
+    return Itinerary("S:1", tuple(times), headsign=headsign, direction_id=direction_id)
+
+
+def test_only_moved_added_and_dropped_directions_are_reported():
+    old = extractor(route("1", leg(100, headsign="Downtown"), leg(200, headsign="Uptown")),
+                    route("2", leg(300, headsign="Mall")))
+    new = extractor(route("1", leg(100, headsign="Downtown"), leg(260, headsign="Uptown")),
+                    route("3", leg(400, headsign="Depot")))
+    changed, removed = departure_changes(old, new)
+    assert sorted(row.route_name for row in changed.values()) == ["1 to Uptown", "3 to Depot"]
+    assert changed[("R:1", 1, "Uptown")].departure_time == 260
+    assert removed == [("R:2", 0, "Mall")]
+
+
+def test_everything_is_new_on_the_first_poll():
+    changed, removed = departure_changes(None, extractor(route("1", leg(100))))
+    assert list(changed) == [("R:1", 0, "")] and removed == []
+
+
+def test_directions_without_headsigns_do_not_collide():
+    old = extractor(route("5", leg(100), leg(200)))
+    new = extractor(route("5", leg(100), leg(250)))
+    assert len(old.all_rows()) == 2
+    changed, removed = departure_changes(old, new)
+    assert [row.departure_time for row in changed.values()] == [250]
+    assert removed == []
+
+
+def test_direction_ids_from_the_payload_survive_a_direction_dropping_out():
+    payload = {"routes": [{"route_short_name": "5", "global_route_id": "R:5",
+                           "itineraries": [{"direction_id": 0, "schedule_items": [{"departure_time": 100}]},
+                                           {"direction_id": 1, "schedule_items": [{"departure_time": 200}]}]}]}
+    old = extractor(*parse_routes(payload))
+    del payload["routes"][0]["itineraries"][0] # direction 0 is done for the day
+    changed, removed = departure_changes(old, extractor(*parse_routes(payload)))
+    assert changed == {}
+    assert removed == [("R:5", 0, "")]
+
+
+def test_same_short_name_on_two_routes_stays_apart():
+    old = extractor(route("Unknown", leg(100), route_id="R:a"), route("Unknown", leg(200), route_id="R:b"))
+    new = extractor(route("Unknown", leg(100), route_id="R:a"), route("Unknown", leg(200), route_id="R:b"))
+    assert departure_changes(old, new) == ({}, [])
@@ -0,0 +1,53 @@
+import random
+
+from AllTogetherNow import DepartureExtractor, Itinerary, Route
+
+
+def route(name, *directions):
+    """A Route with one itinerary per (headsign, departure times) pair."""
+    return Route(name, tuple(Itinerary("S:1", tuple(times), headsign=headsign) for headsign, times in directions),
+                 f"R:{name}")
+
+
+def test_top_n_are_the_soonest_next_departures():
+    routes = [route("1", ("Downtown", (500, 900))),
+              route("2", ("Airport", (100,)), ("Mall", (700,))),
+              route("3", ("Depot", (300,))),
+              route("4", ("Depot", ()))] # nothing left today
+    extractor = DepartureExtractor(routes, top_n=3)
+    assert [(row.departure_time, row.route_name) for row in extractor.top] == \
+        [(100, "2 to Airport"), (300, "3 to Depot"), (500, "1 to Downtown")]
+    assert extractor.count == 4
+    assert extractor.soonest == 100
+    assert [row.departure_time for row in extractor.all_rows()] == [100, 300, 500, 700]
+
+
+def test_ties_keep_payload_order_like_the_full_list():
+    routes = [route(str(number), ("", (600 if number % 2 else 300,))) for number in range(8)]
+    for top_n in range(1, 9):
+        extractor = DepartureExtractor(routes, top_n=top_n)
+        assert extractor.top == extractor.all_rows()[:top_n]
+    assert [row.route_name for row in DepartureExtractor(routes, top_n=3).top] == ["0", "2", "4"]
+
+
+def test_top_matches_a_full_sort_on_random_payloads():
+    rng = random.Random(7)
+    for _ in range(50):
+        routes = [route(str(number), ("In", (rng.randrange(20),)), ("Out", (rng.randrange(20),)))
+                  for number in range(rng.randrange(12))]
+        extractor = DepartureExtractor(routes, top_n=5)
+        assert extractor.top == extractor.all_rows()[:5]
+
+
+def test_nothing_to_show():
+    empty = DepartureExtractor([route("1", ("Depot", ()))])
+    assert not empty
+    assert empty.soonest is None
+    assert empty.top_lines() == []
+    assert DepartureExtractor([route("1", ("Depot", (100,)))], top_n=0).top == []
+
+
+def test_directions_get_their_own_rows_and_keys():
+    extractor = DepartureExtractor([route("5", ("Hartford", (100,)), ("Waterbury", (200,)))])
+    assert [row.route_name for row in extractor.top] == ["5 to Hartford", "5 to Waterbury"]
+    assert extractor.top[0].route_key != extractor.top[1].route_key
@@ -0,0 +1,46 @@
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import Stop
+
+pytest.importorskip("numpy")
+
+HARTFORD = (41.7637, -72.6851)
+NEW_HAVEN = (41.3083, -72.9279)
+STAMFORD = (41.0534, -73.5387)
+
+
+def test_haversine_is_within_half_a_percent_of_geodesic():
+    meters, feet = app.batch_distances(HARTFORD, [NEW_HAVEN, STAMFORD])
+    for destination, measured in zip((NEW_HAVEN, STAMFORD), meters):
+        exact, _ = app.calculate_distance(*HARTFORD, *destination)
+        assert measured == pytest.approx(exact, rel=0.005)
+    assert feet[0] == pytest.approx(meters[0] * 3.28084)
+
+
+def test_modes_agree_at_walking_distances():
+    stop = (HARTFORD[0] + 0.004, HARTFORD[1] + 0.003) # about half a kilometer
+    geodesic = app.batch_distances(HARTFORD, [stop], "geodesic")[0][0]
+    assert app.batch_distances(HARTFORD, [stop], "haversine")[0][0] == pytest.approx(geodesic, rel=0.005)
+    assert app.batch_distances(HARTFORD, [stop], "equirectangular")[0][0] == pytest.approx(geodesic, rel=0.005)
+
+
+def test_pairs_and_broadcasting():
+    meters, _ = app.batch_distances([HARTFORD, NEW_HAVEN], [NEW_HAVEN, NEW_HAVEN])
+    assert meters.shape == (2,)
+    assert meters[1] == 0
+    assert app.batch_distances(HARTFORD, NEW_HAVEN)[0].shape == ()
+
+
+def test_unknown_mode_is_refused():
+    with pytest.raises(ValueError):
+        app.batch_distances(HARTFORD, [NEW_HAVEN], "manhattan")
+
+
+def test_radius_ranking_measures_without_numpy(monkeypatch):
+    stops = [Stop(f"G:{i}", str(i), HARTFORD[0] + i * 0.002, HARTFORD[1], None) for i in (3, 1, 2)]
+    with_numpy = [row["stop"].global_stop_id for row in app.rank_stops_for_trip(*HARTFORD, stops, [], now=0)]
+    monkeypatch.setattr(app, "np", app.LazyModule("numpy_is_not_installed"))
+    ranked = app.rank_stops_for_trip(*HARTFORD, stops, [], radius=500, now=0)
+    assert [row["stop"].global_stop_id for row in ranked] == with_numpy[:2] == ["G:1", "G:2"]
+    assert ranked[0]["meters"] == pytest.approx(0.002 * 111195, rel=0.01)
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import ReplayTransport, fixture_key, fixture_path
+
+
+def test_key_ignores_the_host_and_parameters_that_do_not_change_the_answer():
+    live = fixture_key("https://external.transitapp.com/v3/public/nearby_stops",
+                       {"lat": 41.3, "lon": -72.9, "max_distance": 1000, "stop_filter": "Routable"})
+    stand_in = fixture_key("http://127.0.0.1:8765/v3/public/nearby_stops?max_distance=1000&lon=-72.9&lat=41.3")
+    assert live == stand_in == "nearby_stops?lat=41.3&lon=-72.9&max_distance=1000"
+
+
+def test_key_for_geocoder_searches_and_unknown_endpoints():
+    assert fixture_key("https://nominatim.openstreetmap.org/search",
+                       {"q": "Union Station", "format": "json", "viewbox": "..."}) == "search?q=Union Station"
+    # endpoints without a list keep every param, sorted, so the key doesn't depend on their order
+    assert fixture_key("http://127.0.0.1/v3/public/route_details/", {"b": 2, "a": 1}) == "route_details?a=1&b=2"
+
+
+def record(directory, key, status, body):
+    with open(fixture_path(str(directory), key), "w", encoding="utf-8") as file:
+        json.dump({"key": key, "status": status, "body": body, "recorded": 0}, file)
+
+
+def test_replay_answers_recorded_requests_and_404s_the_rest(tmp_path):
+    record(tmp_path, "nearby_stops?lat=41.3&lon=-72.9&max_distance=1000", 200, {"stops": [{"stop_name": "Elm"}]})
+    record(tmp_path, "nearby_routes?lat=41.3&lon=-72.9&max_distance=1000", 503, {"error": "busy"})
+    (tmp_path / "notes.txt").write_text("not a fixture")
+    replay = ReplayTransport(str(tmp_path))
+    params = {"lat": 41.3, "lon": -72.9, "max_distance": 1000, "should_update_realtime": True}
+    stops = replay.get("https://external.transitapp.com/v3/public/nearby_stops", params=params)
+    assert stops.status_code == 200
+    assert stops.json() == {"stops": [{"stop_name": "Elm"}]}
+    assert json.loads(stops.content) == stops.json()
+    assert replay.get("https://external.transitapp.com/v3/public/nearby_routes", params=params).status_code == 503
+    assert replay.get("https://external.transitapp.com/v3/public/nearby_stops", params={"lat": 0}).status_code == 404
+
+
+def test_replay_sends_no_api_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "api_key", lambda: pytest.fail("read API.txt"))
+    record(tmp_path, "nearby_stops?lat=1&lon=2&max_distance=3", 200, {"stops": []})
+    client = app.TransitClient(rate=100, burst=100, transport=ReplayTransport(str(tmp_path)))
+    assert client.get("nearby_stops", {"lat": 1, "lon": 2, "max_distance": 3}).json() == {"stops": []}
+
+
+def test_a_missing_fixture_directory_replays_nothing(tmp_path):
+    replay = ReplayTransport(str(tmp_path / "never recorded"))
+    assert replay.get("http://127.0.0.1/search", params={"q": "x"}).status_code == 404
@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+import AllTogetherNow as app
+from AllTogetherNow import Departure, format_departure, format_departures
+
+
+def unix(*utc):
+    return int(datetime(*utc, tzinfo=timezone.utc).timestamp())
+
+
+def times(lines):
+    return [line.rsplit("Next Departure: ", 1)[1] for line in lines]
+
+
+def test_spring_forward_skips_the_missing_hour():
+    rows = [Departure(unix(2026, 3, 8, 6, 59), "5"), Departure(unix(2026, 3, 8, 7, 0), "5")]
+    assert times(format_departures(rows)) == ["01:59 AM", "03:00 AM"]
+
+
+def test_fall_back_shows_one_thirty_twice():
+    rows = [Departure(unix(2026, 11, 1, 5, 30), "5"), Departure(unix(2026, 11, 1, 6, 30), "7")]
+    assert format_departures(rows) == ["November 01 | Route 5 | Next Departure: 01:30 AM",
+                                       "November 01 | Route 7 | Next Departure: 01:30 AM"]
+
+
+def test_summer_and_winter_use_their_own_offsets():
+    july, january = unix(2026, 7, 4, 16, 0), unix(2026, 1, 4, 16, 0)
+    assert times(format_departures([Departure(july, "5"), Departure(january, "5")])) == ["12:00 PM", "11:00 AM"]
+
+
+def test_batch_and_single_lines_match():
+    rows = [Departure(unix(2026, 11, 1, 4, 59, 59) + seconds, "Downtown", ("R:1", 0, ""))
+            for seconds in range(0, 7200, 45)]
+    assert format_departures(rows) == [format_departure(*row[:2]) for row in rows]
+
+
+def test_a_missing_zone_falls_back_to_est_and_says_how_to_fix_it(capsys):
+    zone = app.find_timezone("America/Nowhere_Special")
+    assert zone.utcoffset(None).total_seconds() == -5 * 3600
+    assert "pip install tzdata" in capsys.readouterr().out
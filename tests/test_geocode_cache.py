@@ -0,0 +1,39 @@
+import AllTogetherNow as app
+
+
+def test_geocode_hit_until_ttl_then_miss(clock, tmp_path):
+    cache = app.GeocodeCache(str(tmp_path / "geocode.db"), ttl=100, negative_ttl=10)
+    cache.put("123 Main St., Hartford", (41.76, -72.67))
+    assert cache.get("123 main st hartford") == (True, (41.76, -72.67)) # same key once normalized
+    clock.advance(99)
+    assert cache.get("123 Main St, Hartford") == (True, (41.76, -72.67))
+    clock.advance(2)
+    assert cache.get("123 Main St, Hartford") == (False, None)
+
+
+def test_geocode_not_found_is_cached_for_the_shorter_ttl(clock, tmp_path):
+    cache = app.GeocodeCache(str(tmp_path / "geocode.db"), ttl=100, negative_ttl=10)
+    cache.put("nowhere at all", None)
+    assert cache.get("nowhere at all") == (True, None)
+    assert cache.negative_hits == 1
+    clock.advance(11)
+    assert cache.get("nowhere at all") == (False, None)
+
+
+def test_geocode_disk_tier_survives_a_restart_and_expires(clock, tmp_path):
+    path = str(tmp_path / "geocode.db")
+    app.GeocodeCache(path, ttl=100).put("New Haven Green", (41.308, -72.925))
+    reopened = app.GeocodeCache(path, ttl=100)
+    assert reopened.get("new haven green") == (True, (41.308, -72.925))
+    assert reopened.disk_hits == 1
+    clock.advance(101)
+    assert app.GeocodeCache(path, ttl=100).get("new haven green") == (False, None)
+
+
+def test_geocode_memory_only_when_the_file_cannot_open(clock):
+    cache = app.GeocodeCache(None, ttl=100)
+    cache.disk_failed = True
+    cache.put("Union Station", (41.297, -72.927))
+    assert cache.get("union station") == (True, (41.297, -72.927))
+    clock.advance(101)
+    assert cache.get("union station") == (False, None)
@@ -0,0 +1,123 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import Itinerary, Route, Stop, StopIndex
+
+HOME = (41.30, -72.92)
+
+
+class NoSchedule:
+    def available(self):
+        return False
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """No timetable, an empty stop index, and nothing allowed to reach the network."""
+    monkeypatch.setattr(app, "schedule", NoSchedule)
+    monkeypatch.setattr(app, "_stop_index", StopIndex())
+    monkeypatch.setattr(app, "get_nearby_stop_list", lambda *args, **kwargs: pytest.fail("asked the API"))
+
+
+def route(name, *stop_ids):
+    return Route(name, tuple(Itinerary(stop_id, (1e10,)) for stop_id in stop_ids), f"R:{name}")
+
+
+def lookup():
+    stages = []
+    result = app._parallel_lookup(*HOME, {"coords": HOME, "stop": None, "routes": []},
+                                  lambda stage, value: stages.append(stage), lambda: False)
+    return result, stages
+
+
+def test_routes_asked_at_the_user_are_joined_on_the_closest_stop(offline, monkeypatch):
+    asked = []
+    monkeypatch.setattr(app, "find_closest_stop", lambda lat, lon: Stop("G:near", "Elm & Main", 41.301, -72.92, 90))
+    monkeypatch.setattr(app, "get_routes_at_stop",
+                        lambda lat, lon: asked.append((lat, lon)) or [route("5", "G:near", "G:far"), route("7", "G:far")])
+    result, stages = lookup()
+    assert asked == [HOME] # once, at the user, not again at the stop
+    assert [(r.route_short_name, [i.closest_stop_id for i in r.itineraries]) for r in result["routes"]] == [("5", ["G:near"])]
+    assert result["stop"].global_stop_id == "G:near"
+    assert stages == ["stop", "routes"]
+
+
+def test_nothing_joined_asks_again_at_the_stop(offline, monkeypatch):
+    asked = []
+    monkeypatch.setattr(app, "find_closest_stop", lambda lat, lon: Stop("G:near", "Elm & Main", 41.301, -72.92, 90))
+    monkeypatch.setattr(app, "get_routes_at_stop",
+                        lambda lat, lon: asked.append((lat, lon)) or ([route("9", "G:near")] if len(asked) > 1 else []))
+    result, _ = lookup()
+    assert asked == [HOME, (41.301, -72.92)]
+    assert [r.route_short_name for r in result["routes"]] == ["9"]
+
+
+def test_no_stop_abandons_the_routes_call(offline, monkeypatch):
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+    seen = {}
+
+    def slow_routes(lat, lon):
+        started.set()
+        release.wait(5)
+        seen["cancelled"] = app.job_cancelled() # what TransitClient checks before sending
+        finished.set()
+        return []
+
+    # the stop comes back empty while the routes call is already out
+    monkeypatch.setattr(app, "find_closest_stop", lambda lat, lon: started.wait(5) and None)
+    monkeypatch.setattr(app, "get_routes_at_stop", slow_routes)
+    result, stages = lookup()
+    release.set()
+    assert finished.wait(5)
+    assert seen["cancelled"] is True
+    assert result["stop"] is None and result["routes"] == []
+    assert stages == ["stop"]
+
+
+def test_an_error_from_the_stop_lookup_is_passed_on(offline, monkeypatch):
+    monkeypatch.setattr(app, "find_closest_stop", lambda lat, lon: "[Transit API Error] Status code: 503")
+    monkeypatch.setattr(app, "get_routes_at_stop", lambda lat, lon: [])
+    result, _ = lookup()
+    assert result["stop"] == "[Transit API Error] Status code: 503"
+
+
+def test_a_known_empty_area_sends_nothing(offline, monkeypatch):
+    app._stop_index.harvest(*HOME, app.max_distance(), [])
+    monkeypatch.setattr(app, "get_routes_at_stop", lambda *args, **kwargs: pytest.fail("asked for routes"))
+    result, stages = lookup()
+    assert result["stop"] is None
+    assert stages == ["stop"]
+
+
+def test_the_step_by_step_lookup_reports_the_stop_itself(offline, monkeypatch):
+    monkeypatch.setattr(app, "PARALLEL_LOOKUP", False)
+    monkeypatch.setattr(app, "get_coordinates", lambda place: HOME)
+    monkeypatch.setattr(app, "find_closest_stop", lambda lat, lon: Stop("G:near", "Elm & Main", 41.301, -72.92, 90))
+    monkeypatch.setattr(app, "get_routes_at_stop", lambda lat, lon: [route("5", "G:near")])
+    reported = {}
+    result = app.run_lookup("Elm & Main", lambda stage, value: reported.setdefault(stage, value))
+    assert reported["stop"] is result["stop"]
+    assert result["stop"].global_stop_id == "G:near"
+    assert [r.route_short_name for r in result["routes"]] == ["5"]
+
+
+class Label:
+    def config(self, text):
+        self.text = text
+
+
+class Refresher:
+    def start(self, *args):
+        self.started = args
+
+
+def test_refreshes_follow_the_chosen_stop_even_with_timetable_routes_mixed_in():
+    gui = SimpleNamespace(label_next_bus=Label(), refresher=Refresher(), update_timer=lambda: None,
+                          stop=Stop("G:near", "Elm & Main", 41.301, -72.92, 90))
+    # the live route joined on G:near, the timetable adds one keyed on the feed's own stop id
+    routes = [route("5", "G:near"), Route("7", (Itinerary("1042", (1e10,)),))]
+    app.BusStopApp.show_routes(gui, routes)
+    assert gui.refresher.started == (41.301, -72.92, "G:near")
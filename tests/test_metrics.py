@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from AllTogetherNow import Metrics
+
+SAMPLE = re.compile(r'^[a-z_]+\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\} -?\d+(\.\d+)?$')
+
+
+def samples(text):
+    """{metric with labels: value} for every sample line, after checking each line parses."""
+    found = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            assert line.split()[3] in ("summary", "counter", "gauge")
+            continue
+        assert SAMPLE.match(line), line
+        name, value = line.rsplit(" ", 1)
+        found[name] = float(value)
+    return found
+
+
+def test_spans_are_exported_as_a_summary():
+    metrics = Metrics()
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        metrics.observe("search", seconds, size=1000)
+    metrics.observe("search", 2.0, error=True)
+    exported = samples(metrics.prometheus_text())
+    assert exported['transit_stage_seconds{stage="search",quantile="0.5"}'] == 0.3
+    assert exported['transit_stage_seconds{stage="search",quantile="0.95"}'] == 2.0
+    assert exported['transit_stage_seconds_sum{stage="search"}'] == pytest.approx(3.0)
+    assert exported['transit_stage_seconds_count{stage="search"}'] == 5
+    assert exported['transit_stage_errors_total{stage="search"}'] == 1
+    assert exported['transit_payload_bytes_total{stage="search"}'] == 4000
+
+
+def test_sum_and_count_cover_every_span_not_just_the_kept_samples():
+    metrics = Metrics(samples=10)
+    for _ in range(100):
+        metrics.observe("nearby_stops", 0.5)
+    exported = samples(metrics.prometheus_text())
+    assert exported['transit_stage_seconds_count{stage="nearby_stops"}'] == 100
+    assert exported['transit_stage_seconds_sum{stage="nearby_stops"}'] == pytest.approx(50.0)
+
+
+def test_counters_errors_and_cache_ratios(capsys):
+    metrics = Metrics()
+    metrics.count("quota.transit", 3)
+    metrics.error("geocode", "[Geolocation Error] timed out")
+    assert capsys.readouterr().out == "[Geolocation Error] timed out\n" # still printed like before
+    exported = samples(metrics.prometheus_text())
+    assert exported['transit_events_total{name="quota.transit"}'] == 3
+    assert exported['transit_events_total{name="errors.geocode"}'] == 1
+    assert 'transit_cache_hit_ratio{cache="geocode"}' in exported
+    assert not any(name.startswith("transit_payload_bytes_total") for name in exported)
+
+
+def test_each_type_is_declared_once_before_its_samples():
+    metrics = Metrics()
+    metrics.observe("search", 0.1, size=10)
+    metrics.observe("geocode", 0.2, size=10)
+    metrics.count("quota.nominatim")
+    declared = []
+    for line in metrics.prometheus_text().splitlines():
+        if line.startswith("# TYPE "):
+            declared.append(line.split()[2])
+        else:
+            family = line.split("{")[0]
+            assert re.sub(r"_(sum|count)$", "", family) == declared[-1]
+    assert len(declared) == len(set(declared))
+
+
+def test_flush_rewrites_the_file(tmp_path):
+    metrics = Metrics()
+    metrics.prometheus_path = str(tmp_path / "metrics.prom")
+    metrics.observe("search", 0.25)
+    metrics.flush()
+    assert 'transit_stage_seconds_count{stage="search"} 1' in (tmp_path / "metrics.prom").read_text()
+    assert metrics._flush_timer is None
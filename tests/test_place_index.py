@@ -0,0 +1,59 @@
+from AllTogetherNow import GeocodeCache, PlaceIndex
+
+
+def test_prefix_completes_in_weight_order():
+    index = PlaceIndex()
+    index.add("Hartford CT", PlaceIndex.TOWN_WEIGHT)
+    index.add("Hartland CT", PlaceIndex.TOWN_WEIGHT)
+    index.add("Hart Street, New Britain", PlaceIndex.HISTORY_WEIGHT)
+    assert index.complete("hart")[0] == "Hart Street, New Britain" # past searches beat town names
+    assert set(index.complete("HART")) == {"Hartford CT", "Hartland CT", "Hart Street, New Britain"}
+    assert index.complete("hartf") == ["Hartford CT"]
+
+
+def test_completions_come_back_as_written():
+    index = PlaceIndex()
+    index.add("  123 Main St., Hartford ")
+    assert index.complete("123 main st") == ["123 Main St., Hartford"]
+
+
+def test_unknown_prefix_and_empty_places():
+    index = PlaceIndex()
+    index.add("Madison CT")
+    index.add("...")
+    assert index.complete("zzz") == []
+    assert index.complete("mad") == ["Madison CT"]
+
+
+def test_promotion_only_goes_up():
+    index = PlaceIndex()
+    index.add("Bethel CT", 1)
+    index.add("Bethany CT", 1)
+    index.add("Bethany CT", 5)
+    assert index.complete("beth") == ["Bethany CT", "Bethel CT"]
+    index.add("Bethany CT", 1) # a lower weight never demotes
+    assert index.complete("beth") == ["Bethany CT", "Bethel CT"]
+    assert len(index.complete("beth")) == 2 # re-adding didn't duplicate it
+
+
+def test_each_node_keeps_only_the_best():
+    index = PlaceIndex(keep=3)
+    for number in range(10):
+        index.add(f"Elm St {number}", weight=number + 1)
+    assert index.complete("elm", limit=5) == ["Elm St 9", "Elm St 8", "Elm St 7"]
+    assert index.complete("elm st 4") == ["Elm St 4"] # deeper down it is still there
+
+
+def test_cached_places_come_back_as_typed(tmp_path, clock):
+    path = str(tmp_path / "geocode.db")
+    cache = GeocodeCache(path)
+    cache.put("New Haven Green", (41.308, -72.925))
+    clock.advance(1)
+    cache.put("Nowhere At All", None) # not found, nothing to suggest
+    clock.advance(1)
+    cache.put("Union Station, New Haven", (41.297, -72.927))
+    assert GeocodeCache(path).places() == ["Union Station, New Haven", "New Haven Green"]
+    memory_only = GeocodeCache(None)
+    memory_only.disk_failed = True
+    memory_only.put("New Haven Green", (41.308, -72.925))
+    assert memory_only.places() == ["New Haven Green"]
@@ -0,0 +1,65 @@
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import Itinerary, Route, Stop, cluster_points, rank_stops_for_trip
+
+HOME = (41.30, -72.92)
+NOW = 1_800_000_000
+
+
+def stop_north(stop_id, meters):
+    return Stop(stop_id, stop_id, HOME[0] + meters / 111195, HOME[1], None)
+
+
+def leaving(name, stop_id, *in_seconds, also_serves=()):
+    return Route(name, (Itinerary(stop_id, tuple(NOW + seconds for seconds in in_seconds), tuple(also_serves)),),
+                 f"R:{name}")
+
+
+def ranked_ids(rows):
+    return [row["stop"].global_stop_id for row in rows]
+
+
+def test_stops_rank_by_walk_plus_wait_for_a_catchable_bus():
+    stops = [stop_north("near", 100), stop_north("far", 400), stop_north("idle", 50)]
+    routes = [leaving("1", "near", 60, 1800), # the 60 s bus leaves before you can walk 100 m
+              leaving("2", "far", 600)]
+    rows = rank_stops_for_trip(*HOME, stops, routes, now=NOW)
+    assert ranked_ids(rows) == ["far", "near", "idle"]
+    far, near, idle = rows
+    assert far["walk_s"] == pytest.approx(400 * app.WALK_DETOUR / app.WALK_SPEED, rel=0.01)
+    assert far["score"] == 600
+    assert near["departure"].departure_time == NOW + 1800
+    assert idle["departure"] is None and idle["score"] == float("inf")
+
+
+def test_stops_past_the_radius_are_left_out():
+    stops = [stop_north("in", 300), stop_north("out", 900)]
+    assert ranked_ids(rank_stops_for_trip(*HOME, stops, [], radius=500, now=NOW)) == ["in"]
+    assert rank_stops_for_trip(*HOME, [], [], now=NOW) == []
+
+
+def test_stops_an_itinerary_passes_share_its_departures():
+    stops = [stop_north("closest", 100), stop_north("next", 300)]
+    routes = [leaving("3", "closest", 900, also_serves=("closest", "next"))]
+    rows = {row["stop"].global_stop_id: row for row in rank_stops_for_trip(*HOME, stops, routes, now=NOW)}
+    assert rows["next"]["departure"].route_name == "3"
+
+
+def test_nothing_to_catch_goes_last_closest_first():
+    stops = [stop_north("b", 300), stop_north("a", 200)]
+    assert ranked_ids(rank_stops_for_trip(*HOME, stops, [], now=NOW)) == ["a", "b"]
+
+
+def test_points_close_on_screen_are_clustered_at_their_middle():
+    points = [(41.3000, -72.9200, "a"), (41.3003, -72.9203, "b"), (41.3600, -72.9800, "c")]
+    clusters = sorted(cluster_points(points, zoom=12), key=lambda cluster: len(cluster[2]))
+    assert [sorted(items) for _, _, items in clusters] == [["c"], ["a", "b"]]
+    lat, lon, _ = clusters[1]
+    assert (lat, lon) == (pytest.approx(41.30015), pytest.approx(-72.92015))
+
+
+def test_close_zooms_show_every_point():
+    points = [(41.3000, -72.9200, "a"), (41.3003, -72.9203, "b")]
+    assert cluster_points(points, zoom=17) == [(41.3000, -72.9200, ["a"]), (41.3003, -72.9203, ["b"])]
+    assert len(cluster_points(points, zoom=16, cell_px=1)) == 2
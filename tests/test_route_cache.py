@@ -0,0 +1,42 @@
+import AllTogetherNow as app
+from AllTogetherNow import Itinerary, Route
+
+
+def routes_leaving(*times):
+    return [Route("5", (Itinerary("S:1", tuple(times)),), "R:5")]
+
+
+def test_routes_expire_when_the_first_departure_leaves(clock):
+    cache = app.RouteCache(max_ttl=300)
+    cache.put(41.3, -72.9, 1000, routes_leaving(clock.now + 120, clock.now + 900))
+    assert cache.get(41.3, -72.9, 1000) is not None
+    clock.advance(121)
+    assert cache.get(41.3, -72.9, 1000) is None
+
+
+def test_routes_never_outlive_max_ttl(clock):
+    cache = app.RouteCache(max_ttl=300)
+    cache.put(41.3, -72.9, 1000, routes_leaving(clock.now + 3600))
+    clock.advance(299)
+    assert cache.get(41.3, -72.9, 1000) is not None
+    clock.advance(2)
+    assert cache.get(41.3, -72.9, 1000) is None
+
+
+def test_empty_answers_use_empty_ttl_and_stale_ones_are_not_kept(clock):
+    cache = app.RouteCache(empty_ttl=60)
+    cache.put(41.3, -72.9, 1000, [])
+    clock.advance(59)
+    assert cache.get(41.3, -72.9, 1000) == []
+    clock.advance(2)
+    assert cache.get(41.3, -72.9, 1000) is None
+    cache.put(41.3, -72.9, 1000, routes_leaving(clock.now - 5)) # already gone
+    assert cache.get(41.3, -72.9, 1000) is None
+
+
+def test_routes_share_a_cell_but_not_a_radius(clock):
+    cache = app.RouteCache(cell_meters=25)
+    cache.put(41.30000, -72.90000, 1000, routes_leaving(clock.now + 120))
+    assert cache.get(41.30001, -72.90001, 1000) is not None # a meter or two away
+    assert cache.get(41.30000, -72.90000, 500) is None
+    assert cache.get(41.31000, -72.90000, 1000) is None # a kilometer north
@@ -0,0 +1,98 @@
+import csv
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from AllTogetherNow import GtfsSchedule
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def write(directory, name, header, rows):
+    with open(directory / name, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def store(tmp_path):
+    feed = tmp_path / "feed"
+    feed.mkdir()
+    write(feed, "agency.txt", ["agency_id", "agency_name", "agency_timezone"], [["CT", "CTtransit", "America/New_York"]])
+    write(feed, "stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+          [["S1", "Church St", "41.3060", "-72.9260"], ["S2", "Chapel St", "41.3040", "-72.9280"]])
+    write(feed, "routes.txt", ["route_id", "route_short_name", "route_type"], [["R10", "10", "3"], ["R20", "20", "3"]])
+    write(feed, "calendar.txt", ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                                 "sunday", "start_date", "end_date"],
+          [["WEEKDAY", 1, 1, 1, 1, 1, 0, 0, 20260101, 20261231],
+           ["SATURDAY", 0, 0, 0, 0, 0, 1, 0, 20260101, 20261231]])
+    # Labor Day (Monday 2026-09-07) runs the Saturday schedule instead
+    write(feed, "calendar_dates.txt", ["service_id", "date", "exception_type"],
+          [["WEEKDAY", 20260907, 2], ["SATURDAY", 20260907, 1]])
+    write(feed, "trips.txt", ["route_id", "service_id", "trip_id", "trip_headsign"],
+          [["R10", "WEEKDAY", "T1", "Downtown"], ["R10", "WEEKDAY", "T2", "Downtown"],
+           ["R20", "SATURDAY", "T3", "Mall"]])
+    write(feed, "stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"],
+          [["T1", "08:00:00", "08:00:00", "S1", 1], ["T1", "08:05:00", "08:05:00", "S2", 2],
+           ["T2", "25:10:00", "25:10:00", "S1", 1], # 1:10 AM the next morning, same service day
+           ["T3", "09:30:00", "09:30:00", "S1", 1]])
+    schedule = GtfsSchedule(str(tmp_path / "schedule.db"))
+    assert schedule.import_feed(str(feed)) == 4
+    yield schedule
+    schedule.db.close()
+
+
+def services(store, *names):
+    numbers = dict(store.db.execute("SELECT service_id, service FROM services"))
+    return {numbers[name] for name in names}
+
+
+def local(*args):
+    return datetime(*args, tzinfo=NEW_YORK).timestamp()
+
+
+def test_calendar_weekdays(store):
+    assert store.running(date(2026, 9, 8)) == services(store, "WEEKDAY") # Tuesday
+    assert store.running(date(2026, 9, 12)) == services(store, "SATURDAY")
+    assert store.running(date(2026, 9, 13)) == set() # nothing on Sundays
+
+
+def test_calendar_dates_swap_a_holiday(store):
+    assert store.running(date(2026, 9, 7)) == services(store, "SATURDAY")
+    assert store.running(date(2026, 9, 14)) == services(store, "WEEKDAY") # the next Monday is normal
+
+
+def test_calendar_range_ends(store):
+    assert store.running(date(2027, 1, 5)) == set()
+
+
+def test_day_start_is_noon_minus_12h_across_dst(store):
+    # clocks spring forward on 2026-03-08, so that service day starts at 11 PM the evening before
+    assert store.day_start(date(2026, 3, 8)) == datetime(2026, 3, 8, 4, tzinfo=timezone.utc).timestamp()
+    assert store.day_start(date(2026, 3, 9)) == local(2026, 3, 9, 0, 0)
+
+
+def test_next_departures_in_order(store):
+    rows = store.next_departures("S1", local(2026, 9, 9, 7, 0), limit=5) # Wednesday morning
+    assert rows == [(int(local(2026, 9, 9, 8, 0)), "10", "Downtown"),
+                    (int(local(2026, 9, 10, 1, 10)), "10", "Downtown")]
+
+
+def test_yesterdays_trips_after_midnight_still_count(store):
+    rows = store.next_departures("S1", local(2026, 9, 9, 0, 30), limit=1) # Tuesday's 25:10 trip
+    assert rows == [(int(local(2026, 9, 9, 1, 10)), "10", "Downtown")]
+
+
+def test_holiday_departures_follow_the_exception(store):
+    rows = store.next_departures("S1", local(2026, 9, 7, 7, 0), limit=5)
+    assert [route for _, route, _ in rows] == ["20"]
+
+
+def test_stop_near_and_routes_at(store):
+    assert store.stop_near(41.30601, -72.92601) == "S1"
+    assert store.stop_near(41.40, -72.92) is None
+    routes = store.routes_at(41.30601, -72.92601, local(2026, 9, 9, 7, 0))
+    assert [(route.route_short_name, route.itineraries[0].headsign) for route in routes] == [("10", "Downtown")]
+    assert routes[0].next_departure == int(local(2026, 9, 9, 8, 0))
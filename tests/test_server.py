@@ -0,0 +1,85 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from AllTogetherNow import LookupServer
+
+
+@pytest.fixture
+def server():
+    running = LookupServer(port=0, workers=4).start()
+    yield running
+    running.stop()
+
+
+def exchange(server, raw):
+    """Sends raw bytes on a fresh connection and returns everything the server says before closing it."""
+    with socket.create_connection((server.host, server.port), timeout=5) as connection:
+        connection.sendall(raw)
+        received = b""
+        while chunk := connection.recv(65536):
+            received += chunk
+    return received
+
+
+def test_identical_calls_share_one_run():
+    server = LookupServer(workers=4)
+    release = threading.Event()
+    runs = []
+
+    def slow_lookup(value):
+        runs.append(value)
+        release.wait(5)
+        return value * 2
+
+    async def main():
+        waiting = [asyncio.ensure_future(server.single_flight(("stop", 1), slow_lookup, 21)) for _ in range(5)]
+        other = asyncio.ensure_future(server.single_flight(("stop", 2), slow_lookup, 50))
+        await asyncio.sleep(0.05)
+        assert len(server.inflight) == 2
+        release.set()
+        return await asyncio.gather(*waiting), await other
+
+    assert asyncio.run(main()) == ([42] * 5, 100)
+    assert sorted(runs) == [21, 50]
+    assert (server.calls, server.joined) == (2, 4)
+    assert server.inflight == {} # finished calls don't answer later requests
+    server.executor.shutdown()
+
+
+def test_a_caller_going_away_does_not_cancel_the_shared_call():
+    server = LookupServer(workers=2)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(server.single_flight("key", lambda: release.wait(5) and "done"))
+        second = asyncio.ensure_future(server.single_flight("key", lambda: "not run"))
+        await asyncio.sleep(0.05)
+        first.cancel() # that client hung up
+        release.set()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    server.executor.shutdown()
+
+
+def test_an_oversized_request_line_gets_a_400(server):
+    reply = exchange(server, b"GET /health?pad=" + b"x" * 70000 + b" HTTP/1.1\r\nHost: x\r\n\r\n")
+    status_line, _, rest = reply.partition(b"\r\n")
+    assert status_line == b"HTTP/1.1 400 Bad Request"
+    assert b"Connection: close" in rest
+    assert json.loads(rest.split(b"\r\n\r\n", 1)[1]) == {"error": "request line or header too long"}
+
+
+def test_malformed_and_valid_requests_on_one_connection(server):
+    assert exchange(server, b"NONSENSE\r\n\r\n").startswith(b"HTTP/1.1 400 Bad Request")
+    replies = exchange(server, b"GET /health HTTP/1.1\r\n\r\nGET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert replies.count(b"HTTP/1.1 200 OK") == 2
+
+
+def test_missing_parameters_are_a_400_not_a_500(server):
+    reply = exchange(server, b"GET /stop?lat=41.3 HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert reply.startswith(b"HTTP/1.1 400 Bad Request")
@@ -0,0 +1,148 @@
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import Stop, StopIndex
+
+METERS_PER_DEGREE_LAT = 111320
+HOME = (41.30, -72.92)
+
+
+def north_of(point, meters):
+    return point[0] + meters / METERS_PER_DEGREE_LAT, point[1]
+
+
+def stop_at(stop_id, point):
+    return Stop(stop_id, f"Stop {stop_id}", point[0], point[1], None)
+
+
+def test_closest_is_answered_inside_a_harvested_circle():
+    index = StopIndex()
+    index.harvest(*HOME, 1000, [stop_at("G:far", north_of(HOME, 600)), stop_at("G:near", north_of(HOME, 200))])
+    stop = index.closest(*HOME, 1000)
+    assert stop.global_stop_id == "G:near"
+    assert stop.distance == pytest.approx(200, abs=2)
+
+
+def test_closest_is_unknown_outside_every_circle():
+    index = StopIndex()
+    index.harvest(*HOME, 300, [stop_at("G:1", north_of(HOME, 100))])
+    elsewhere = north_of(HOME, 5000)
+    assert not index.covers(*elsewhere, 100)
+    assert index.closest(*elsewhere, 1000) is None
+    assert index.stops_within(*elsewhere, 100) is None
+
+
+def test_a_stop_past_the_covered_circle_can_not_be_proven_closest():
+    # the circle only vouches for 300 m, something nearer than 400 m could still be out there
+    index = StopIndex()
+    index.harvest(*HOME, 300, [])
+    index.add("G:edge", *north_of(HOME, 400), "Edge")
+    assert index.closest(*HOME, 1000) is None
+
+
+def test_an_area_fetched_empty_is_known_empty():
+    index = StopIndex()
+    index.harvest(*HOME, 1000, [])
+    index.add("G:outside", *north_of(HOME, 1100), "Just outside")
+    assert index.empty(*HOME, 1000)
+    assert index.closest(*HOME, 1000) is None
+    assert not index.empty(*HOME, 1200) # the circle doesn't reach that far
+    assert index.stops_within(*HOME, 1000) == []
+
+
+def test_find_closest_stop_trusts_a_known_empty_area(monkeypatch):
+    index = StopIndex()
+    index.harvest(*HOME, app.max_distance(), [])
+    index.add("G:outside", *north_of(HOME, app.max_distance() + 50), "Just outside")
+    monkeypatch.setattr(app, "_stop_index", index)
+    monkeypatch.setattr(app, "get_nearby_stop_list", lambda *args, **kwargs: pytest.fail("asked the API"))
+    assert app.find_closest_stop(*HOME) is None
+
+
+def test_smaller_circles_inside_bigger_ones_are_covered():
+    index = StopIndex()
+    index.harvest(*HOME, 1000, [])
+    assert index.covers(*north_of(HOME, 300), 700)
+    assert not index.covers(*north_of(HOME, 300), 701)
+
+
+def test_nearest_orders_stops_and_respects_the_radius():
+    index = StopIndex()
+    for meters in (900, 100, 500, 300):
+        index.add(f"G:{meters}", *north_of(HOME, meters), str(meters))
+    found = [index.ids[position] for _, position in index.nearest(*HOME, k=3, max_radius=1000)]
+    assert found == ["G:100", "G:300", "G:500"]
+    assert [index.ids[position] for _, position in index.within(*HOME, 400)] == ["G:100", "G:300"]
+
+
+def test_adding_an_indexed_id_moves_the_stop():
+    index = StopIndex()
+    index.add("G:1", *north_of(HOME, 100), "Old")
+    index.add("G:1", *north_of(HOME, 2000), "Moved")
+    assert len(index) == 1
+    assert index.within(*HOME, 500) == []
+    assert index.stop(index.positions["G:1"]).stop_name == "Moved"
+
+
+def test_saved_index_loads_back_mapped(tmp_path):
+    path = str(tmp_path / "stops.idx")
+    index = StopIndex(path)
+    index.harvest(*HOME, 1000, [stop_at("G:1", north_of(HOME, 250))])
+    index.flush()
+    loaded = StopIndex.load(path)
+    assert loaded._mapped is not None
+    assert loaded.closest(*HOME, 1000).global_stop_id == "G:1"
+    loaded.add("G:2", *north_of(HOME, 50), "New") # copies out of the mapped file first
+    assert loaded.closest(*HOME, 1000).global_stop_id == "G:2"
+
+
+def test_harvests_are_batched_into_one_save(tmp_path, monkeypatch):
+    index = StopIndex(str(tmp_path / "stops.idx"))
+    saves = []
+    monkeypatch.setattr(index, "save", lambda path=None: saves.append(path))
+    monkeypatch.setattr(StopIndex, "SAVE_DELAY", 60)
+    for meters in range(0, 1000, 100):
+        index.harvest(*north_of(HOME, meters), 150, [])
+    assert saves == []
+    index.flush()
+    assert saves == [None]
+    index.flush() # nothing pending any more
+    assert saves == [None]
+
+
+def test_coverage_is_only_trusted_for_its_ttl(clock):
+    index = StopIndex()
+    index.harvest(*HOME, 1000, [stop_at("G:1", north_of(HOME, 200))])
+    clock.advance(StopIndex.COVERAGE_TTL - 1)
+    assert index.closest(*HOME, 1000).global_stop_id == "G:1"
+    clock.advance(2)
+    assert not index.covers(*HOME, 1000)
+    assert index.closest(*HOME, 1000) is None # the stop is still indexed, but may have moved since
+
+
+def test_refetching_a_circle_drops_stops_it_no_longer_lists(clock):
+    index = StopIndex()
+    index.harvest(*HOME, 1000, [stop_at("G:old", north_of(HOME, 100)), stop_at("G:kept", north_of(HOME, 500))])
+    clock.advance(StopIndex.COVERAGE_TTL + 1)
+    index.harvest(*HOME, 1000, [stop_at("G:kept", north_of(HOME, 500))])
+    assert "G:old" not in index.positions
+    assert len(index) == 1
+    assert index.closest(*HOME, 1000).global_stop_id == "G:kept"
+
+
+def test_saving_keeps_fetch_times_and_leaves_out_stale_circles_and_dropped_stops(clock, tmp_path):
+    path = str(tmp_path / "stops.idx")
+    index = StopIndex(path)
+    index.harvest(*HOME, 1000, [stop_at("G:gone", north_of(HOME, 100)), stop_at("G:near", north_of(HOME, 200))])
+    elsewhere = north_of(HOME, 20000)
+    clock.advance(StopIndex.COVERAGE_TTL - 10)
+    index.harvest(*elsewhere, 1000, [stop_at("G:far", north_of(elsewhere, 300))])
+    index.remove("G:gone")
+    clock.advance(20) # the first circle is stale now, the second is not
+    index.flush()
+    loaded = StopIndex.load(path)
+    assert sorted(loaded.positions) == ["G:far", "G:near"]
+    assert loaded.closest(*elsewhere, 1000).global_stop_id == "G:far"
+    assert not loaded.covers(*HOME, 1000)
+    clock.advance(StopIndex.COVERAGE_TTL)
+    assert StopIndex.load(path).closest(*elsewhere, 1000) is None
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+import AllTogetherNow as app
+from AllTogetherNow import TileCache, tile_expiry
+
+PIL_Image = pytest.importorskip("PIL.Image")
+SERVER = "https://tiles.example/{z}/{x}/{y}.png"
+
+
+def png(color="red"):
+    buffer = io.BytesIO()
+    PIL_Image.new("RGB", (256, 256), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class Response:
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class TileServer:
+    """Stands in for the tile session, answering every request with the next scripted response."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+
+    def get(self, url, headers=None, timeout=10):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def tiles(monkeypatch, tmp_path):
+    cache = TileCache(str(tmp_path / "tiles.db"))
+    monkeypatch.setattr(app, "_tile_cache", cache)
+    return cache
+
+
+def serve(monkeypatch, *responses):
+    monkeypatch.setattr(app, "_tile_session", TileServer(*responses))
+
+
+def test_expiry_follows_the_cache_headers():
+    assert tile_expiry({"Cache-Control": "public, max-age=86400"}, now=1000) == 87400
+    assert tile_expiry({"Expires": "Thu, 01 Jan 1970 01:00:00 GMT"}, now=1000) == 3600
+    assert tile_expiry({"Cache-Control": "max-age=60", "Expires": "Thu, 01 Jan 1970 01:00:00 GMT"}, now=1000) == 1060
+    assert tile_expiry({"Cache-Control": "no-cache"}, now=1000) == 1000
+    assert tile_expiry({"Expires": "0"}, now=1000) == 1000 + app.TILE_DEFAULT_TTL
+    assert tile_expiry({}, now=1000) == 1000 + app.TILE_DEFAULT_TTL
+
+
+def test_a_tile_is_only_cached_once_it_decodes(monkeypatch, tiles):
+    serve(monkeypatch, Response(content=png()[:300]), Response(content=b"<html>rate limited</html>"))
+    for _ in range(2):
+        with pytest.raises(Exception):
+            app.fetch_tile(SERVER, 15, 1, 2)
+    assert tiles.get(SERVER, 15, 1, 2) is None
+    serve(monkeypatch, Response(404))
+    assert app.fetch_tile(SERVER, 15, 1, 2) is None
+    assert tiles.get(SERVER, 15, 1, 2) is None
+
+
+def test_stale_tiles_are_downloaded_again(monkeypatch, tiles, clock):
+    serve(monkeypatch, Response(content=png("red"), headers={"Cache-Control": "max-age=3600"}))
+    assert app.load_tile(SERVER, 15, 1, 2).getpixel((0, 0)) == (255, 0, 0)
+    assert tiles.has(SERVER, 15, 1, 2)
+    serve(monkeypatch) # nothing more is asked for while the tile is fresh
+    assert app.load_tile(SERVER, 15, 1, 2).getpixel((0, 0)) == (255, 0, 0)
+    clock.advance(3601)
+    assert not tiles.has(SERVER, 15, 1, 2)
+    serve(monkeypatch, Response(content=png("blue")))
+    assert app.load_tile(SERVER, 15, 1, 2).getpixel((0, 0)) == (0, 0, 255)
+    assert tiles.get(SERVER, 15, 1, 2)[1] # fresh again, for the default week
+
+
+def test_a_stale_tile_is_still_shown_when_the_download_fails(monkeypatch, tiles, clock):
+    tiles.put(SERVER, 15, 1, 2, png("red"), clock.now - 1)
+    serve(monkeypatch, app.requests.ConnectionError("offline"), Response(content=png()[:300]))
+    assert app.load_tile(SERVER, 15, 1, 2).getpixel((0, 0)) == (255, 0, 0)
+    assert app.load_tile(SERVER, 15, 1, 2).getpixel((0, 0)) == (255, 0, 0)
+    serve(monkeypatch, app.requests.ConnectionError("offline"))
+    with pytest.raises(app.requests.ConnectionError):
+        app.load_tile(SERVER, 15, 9, 9) # nothing cached to fall back on